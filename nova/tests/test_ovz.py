@@ -15,7 +15,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import mox
+import os
+import shutil
+import sys
+import tempfile
 import __builtin__
 from nova import exception
 from nova import flags
@@ -46,14 +51,13 @@ INSTANCE = {
 
 RES_PERCENT = .50
 
-VZLIST = "\t1001\n\t%d\n\t1003\n\t1004\n" % (INSTANCE['id'],)
+VZLIST = """      1001 running   instance-00001001
+      %d stopped   %s
+      1003 running   -
+""" % (INSTANCE['id'], INSTANCE['name'])
 
 VZNAME = """\tinstance-00001001\n"""
 
-VZNAMES = """\tinstance-00001001\n\t%s
-              \tinstance-00001003\n\tinstance-00001004\n""" % (
-    INSTANCE['name'],)
-
 GOODSTATUS = {
     'state': power_state.RUNNING,
     'max_mem': 0,
@@ -114,6 +118,55 @@ DirectMap4k:        8128 kB
 DirectMap2M:      516096 kB
 """
 
+CPUINFO = """processor	: 0
+model name	: Intel(R) Xeon(R) CPU           E5504  @ 2.00GHz
+
+processor	: 1
+model name	: Intel(R) Xeon(R) CPU           E5504  @ 2.00GHz
+"""
+
+BEANCOUNTERS = """Version: 2.5
+       uid  resource           held    maxheld    barrier      limit failcnt
+      1002: kmemsize        2752512    2818048   11055923   11377049       0
+            vmguarpages           0          0      65536 9223372036854775807 0
+         0: kmemsize       12345678   12345678   12345678   12345678       0
+            vmguarpages           0          0          0 9223372036854775807 0
+"""
+
+CONTAINERCONF = """# A container config
+CPUUNITS="25000"
+CPUS="2"
+"""
+
+# Stands in for vzctl, logging each run beside itself and saving the
+# settings of vzctl set to the container config there, as vzctl would.
+FAKEVZCTL = """#!%s
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(here, 'vzctl.log'), 'a') as log:
+    log.write(' '.join(sys.argv[1:]) + '\\n')
+if sys.argv[1] == 'set':
+    path = os.path.join(here, '%%s.conf' %% sys.argv[2])
+    settings = {}
+    if os.path.exists(path):
+        with open(path) as conf:
+            settings = dict(line.strip().split('=', 1) for line in conf)
+    args = [arg for arg in sys.argv[3:] if arg != '--save']
+    for option, value in zip(args[::2], args[1::2]):
+        option = option[2:]
+        if option in ('vmguarpages', 'privvmpages') and ':' not in value:
+            value = '%%s:%%s' %% (value, value)
+        elif option == 'diskspace':
+            value = ':'.join(str(int(limit[:-1]) * 1024 ** 2)
+                             for limit in value.split(':'))
+        settings[option.upper()] = '"%%s"' %% value
+    with open(path, 'w') as conf:
+        for key, value in sorted(settings.items()):
+            conf.write('%%s=%%s\\n' %% (key, value))
+""" % sys.executable
+
 UTILITY = {
     'CTIDS': {
         1: {
@@ -299,24 +352,35 @@ class OpenVzConnTestCase(test.TestCase):
         self.fake_file.read().AndReturn(FILECONTENTS)
 
     def test_list_instances_detail_success(self):
-        # Testing happy path of OpenVzConnection.list_instances()
+        # Testing happy path of OpenVzConnection.list_instances_detail()
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzlist', '--all', '-o', 'name', '-H',
-                                  run_as_root=True).AndReturn((VZNAMES, None))
+        openvz_conn.utils.execute('vzlist', '--all', '-H', '-o',
+                                  'ctid,status,name', run_as_root=True)\
+                                  .AndReturn((VZLIST, None))
+        self.mox.StubOutWithMock(openvz_conn.db, 'instance_get_all_by_host')
+        openvz_conn.db.instance_get_all_by_host(mox.IgnoreArg(),
+                                                mox.IgnoreArg())\
+            .AndReturn([{'id': 1001, 'name': 'instance-00001001',
+                         'power_state': power_state.RUNNING}])
+        # Containers of instances on another host are looked up by id.
+        self.mox.StubOutWithMock(openvz_conn.db, 'instance_get')
+        openvz_conn.db.instance_get(mox.IgnoreArg(), str(INSTANCE['id']))\
+            .AndReturn({'id': INSTANCE['id'], 'name': INSTANCE['name'],
+                        'power_state': power_state.RUNNING})
         conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, 'get_info')
-        conn.get_info(mox.IgnoreArg()).MultipleTimes().AndReturn(GOODSTATUS)
 
         # Start test
         self.mox.ReplayAll()
 
         vzs = conn.list_instances_detail()
-        self.assertEqual(vzs.__class__, list)
+        states = dict((vz.name, vz.state) for vz in vzs)
+        self.assertEqual(states, {'instance-00001001': power_state.RUNNING,
+                                  INSTANCE['name']: power_state.SHUTDOWN})
 
     def test_list_instances_detail_failure(self):
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzlist', '--all', '-o', 'name', '-H',
-                                   run_as_root=True) \
+        openvz_conn.utils.execute('vzlist', '--all', '-H', '-o',
+                                  'ctid,status,name', run_as_root=True)\
                                   .AndRaise(exception.ProcessExecutionError)
         conn = openvz_conn.OpenVzConnection(False)
 
@@ -324,6 +388,21 @@ class OpenVzConnTestCase(test.TestCase):
 
         self.assertRaises(exception.Error, conn.list_instances_detail)
 
+    def test_get_info_success(self):
+        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
+        openvz_conn.utils.execute('vzlist', '-H', '--all', '-o',
+                                  'ctid,status,name', '--name',
+                                  INSTANCE['name'], run_as_root=True)\
+            .AndReturn(("      %d running   %s\n" %
+                        (INSTANCE['id'], INSTANCE['name']), None))
+        self.mox.StubOutWithMock(openvz_conn.db, 'instance_get')
+        openvz_conn.db.instance_get(mox.IgnoreArg(), str(INSTANCE['id']))\
+            .AndReturn({'id': INSTANCE['id'],
+                        'power_state': power_state.SHUTDOWN})
+        self.mox.ReplayAll()
+        conn = openvz_conn.OpenVzConnection(False)
+        self.assertEqual(conn.get_info(INSTANCE['name']), GOODSTATUS)
+
     def test_start_success(self):
         # Testing happy path :-D
         # Mock the objects needed for this test to succeed.
@@ -375,8 +454,8 @@ class OpenVzConnTestCase(test.TestCase):
     def test_list_instances_success(self):
         # Testing happy path of OpenVzConnection.list_instances()
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzlist', '--all', '--no-header', '--output',
-                                  'ctid', run_as_root=True)\
+        openvz_conn.utils.execute('vzlist', '--all', '-H', '-o',
+                                  'ctid,status,name', run_as_root=True)\
                                   .AndReturn((VZLIST, None))
 
         # Start test
@@ -385,12 +464,13 @@ class OpenVzConnTestCase(test.TestCase):
         conn = openvz_conn.OpenVzConnection(False)
         vzs = conn.list_instances()
         self.assertEqual(vzs.__class__, list)
+        self.assertEqual(sorted(vzs), ['instance-00001001', INSTANCE['name']])
 
     def test_list_instances_fail(self):
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzlist', '--all', '--no-header', '--output',
-                                  'ctid', run_as_root=True)\
-                                  .AndRaise(exception.Error)
+        openvz_conn.utils.execute('vzlist', '--all', '-H', '-o',
+                                  'ctid,status,name', run_as_root=True)\
+                                  .AndRaise(exception.ProcessExecutionError)
 
         # Start test
         self.mox.ReplayAll()
@@ -529,34 +609,33 @@ class OpenVzConnTestCase(test.TestCase):
         self.assertRaises(exception.InstanceUnacceptable,
                           conn.reset_instance_size, INSTANCE)
 
+    def _expect_set_instance_size(self, conn):
+        self.mox.StubOutWithMock(openvz_conn.OVZHostStats,
+                                 'container_config')
+        openvz_conn.OVZHostStats.container_config(INSTANCE['id'])\
+            .AndReturn({'CPUS': '4'})
+        self.mox.StubOutWithMock(conn, '_percent_of_resource')
+        conn._percent_of_resource(FAKE_INST_TYPE['memory_mb'])\
+            .AndReturn(RES_PERCENT)
+        conn.utility = UTILITY
+        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
+        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
+                                  '--vmguarpages', MEM_PAGES * 2,
+                                  '--privvmpages', MEM_PAGES * 2,
+                                  '--kmemsize', '21474836:214748364',
+                                  '--cpuunits', UTILITY['UNITS'] * RES_PERCENT,
+                                  '--cpulimit',
+                                  UTILITY['CPULIMIT'] * RES_PERCENT,
+                                  '--ioprio', 3, '--diskspace', '40G:44G',
+                                  run_as_root=True).AndReturn(('', ''))
+
     def test_set_instance_size_no_instance_type(self):
         self.mox.StubOutWithMock(openvz_conn.instance_types,
                                  'get_instance_type')
         openvz_conn.instance_types.get_instance_type(
             INSTANCE['instance_type_id']).AndReturn(FAKE_INST_TYPE)
         conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, '_calc_pages')
-        conn._calc_pages(FAKE_INST_TYPE['memory_mb']).AndReturn(MEM_PAGES)
-        self.mox.StubOutWithMock(conn, '_percent_of_resource')
-        conn._percent_of_resource(FAKE_INST_TYPE['memory_mb'])\
-            .AndReturn(RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_vmguarpages')
-        conn._set_vmguarpages(INSTANCE, MEM_PAGES)
-        self.mox.StubOutWithMock(conn, '_set_privvmpages')
-        conn._set_privvmpages(INSTANCE, MEM_PAGES)
-        self.mox.StubOutWithMock(conn, '_set_kmemsize')
-        conn._set_kmemsize(INSTANCE,
-            ((FAKE_INST_TYPE['memory_mb'] * 1024) * 1024))
-        self.mox.StubOutWithMock(conn, '_set_cpuunits')
-        conn._set_cpuunits(INSTANCE, RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_cpulimit')
-        conn._set_cpulimit(INSTANCE, RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_cpus')
-        conn._set_cpus(INSTANCE, FAKE_INST_TYPE['vcpus'])
-        self.mox.StubOutWithMock(conn, '_set_ioprio')
-        conn._set_ioprio(INSTANCE, RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_diskspace')
-        conn._set_diskspace(INSTANCE, FAKE_INST_TYPE)
+        self._expect_set_instance_size(conn)
         self.mox.ReplayAll()
         conn._set_instance_size(INSTANCE)
 
@@ -566,160 +645,71 @@ class OpenVzConnTestCase(test.TestCase):
         openvz_conn.instance_types.get_instance_type(
             INSTANCE['instance_type_id']).AndReturn(FAKE_INST_TYPE)
         conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, '_calc_pages')
-        conn._calc_pages(FAKE_INST_TYPE['memory_mb']).AndReturn(MEM_PAGES)
-        self.mox.StubOutWithMock(conn, '_percent_of_resource')
-        conn._percent_of_resource(FAKE_INST_TYPE['memory_mb'])\
-        .AndReturn(RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_vmguarpages')
-        conn._set_vmguarpages(INSTANCE, MEM_PAGES)
-        self.mox.StubOutWithMock(conn, '_set_privvmpages')
-        conn._set_privvmpages(INSTANCE, MEM_PAGES)
-        self.mox.StubOutWithMock(conn, '_set_kmemsize')
-        conn._set_kmemsize(INSTANCE,
-            ((FAKE_INST_TYPE['memory_mb'] * 1024) * 1024))
-        self.mox.StubOutWithMock(conn, '_set_cpuunits')
-        conn._set_cpuunits(INSTANCE, RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_cpulimit')
-        conn._set_cpulimit(INSTANCE, RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_cpus')
-        conn._set_cpus(INSTANCE, FAKE_INST_TYPE['vcpus'])
-        self.mox.StubOutWithMock(conn, '_set_ioprio')
-        conn._set_ioprio(INSTANCE, RES_PERCENT)
-        self.mox.StubOutWithMock(conn, '_set_diskspace')
-        conn._set_diskspace(INSTANCE, FAKE_INST_TYPE)
+        self._expect_set_instance_size(conn)
         self.mox.ReplayAll()
         conn._set_instance_size(INSTANCE, FAKE_INST_TYPE['id'])
 
-    def test_set_vmguarpages_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--vmguarpages', MEM_PAGES,
-                                  run_as_root=True).AndReturn(('', ''))
-        self.mox.ReplayAll()
+    def test_set_instance_size_with_fake_vzctl(self):
+        vz_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, vz_dir)
+        vzctl = os.path.join(vz_dir, 'vzctl')
+        with open(vzctl, 'w') as fh:
+            fh.write(FAKEVZCTL)
+        os.chmod(vzctl, 0755)
+        path = os.environ['PATH']
+        self.addCleanup(os.environ.__setitem__, 'PATH', path)
+        os.environ['PATH'] = vz_dir + os.pathsep + path
+        self.flags(root_helper='', ovz_config_dir=vz_dir)
+
+        instance_type = dict(FAKE_INST_TYPE)
+        self.stubs.Set(openvz_conn.instance_types, 'get_instance_type',
+                       lambda instance_type_id: instance_type)
         conn = openvz_conn.OpenVzConnection(False)
-        conn._set_vmguarpages(INSTANCE, MEM_PAGES)
+        conn.utility = dict(UTILITY, MEMORY_MB=4096)
 
-    def test_set_vmguarpages_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--vmguarpages', MEM_PAGES,
-                                  run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        self.assertRaises(exception.Error, conn._set_vmguarpages,
-                          INSTANCE, MEM_PAGES)
-
-    def test_set_privvmpages_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--privvmpages', MEM_PAGES,
-                                  run_as_root=True).AndReturn(('', ''))
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        conn._set_privvmpages(INSTANCE, MEM_PAGES)
-
-    def test_set_privvmpages_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--privvmpages', MEM_PAGES,
-                                  run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        self.assertRaises(exception.Error, conn._set_privvmpages,
-                          INSTANCE, MEM_PAGES)
+        def runs():
+            with open(os.path.join(vz_dir, 'vzctl.log')) as log:
+                return [line.split() for line in log]
 
-    def test_set_kmemsize_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--kmemsize', mox.IgnoreArg(),
-                                  run_as_root=True).AndReturn(('',''))
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        conn._set_kmemsize(INSTANCE, MEMORY)
-
-    def test_set_kmemsize_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--kmemsize', mox.IgnoreArg(),
-                                  run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        self.assertRaises(exception.Error, conn._set_kmemsize,
-                          INSTANCE, MEMORY)
-
-    def test_set_cpuunits_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--cpuunits', UTILITY['UNITS'] * RES_PERCENT,
-                                  run_as_root=True).AndReturn(('', ''))
-        conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, 'utility')
-        conn.utility = UTILITY
-        self.mox.ReplayAll()
-        conn._set_cpuunits(INSTANCE, RES_PERCENT)
-
-    def test_set_cpuunits_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--cpuunits',
-                                  UTILITY['UNITS'] * RES_PERCENT,
-                                  run_as_root=True) \
-                                 .AndRaise(exception.ProcessExecutionError)
-        conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, 'utility')
-        conn.utility = UTILITY
-        self.mox.ReplayAll()
-        self.assertRaises(exception.Error, conn._set_cpuunits,
-                          INSTANCE, RES_PERCENT)
+        conn._set_instance_size(INSTANCE)
+        self.assertEqual(len(runs()), 1)
+        self.assertEqual(runs()[0][:4], ['set', str(INSTANCE['id']),
+                                         '--save', '--vmguarpages'])
+        self.assertTrue('--diskspace' in runs()[0])
 
-    def test_set_cpulimit_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--cpulimit',
-                                  UTILITY['CPULIMIT'] * RES_PERCENT,
-                                  run_as_root=True).AndReturn(('', ''))
-        conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, 'utility')
-        conn.utility = UTILITY
-        self.mox.ReplayAll()
-        conn._set_cpulimit(INSTANCE, RES_PERCENT)
+        # Nothing has changed, so vzctl is not run again.
+        conn._set_instance_size(INSTANCE)
+        self.assertEqual(len(runs()), 1)
 
-    def test_set_cpulimit_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--cpulimit',
-                                  UTILITY['CPULIMIT'] * RES_PERCENT,
-                                  run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
+        # Only the settings which follow from memory are applied.
+        instance_type['memory_mb'] = 2048
+        conn._set_instance_size(INSTANCE)
+        self.assertEqual(len(runs()), 2)
+        options = [arg for arg in runs()[1] if arg.startswith('--')]
+        self.assertEqual(options, ['--save', '--vmguarpages', '--privvmpages',
+                                   '--kmemsize', '--cpuunits', '--cpulimit',
+                                   '--ioprio'])
+
+    def test_config_value(self):
+        self.assertEqual(openvz_conn._config_value('privvmpages', 256),
+                         '256:256')
+        self.assertEqual(openvz_conn._config_value('diskspace', '40G:44G'),
+                         '41943040:46137344')
+        self.assertEqual(openvz_conn._config_value('cpus', 4), '4')
+
+    def test_size_values(self):
         conn = openvz_conn.OpenVzConnection(False)
-        self.mox.StubOutWithMock(conn, 'utility')
         conn.utility = UTILITY
-        self.mox.ReplayAll()
-        self.assertRaises(exception.Error, conn._set_cpulimit, INSTANCE,
-                          RES_PERCENT)
-
-    def test_set_cpus_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--cpus', mox.IgnoreArg(), run_as_root=True)\
-                                  .AndReturn(('', ''))
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        conn._set_cpus(INSTANCE, VCPUS)
-
-    def test_set_cpus_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--cpus', mox.IgnoreArg(), run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        self.assertRaises(exception.Error, conn._set_cpus,
-                          INSTANCE, VCPUS)
+        self.assertEqual(conn._cpuunits_value(RES_PERCENT),
+                         UTILITY['UNITS'] * RES_PERCENT)
+        self.assertEqual(conn._cpulimit_value(RES_PERCENT),
+                         UTILITY['CPULIMIT'] * RES_PERCENT)
+        self.assertEqual(conn._cpus_value(VCPUS), VCPUS * 2)
+        self.assertEqual(conn._ioprio_value(RES_PERCENT), 3)
+        self.assertEqual(conn._diskspace_value(FAKE_INST_TYPE), '40G:44G')
+        # No container is given more than the whole host.
+        self.assertEqual(conn._cpuunits_value(2), UTILITY['UNITS'])
+        self.assertEqual(conn._cpus_value(100), UTILITY['CPULIMIT'] / 100)
 
     def test_calc_pages_success(self):
         # this test is a little sketchy because it is testing the default
@@ -771,80 +761,83 @@ class OpenVzConnTestCase(test.TestCase):
         self.mox.ReplayAll()
         self.assertEqual(float, type(conn._percent_of_resource(MEMORYMB)))
 
+    def _write_host_files(self):
+        stats_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stats_dir)
+        for name, contents in (('meminfo', MEMINFO), ('cpuinfo', CPUINFO),
+                               ('user_beancounters', BEANCOUNTERS),
+                               ('1002.conf', CONTAINERCONF)):
+            with open(os.path.join(stats_dir, name), 'w') as fh:
+                fh.write(contents)
+        self.flags(ovz_proc_dir=stats_dir, ovz_config_dir=stats_dir,
+                   ovz_ve_private_dir=stats_dir)
+
     def test_get_memory_success(self):
+        self._write_host_files()
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('cat', '/proc/meminfo', run_as_root=True)\
-                                  .AndReturn((MEMINFO, ''))
         self.mox.ReplayAll()
         conn = openvz_conn.OpenVzConnection(False)
         conn._get_memory()
         self.assertEquals(int, type(conn.utility['MEMORY_MB']))
-        self.assertTrue(conn.utility['MEMORY_MB'] > 0)
+        self.assertEquals(conn.utility['MEMORY_MB'], 494)
 
     def test_get_memory_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('cat', '/proc/meminfo', run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        self.mox.ReplayAll()
+        self.flags(ovz_proc_dir='/nonexistent')
         conn = openvz_conn.OpenVzConnection(False)
         self.assertRaises(exception.Error, conn._get_memory)
 
-    def test_set_ioprio_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--ioprio', 3, run_as_root=True)\
-                                  .AndReturn(('', None))
-        conn = openvz_conn.OpenVzConnection(False)
-        self.mox.ReplayAll()
-        conn._set_ioprio(INSTANCE, RES_PERCENT)
-
-    def test_set_ioprio_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--ioprio', 3, run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        conn = openvz_conn.OpenVzConnection(False)
-        self.mox.ReplayAll()
-        self.assertRaises(exception.Error, conn._set_ioprio, INSTANCE,
-                          RES_PERCENT)
-
-    def test_set_diskspace_success(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--diskspace', mox.IgnoreArg(),
-                                  run_as_root=True).AndReturn(('', None))
-        self.mox.ReplayAll()
+    def test_get_cpulimit_success(self):
+        self._write_host_files()
         conn = openvz_conn.OpenVzConnection(False)
-        conn._set_diskspace(INSTANCE, FAKE_INST_TYPE)
+        conn._get_cpulimit()
+        self.assertEquals(conn.utility['CPULIMIT'], 200)
 
-    def test_set_diskspace_soft_manual_success(self):
+    def test_get_host_stats(self):
+        self._write_host_files()
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--diskspace', '40G:44G', run_as_root=True)\
-                                  .AndReturn(('', None))
         self.mox.ReplayAll()
         conn = openvz_conn.OpenVzConnection(False)
-        conn._set_diskspace(INSTANCE, FAKE_INST_TYPE)
-
-    def test_set_diskspace_soft_and_hard_manual_success(self):
+        conn.utility['UNITS'] = 100000
+        stats = conn.get_host_stats()
+        self.assertEqual(stats['containers'], 1)
+        self.assertEqual(stats['vcpus'], 2)
+        self.assertEqual(stats['vcpus_used'], 2)
+        self.assertEqual(stats['host_memory_total'], 506128 * 1024)
+        self.assertEqual(stats['host_memory_committed'], MEMORY / 2)
+        self.assertEqual(stats['host_memory_free'],
+                         506128 * 1024 - MEMORY / 2)
+        self.assertEqual(stats['host_memory_unused'],
+                         (291992 + 44512 + 64708) * 1024)
+        self.assertEqual(stats['cpuunits_used'], 25000)
+        self.assertEqual(stats['cpuunits_free'], 75000)
+        self.assertTrue(stats['disk_available'] <= stats['disk_total'])
+        self.assertTrue(conn.get_host_stats() is stats)
+
+    def test_unreadable_beancounters_are_read_as_root(self):
+        self._write_host_files()
+        os.remove(os.path.join(FLAGS.ovz_proc_dir, 'user_beancounters'))
         self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'],
-                                  '--save', '--diskspace', '40G:44G',
-                                  run_as_root=True).AndReturn(('', None))
+        openvz_conn.utils.execute('cat', mox.IgnoreArg(), run_as_root=True)\
+                                  .AndReturn((BEANCOUNTERS, ''))
+        self.mox.ReplayAll()
+        stats = openvz_conn.OVZHostStats()
+        self.assertEqual(stats.beancounters().keys(), ['1002'])
+
+    def test_update_available_resource(self):
+        self._write_host_files()
+        self.mox.StubOutWithMock(openvz_conn.db,
+                                 'service_get_all_compute_by_host')
+        openvz_conn.db.service_get_all_compute_by_host(mox.IgnoreArg(),
+                                                       'host')\
+            .AndReturn([{'id': 1, 'compute_node': [{'id': 3}]}])
+        self.mox.StubOutWithMock(openvz_conn.db, 'compute_node_update')
+        openvz_conn.db.compute_node_update(mox.IgnoreArg(), 3,
+            mox.And(mox.ContainsKeyValue('memory_mb', 494),
+                    mox.ContainsKeyValue('memory_mb_used', 256),
+                    mox.ContainsKeyValue('vcpus', 2)))
         self.mox.ReplayAll()
         conn = openvz_conn.OpenVzConnection(False)
-        conn._set_diskspace(INSTANCE, FAKE_INST_TYPE)
-
-    def test_set_diskspace_failure(self):
-        self.mox.StubOutWithMock(openvz_conn.utils, 'execute')
-        openvz_conn.utils.execute('vzctl', 'set', INSTANCE['id'], '--save',
-                                  '--diskspace', mox.IgnoreArg(),
-                                  run_as_root=True)\
-                                  .AndRaise(exception.ProcessExecutionError)
-        self.mox.ReplayAll()
-        conn = openvz_conn.OpenVzConnection(False)
-        self.assertRaises(exception.Error, conn._set_diskspace, INSTANCE,
-                          FAKE_INST_TYPE)
+        conn.update_available_resource(None, 'host')
 
     def test_attach_volumes_success(self):
         conn = openvz_conn.OpenVzConnection(False)
@@ -1108,3 +1101,178 @@ class OpenVzConnTestCase(test.TestCase):
         ifaces = openvz_conn.OVZNetworkInterfaces(INTERFACEINFO)
         self.assertRaises(exception.Error, ifaces._set_nameserver,
                           INTERFACEINFO[0]['id'], INTERFACEINFO[0]['dns'])
+
+    def test_boot_steps_run_once_their_requirements_are_done(self):
+        events = []
+
+        def step(name, delay=0):
+            events.append('start %s' % name)
+            openvz_conn.greenthread.sleep(delay)
+            events.append('end %s' % name)
+
+        steps = openvz_conn.OVZBootSteps()
+        steps.add('slow', step, 'slow', 0.01)
+        steps.add('fast', step, 'fast')
+        steps.add('last', step, 'last', requires=['slow', 'fast'])
+        steps.run()
+        self.assertTrue(events.index('start fast') < events.index('end slow'))
+        self.assertEqual(events[-2:], ['start last', 'end last'])
+        self.assertEqual(sorted(steps.timings), ['fast', 'last', 'slow'])
+
+    def test_boot_steps_after_a_failure_do_not_run(self):
+        ran = []
+
+        def fail():
+            raise exception.Error('failed')
+
+        steps = openvz_conn.OVZBootSteps()
+        steps.add('fail', fail)
+        steps.add('other', ran.append, 'other')
+        steps.add('after', ran.append, 'after', requires=['fail'])
+        self.assertRaises(exception.Error, steps.run)
+        self.assertEqual(ran, ['other'])
+        self.assertFalse('after' in steps.timings)
+
+    def test_boot_steps_require_known_steps(self):
+        steps = openvz_conn.OVZBootSteps()
+        self.assertRaises(exception.Error, steps.add, 'step', len,
+                          requires=['unknown'])
+
+    def test_spawn_notifies_step_timings(self):
+        conn = openvz_conn.OpenVzConnection(False)
+        ran = []
+        for method in ('_get_cpuunits_usage', '_cache_image',
+                       '_initial_secure_host', '_create_vz',
+                       '_set_vz_os_hint', '_configure_vz', '_set_name',
+                       'plug_vifs', '_set_hostname', '_set_instance_size',
+                       '_set_onboot', '_attach_volumes', '_start',
+                       '_gratuitous_arp_all_addresses'):
+            self.stubs.Set(conn, method,
+                           lambda *args, **kwargs: ran.append(args))
+        self.stubs.Set(openvz_conn.db, 'instance_update',
+                       lambda *args, **kwargs: None)
+        self.stubs.Set(conn, 'get_info',
+                       lambda name: {'state': power_state.RUNNING})
+        notifications = []
+        self.stubs.Set(openvz_conn.notifier, 'notify',
+                       lambda publisher, event_type, priority, payload:
+                           notifications.append((event_type, payload)))
+
+        conn.spawn(None, INSTANCE, NETWORKINFO).wait()
+        self.assertEqual(len(ran), 14)
+        self.assertEqual(len(notifications), 1)
+        event_type, payload = notifications[0]
+        self.assertEqual(event_type, 'compute.instance.spawn.timings')
+        self.assertEqual(payload['state'], 'running')
+        self.assertEqual(len(payload['timings']), 15)
+        self.assertTrue('boot' in payload['timings'])
+
+    def test_spawn_attaches_volumes_once_the_container_is_named(self):
+        conn = openvz_conn.OpenVzConnection(False)
+        named = []
+
+        def set_name(instance):
+            openvz_conn.greenthread.sleep(0.01)
+            named.append(instance['name'])
+
+        def vzlist(*args, **kwargs):
+            # vzlist --name finds nothing until the container is named.
+            if args[0] != 'vzlist' or not named:
+                raise exception.ProcessExecutionError(args[0])
+            return ('%6d stopped   %s\n' % (INSTANCE['id'],
+                                            INSTANCE['name']), '')
+
+        for method in ('_get_cpuunits_usage', '_cache_image',
+                       '_initial_secure_host', '_create_vz',
+                       '_set_vz_os_hint', '_configure_vz', 'plug_vifs',
+                       '_set_hostname', '_set_instance_size', '_set_onboot',
+                       '_start', '_gratuitous_arp_all_addresses'):
+            self.stubs.Set(conn, method, lambda *args, **kwargs: None)
+        self.stubs.Set(conn, '_set_name', set_name)
+        self.stubs.Set(openvz_conn.utils, 'execute', vzlist)
+        self.stubs.Set(openvz_conn.db, 'instance_get',
+                       lambda ctxt, id: INSTANCE)
+        attached = []
+        self.stubs.Set(openvz_conn, 'OVZVolumes',
+                       lambda *args: mox.MockAnything())
+        self.stubs.Set(conn, 'attach_volume',
+                       self._record(attached, conn.attach_volume))
+
+        conn._spawn_steps(None, INSTANCE, NETWORKINFO).run()
+        self.assertEqual(attached, [(INSTANCE['name'], None,
+                                     '/var/lib/mysql')])
+
+    def _record(self, calls, method):
+        def record(*args):
+            result = method(*args)
+            calls.append(args)
+            return result
+        return record
+
+    def _template_cache(self, quota_mb=0):
+        template_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, template_dir)
+        self.downloads = []
+
+        def fetch(context, image_ref, path, user, project):
+            self.downloads.append(image_ref)
+            with open(path, 'wb') as fh:
+                fh.write('template %s' % image_ref)
+            # Let any other spawn fetching the image try to meanwhile.
+            openvz_conn.greenthread.sleep(0.01)
+            return {'checksum': self.checksums.get(image_ref)}
+
+        self.checksums = {}
+        self.stubs.Set(openvz_conn.images, 'fetch', fetch)
+        return openvz_conn.OVZTemplateCache(template_dir, quota_mb)
+
+    def test_template_cache_downloads_an_image_once(self):
+        cache = self._template_cache()
+        self.checksums['1'] = hashlib.md5('template 1').hexdigest()
+        threads = [openvz_conn.greenthread.spawn(cache.fetch, None, '1')
+                   for i in range(3)]
+        self.assertEqual(sorted(thread.wait() for thread in threads),
+                         [False, False, True])
+        self.assertEqual(self.downloads, ['1'])
+        self.assertEqual(os.listdir(cache.template_dir).count('1.tar.gz'), 1)
+        entry = cache.read_manifest()['1']
+        self.assertEqual(entry['checksum'], self.checksums['1'])
+        self.assertEqual(entry['size'], len('template 1'))
+
+    def test_template_cache_rejects_a_bad_checksum(self):
+        cache = self._template_cache()
+        self.checksums['1'] = 'bad'
+        self.assertRaises(exception.Error, cache.fetch, None, '1')
+        self.assertEqual(os.listdir(cache.template_dir), [])
+
+    def test_template_cache_evicts_least_recently_used(self):
+        # Each template is 10 bytes, so a quota of 25 bytes fits two.
+        cache = self._template_cache(quota_mb=25 / (1024.0 * 1024))
+        cache.fetch(None, '1')
+        cache.fetch(None, '2')
+        cache.acquire(None, '3')
+        self.assertEqual(sorted(cache.read_manifest()), ['2', '3'])
+        cache.fetch(None, '2')
+        cache.fetch(None, '4')
+        # The template in use is kept until it is released.
+        self.assertEqual(sorted(cache.read_manifest()), ['3', '4'])
+        self.assertFalse(os.path.exists(cache.path('2')))
+        cache.release('3')
+        cache.fetch(None, '5')
+        self.assertEqual(sorted(cache.read_manifest()), ['4', '5'])
+
+    def test_prewarm_images(self):
+        conn = openvz_conn.OpenVzConnection(False)
+        conn.template_cache = self._template_cache()
+        conn.template_cache.fetch(None, '1')
+        self.checksums['3'] = 'bad'
+        notifications = []
+        self.stubs.Set(openvz_conn.notifier, 'notify',
+                       lambda publisher, event_type, priority, payload:
+                           notifications.append((event_type, payload)))
+        result = conn.prewarm_images(None, ['1', '2', '3'])
+        self.assertEqual(result['fetched'], ['2'])
+        self.assertEqual(result['cached'], ['1'])
+        self.assertEqual(result['failed'], ['3'])
+        self.assertEqual(notifications,
+                         [('compute.host.images.prewarmed', result)])
@@ -22,7 +22,11 @@ is sketchy at best.
 
 import os
 import fnmatch
+import hashlib
+import json
 import socket
+import time
+from eventlet import greenthread
 from nova import db
 from nova import exception
 from nova import flags
@@ -31,6 +35,7 @@ from nova import utils
 from nova import context
 from nova.auth import manager
 from nova.network import linux_net
+from nova.notifier import api as notifier
 from nova.compute import power_state
 from nova.compute import instance_types
 from nova.exception import ProcessExecutionError
@@ -111,14 +116,44 @@ flags.DEFINE_integer('ovz_kmemsize_barrier_differential',
 flags.DEFINE_bool('ovz_use_bind_mount',
                   False,
                   'Use bind mounting instead of simfs')
+flags.DEFINE_string('ovz_proc_dir',
+                    '/proc',
+                    'Where the host stats are read from')
+flags.DEFINE_integer('ovz_template_cache_quota_mb',
+                     0,
+                     'Most megabytes of image templates to keep in the '
+                     'template dir, deleting the least recently used first. '
+                     '0 keeps every template')
 
 LOG = logging.getLogger('nova.virt.openvz')
 
+# Multipliers of the size suffixes vzctl takes, to the 1k blocks it saves.
+DISK_BLOCKS = {'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3}
+
 
 def get_connection(read_only):
     return OpenVzConnection(read_only)
 
 
+def _config_value(option, value):
+    """
+    Return a setting as vzctl saves it in a container's config, so a
+    setting can be compared with the config before it is applied.
+    """
+    value = str(value)
+    if option in ('vmguarpages', 'privvmpages') and ':' not in value:
+        # A single number is both the barrier and the limit.
+        value = '%s:%s' % (value, value)
+    elif option == 'diskspace':
+        limits = []
+        for limit in value.split(':'):
+            if limit[-1:].upper() in DISK_BLOCKS:
+                limit = int(limit[:-1]) * DISK_BLOCKS[limit[-1].upper()]
+            limits.append(str(limit))
+        value = ':'.join(limits)
+    return value
+
+
 class OpenVzConnection(driver.ComputeDriver):
     def __init__(self, read_only):
         """
@@ -133,6 +168,8 @@ class OpenVzConnection(driver.ComputeDriver):
             }
         self.read_only = read_only
         self.vif_driver = utils.import_object(FLAGS.ovz_vif_driver)
+        self.host_stats = {}
+        self.template_cache = OVZTemplateCache()
         LOG.debug(_('__init__ complete in OpenVzConnection'))
 
     @classmethod
@@ -150,15 +187,18 @@ class OpenVzConnection(driver.ComputeDriver):
         including catching up with currently running VE's on the given host.
         """
         ctxt = context.get_admin_context()
+        instances = db.instance_get_all_by_host(ctxt, host)
 
         LOG.debug(_('Hostname: %s') % host)
-        LOG.debug(_('Instances: %s') % db.instance_get_all_by_host(ctxt, host))
-
-        for instance in db.instance_get_all_by_host(ctxt, host):
-            try:
-                LOG.debug(_('Checking state of %s') % instance['name'])
-                state = self.get_info(instance['name'])['state']
-            except exception.NotFound:
+        LOG.debug(_('Instances: %s') % instances)
+
+        vzs = self._list_vzs()
+        for instance in instances:
+            LOG.debug(_('Checking state of %s') % instance['name'])
+            if instance['name'] in vzs:
+                state = self._get_info(vzs[instance['name']],
+                                       instance)['state']
+            else:
                 state = power_state.SHUTOFF
 
             LOG.debug(_('Current state of %(name)s was %(power_state)s') %
@@ -180,21 +220,7 @@ class OpenVzConnection(driver.ComputeDriver):
         Return the names of all the instances known to the container
         layer, as a list.
         """
-        try:
-            out, err = utils.execute('vzlist', '--all', '--no-header',
-                                     '--output', 'ctid', run_as_root=True)
-            if err:
-                LOG.error(_('Stderr output from vzlist: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzlist: %s') % err)
-            raise exception.Error(_('Failed to list VZs'))
-
-        ctids = []
-        for line in out.splitlines():
-            ctid = line.split()[0]
-            ctids.append(ctid)
-
-        return ctids
+        return self._list_vzs().keys()
 
     def list_instances_detail(self):
         """
@@ -202,39 +228,73 @@ class OpenVzConnection(driver.ComputeDriver):
         This fascilitates the regular status polls that happen within the
         manager code.
 
-        I execute the command:
+        The state of every container is read from a single run of vzlist,
+        and the instances from a single query for those on this host, so a
+        poll costs the same however many containers the host runs.
+        """
+        vzs = self._list_vzs()
+        ctxt = context.get_admin_context()
+        instances = dict((str(instance['id']), instance) for instance in
+                         db.instance_get_all_by_host(ctxt, FLAGS.host))
+        infos = []
+        for name, meta in vzs.iteritems():
+            instance = instances.get(meta['id'])
+            if instance is None:
+                # The container may belong to an instance whose host has
+                # not been updated, so look for it anywhere.
+                try:
+                    instance = db.instance_get(ctxt, meta['id'])
+                except exception.NotFound:
+                    LOG.error(_('Instance %s Not Found') % name)
+                    continue
+            status = self._get_info(meta, instance)
+            infos.append(driver.InstanceInfo(name, status['state']))
 
-        vzlist --all -o name -H
+        return infos
 
-        If I fail to run an exception is raised because a failure to run is
-        disruptive to the driver's ability to support the instances on
-        the host through nova's interface.
+    def _list_vzs(self):
         """
+        Take a snapshot of every container on the host.
 
-        # TODO(imsplitbit): need to ask around if this is the best way to do
-        # this.  This causes some redundant vzlist commands as get_info is run
-        # on every item returned from this command but it didn't make sense
-        # to re-implement get_info as get_info_all.
-        infos = []
+        I run the command:
+
+        vzlist --all -H -o ctid,status,name
+
+        And return a dict of the containers by name, each a dict of their
+        'id', 'state' and 'name'.  Containers without a name are not nova
+        instances and are left out.  If I fail to run an exception is raised
+        because a failure to run is disruptive to the driver's ability to
+        support the instances on the host through nova's interface.
+        """
         try:
-            # get a list of CT names which will be nova friendly.
             # NOTE: This can be an issue if nova decides to change
             # the format of names.  We would need to have a migration process
             # to change the names in the name field of the CTs.
-            out, err = utils.execute('vzlist', '--all', '-o',
-                                     'name', '-H', run_as_root=True)
+            out, err = utils.execute('vzlist', '--all', '-H', '-o',
+                                     'ctid,status,name', run_as_root=True)
             if err:
                 LOG.error(_('Stderr output from vzlist: %s') % err)
         except ProcessExecutionError as err:
             LOG.error(_('Stderr output from vzlist: %s') % err)
             raise exception.Error(_('Problem listing Vzs'))
 
-        for name in out.splitlines():
-            name = name.split()[0]
-            status = self.get_info(name)
-            infos.append(driver.InstanceInfo(name, status['state']))
+        vzs = {}
+        for line in out.splitlines():
+            meta = self._parse_vzlist_line(line)
+            if meta:
+                vzs[meta['name']] = meta
+        return vzs
 
-        return infos
+    @staticmethod
+    def _parse_vzlist_line(line):
+        """
+        Parse a line of vzlist -o ctid,status,name output, returning None
+        for a container without a name.
+        """
+        fields = line.split()
+        if len(fields) < 3 or fields[2] == '-':
+            return None
+        return {'id': fields[0], 'state': fields[1], 'name': fields[2]}
 
     def spawn(self, context, instance, network_info=None,
               block_device_mapping=None):
@@ -262,29 +322,23 @@ class OpenVzConnection(driver.ComputeDriver):
                            {'power_state': power_state.BUILDING})
         LOG.debug(_('instance %s: is building') % instance['name'])
 
-        # Get current usages and resource availablity.
-        self._get_cpuunits_usage()
-
         # Go through the steps of creating a container
         # TODO(imsplitbit): Need to add conditionals around this stuff to make
         # it more durable during failure. And roll back changes made leading
         # up to the error.
-        self._cache_image(context, instance)
-        self._create_vz(instance)
-        self._set_vz_os_hint(instance)
-        self._configure_vz(instance)
-        self._set_name(instance)
-        self.plug_vifs(instance, network_info)
-        self._set_hostname(instance)
-        self._set_instance_size(instance)
-        self._attach_volumes(instance)
-        self._set_onboot(instance)
-        self._start(instance)
-        self._initial_secure_host(instance)
-        self._gratuitous_arp_all_addresses(instance, network_info)
+        steps = self._spawn_steps(context, instance, network_info)
+        try:
+            steps.run()
+        except Exception:
+            self._notify_spawn_timings(instance, steps, 'error')
+            raise
+        finally:
+            # The container has its own copy of the template now.
+            self.template_cache.release(instance['image_ref'])
 
         # Begin making our looping async call
         timer = utils.LoopingCall(f=None)
+        boot_started_at = time.time()
 
         # I stole this from the libvirt driver but it is appropriate to
         # have this looping timer call so that if a VE doesn't start right
@@ -297,6 +351,8 @@ class OpenVzConnection(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     LOG.debug(_('instance %s: booted') % instance['name'])
                     timer.stop()
+                    steps.timings['boot'] = time.time() - boot_started_at
+                    self._notify_spawn_timings(instance, steps, 'running')
 
             except:
                 LOG.exception(_('instance %s: failed to boot') %
@@ -304,10 +360,64 @@ class OpenVzConnection(driver.ComputeDriver):
                 db.instance_update(context, instance['id'],
                                    {'power_state': power_state.SHUTDOWN})
                 timer.stop()
+                steps.timings['boot'] = time.time() - boot_started_at
+                self._notify_spawn_timings(instance, steps, 'error')
 
         timer.f = _wait_for_boot
         return timer.start(interval=0.5, now=True)
 
+    def _spawn_steps(self, context, instance, network_info):
+        """
+        Return the steps of building a container, each after those it
+        depends on.
+
+        Every vzctl set takes the container's lock, so the steps which
+        write its config follow each other.  Fetching the image, reading
+        the cpuunits in use and adding the firewall chain run alongside
+        them, as does writing the volume mount scripts once the container
+        has its name.
+        """
+        steps = OVZBootSteps()
+        steps.add('cpuunits_usage', self._get_cpuunits_usage)
+        steps.add('cache_image', self._cache_image, context, instance)
+        steps.add('secure_host', self._initial_secure_host, instance)
+        steps.add('create', self._create_vz, instance,
+                  requires=['cache_image'])
+        steps.add('os_hint', self._set_vz_os_hint, instance,
+                  requires=['create'])
+        steps.add('configure', self._configure_vz, instance,
+                  requires=['os_hint'])
+        steps.add('name', self._set_name, instance, requires=['configure'])
+        steps.add('vifs', self.plug_vifs, instance, network_info,
+                  requires=['name'])
+        steps.add('hostname', self._set_hostname, instance,
+                  requires=['vifs'])
+        steps.add('size', self._set_instance_size, instance,
+                  requires=['hostname', 'cpuunits_usage'])
+        steps.add('onboot', self._set_onboot, instance, requires=['size'])
+        # Volumes are attached to the container found by its name.
+        steps.add('volumes', self._attach_volumes, instance,
+                  requires=['name'])
+        steps.add('start', self._start, instance,
+                  requires=['onboot', 'volumes', 'secure_host'])
+        steps.add('garp', self._gratuitous_arp_all_addresses, instance,
+                  network_info, requires=['start'])
+        return steps
+
+    def _notify_spawn_timings(self, instance, steps, state):
+        """
+        Send the time each step of building the container took.
+        """
+        LOG.debug(_('Spawn timings of %(id)s: %(timings)s') %
+                  {'id': instance['id'], 'timings': steps.timings})
+        notifier.notify(notifier.publisher_id('compute'),
+                        'compute.instance.spawn.timings',
+                        notifier.INFO,
+                        {'instance_id': instance['id'],
+                         'state': state,
+                         'timings': dict(steps.timings),
+                         'total': time.time() - steps.started_at})
+
     def _create_vz(self, instance, ostemplate='ubuntu'):
         """
         Attempt to load the image from openvz's image cache, upon failure
@@ -384,29 +494,44 @@ class OpenVzConnection(driver.ComputeDriver):
 
     def _cache_image(self, context, instance):
         """
-        Create the disk image for the virtual environment.  This uses the
-        image library to pull the image down the distro image into the openvz
-        template cache.  This is the method that openvz wants to operate
-        properly.
+        Make sure the image is in the openvz template cache, as vzctl create
+        wants it, downloading it should it not be there.  The template is
+        kept from being evicted until the instance's spawn is done.
         """
+        # These objects are required to retrieve images from the object
+        # store. This is known only to work with glance so far but as I
+        # understand it. glance's interface matches that of the other
+        # object stores.
+        user = manager.AuthManager().get_user(instance['user_id'])
+        project = manager.AuthManager().get_project(instance['project_id'])
 
-        image_name = '%s.tar.gz' % instance['image_ref']
-        full_image_path = '%s/%s' % (FLAGS.ovz_image_template_dir, image_name)
+        return self.template_cache.acquire(context, instance['image_ref'],
+                                           user, project)
 
-        if not os.path.exists(full_image_path):
-            # These objects are required to retrieve images from the object
-            # store. This is known only to work with glance so far but as I
-            # understand it. glance's interface matches that of the other
-            # object stores.
-            user = manager.AuthManager().get_user(instance['user_id'])
-            project = manager.AuthManager().get_project(instance['project_id'])
-
-            # Grab image and place it in the image cache
-            images.fetch(context, instance['image_ref'], full_image_path, user,
-                         project)
-            return True
-        else:
-            return False
+    def prewarm_images(self, context, image_refs):
+        """
+        Download each of the images into the template cache ahead of any
+        instance being built from them, so the first spawns on this host
+        need not wait on the image service.  The images fetched, those
+        already cached and those which failed are sent in a notification.
+        """
+        result = {'host': FLAGS.host, 'fetched': [], 'cached': [],
+                  'failed': []}
+        for image_ref in image_refs:
+            try:
+                if self.template_cache.fetch(context, image_ref):
+                    result['fetched'].append(image_ref)
+                else:
+                    result['cached'].append(image_ref)
+            except Exception:
+                LOG.exception(_('Could not prewarm image %s') % image_ref)
+                result['failed'].append(image_ref)
+        LOG.info(_('Prewarmed images: %s') % result)
+        notifier.notify(notifier.publisher_id('compute'),
+                        'compute.host.images.prewarmed',
+                        notifier.ERROR if result['failed'] else notifier.INFO,
+                        result)
+        return result
 
     def _configure_vz(self, instance, config='basic'):
         """
@@ -652,7 +777,7 @@ class OpenVzConnection(driver.ComputeDriver):
 
         I run the command:
 
-        vzlist -H --all --name <name>
+        vzlist -H --all -o ctid,status,name --name <name>
 
         If I fail to run an exception is raised because if I cannot locate an
         instance by it's name then the driver will fail to work.
@@ -661,7 +786,8 @@ class OpenVzConnection(driver.ComputeDriver):
         # The required method get_info only accepts a name so we need a way
         # to correlate name and id without maintaining another state/meta db
         try:
-            out, err = utils.execute('vzlist', '-H', '--all', '--name',
+            out, err = utils.execute('vzlist', '-H', '--all', '-o',
+                                     'ctid,status,name', '--name',
                                      instance_name, run_as_root=True)
             LOG.debug(_('Stdout output from vzlist: %s') % out)
             if err:
@@ -671,9 +797,11 @@ class OpenVzConnection(driver.ComputeDriver):
             raise exception.NotFound('Unable to load metadata for %s' %
                                   instance_name)
 
-        # Break the output into usable chunks
-        out = out.split()
-        return {'name': out[4], 'id': out[0], 'state': out[2]}
+        meta = self._parse_vzlist_line(out)
+        if meta is None:
+            raise exception.NotFound('Unable to load metadata for %s' %
+                                     instance_name)
+        return meta
 
     def _access_control(self, instance, host, mask=32, port=None,
                         protocol='tcp', access_type='allow'):
@@ -771,6 +899,10 @@ class OpenVzConnection(driver.ComputeDriver):
         Given that these parameters make up and instance's 'size' we are
         bundling them together to make resizing an instance on the host
         an easier task.
+
+        Every setting is worked out first and compared with the container's
+        config, and only those which differ are applied, in a single run
+        of vzctl set.
         """
         if not instance_type_id:
             instance_type = instance_types.get_instance_type(
@@ -778,91 +910,74 @@ class OpenVzConnection(driver.ComputeDriver):
         else:
             instance_type = instance_types.get_instance_type(instance_type_id)
 
+        config = OVZHostStats().container_config(instance['id'])
+        settings = [(option, value) for option, value in
+                    self._instance_size_profile(instance_type)
+                    if _config_value(option, value) !=
+                       config.get(option.upper())]
+        if not settings:
+            LOG.debug(_('Size of %s is unchanged') % instance['id'])
+            return
+        self._set_resources(instance, settings)
+
+    def _instance_size_profile(self, instance_type):
+        """
+        Return the (option, value) pairs of vzctl set which size a container
+        for the instance type.
+        """
         instance_memory_bytes = ((int(instance_type['memory_mb'])
                                   * 1024) * 1024)
         instance_memory_pages = self._calc_pages(instance_type['memory_mb'])
         percent_of_resource = self._percent_of_resource(
             instance_type['memory_mb'])
 
-        self._set_vmguarpages(instance, instance_memory_pages)
-        self._set_privvmpages(instance, instance_memory_pages)
-        self._set_kmemsize(instance, instance_memory_bytes)
+        profile = [('vmguarpages', instance_memory_pages),
+                   ('privvmpages', instance_memory_pages),
+                   ('kmemsize', self._kmemsize_value(instance_memory_bytes))]
         if FLAGS.ovz_use_cpuunit:
-            self._set_cpuunits(instance, percent_of_resource)
+            profile.append(('cpuunits',
+                            self._cpuunits_value(percent_of_resource)))
         if FLAGS.ovz_use_cpulimit:
-            self._set_cpulimit(instance, percent_of_resource)
+            profile.append(('cpulimit',
+                            self._cpulimit_value(percent_of_resource)))
         if FLAGS.ovz_use_cpus:
-            self._set_cpus(instance, instance_type['vcpus'])
+            profile.append(('cpus',
+                            self._cpus_value(instance_type['vcpus'])))
         if FLAGS.ovz_use_ioprio:
-            self._set_ioprio(instance, percent_of_resource)
+            profile.append(('ioprio',
+                            self._ioprio_value(percent_of_resource)))
         if FLAGS.ovz_use_disk_quotas:
-            self._set_diskspace(instance, instance_type)
-
-    def _set_vmguarpages(self, instance, num_pages):
-        """
-        Set the vmguarpages attribute for a container.  This number represents
-        the number of 4k blocks of memory that are guaranteed to the container.
-        This is what shows up when you run the command 'free' in the container.
-
-        I run the command:
-
-        vzctl set <ctid> --save --vmguarpages <num_pages>
+            profile.append(('diskspace',
+                            self._diskspace_value(instance_type)))
+        return profile
 
-        If I fail to run then an exception is raised because this affects the
-        memory allocation for the container.
+    def _set_resources(self, instance, settings):
         """
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'],
-                                      '--save', '--vmguarpages', num_pages,
-                                      run_as_root=True)
-            LOG.debug(_('Stdout output from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Cannot set vmguarpages for %s') %
-                                  instance['id'])
-
-    def _set_privvmpages(self, instance, num_pages):
-        """
-        Set the privvmpages attribute for a container.  This represents the
-        memory allocation limit.  Think of this as a bursting limit.  For now
-        We are setting to the same as vmguarpages but in the future this can be
-        used to thin provision a box.
+        Apply a list of (option, value) settings to a container at once.
 
         I run the command:
 
-        vzctl set <ctid> --save --privvmpages <num_pages>
+        vzctl set <ctid> --save --<option> <value> [--<option> <value> ...]
 
-        If I fail to run an exception is raised as this is essential for the
-        running container to operate properly within it's memory constraints.
+        If I fail to run an exception is raised because the container would
+        be left without the limits of its size.
         """
+        cmd = ['vzctl', 'set', instance['id'], '--save']
+        for option, value in settings:
+            cmd.extend(['--%s' % option, value])
         try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--privvmpages', num_pages,
-                                     run_as_root=True)
+            out, err = utils.execute(*cmd, run_as_root=True)
             LOG.debug(_('Stdout output from vzctl: %s') % out)
             if err:
                 LOG.error(_('Stderr output from vzctl: %s') % err)
         except ProcessExecutionError as err:
             LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Cannot set privvmpages for %s') %
+            raise exception.Error(_('Cannot set the size of %s') %
                                   instance['id'])
 
-    def _set_kmemsize(self, instance, instance_memory):
+    def _kmemsize_value(self, instance_memory):
         """
-        Set the kmemsize attribute for a container.  This represents the
-        amount of the container's memory allocation that will be made
-        available to the kernel.  This is used for tcp connections, unix
-        sockets and the like.
-
-        This runs the command:
-
-        vzctl set <ctid> --save --kmemsize <barrier>:<limit>
-
-        If this fails to run an exception is raised as this is essential for
-        the container to operate under a normal load.  Defaults for this
-        setting are completely inadequate for any normal workload.
+        Return the kmemsize <barrier>:<limit> for a container's memory.
         """
         # Now use the configuration flags to calculate the appropriate
         # values for both barrier and limit.
@@ -870,34 +985,11 @@ class OpenVzConnection(driver.ComputeDriver):
             float(FLAGS.ovz_kmemsize_percent_of_memory) / 100.0))
         kmem_barrier = int(kmem_limit * (
             float(FLAGS.ovz_kmemsize_barrier_differential) / 100.0))
-        kmemsize = '%d:%d' % (kmem_barrier, kmem_limit)
+        return '%d:%d' % (kmem_barrier, kmem_limit)
 
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--kmemsize',
-                                     kmemsize, run_as_root=True)
-            LOG.debug(_('Stdout from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Error setting kmemsize: %s') % err)
-            raise exception.Error(
-                _('Error setting kmemsize to %(kmemsize)s on %(id)s') %
-                {'kmemsize': kmemsize, 'id': instance['id']})
-
-    def _set_cpuunits(self, instance, percent_of_resource):
+    def _cpuunits_value(self, percent_of_resource):
         """
-        Set the cpuunits setting for the container.  This is an integer
-        representing the number of cpu fair scheduling counters that the
-        container has access to during one complete cycle.
-
-        I run the command:
-
-        vzctl set <ctid> --save --cpuunits <units>
-
-        If I fail to run an exception is raised because this is the secret
-        sauce to constraining each container within it's subscribed slice of
-        the host node.
+        Return the cpuunits for a container's share of the host.
         """
         LOG.debug(_('Reported cpuunits %s') % self.utility['UNITS'])
         LOG.debug(_('Reported percent of resource: %s') %
@@ -909,32 +1001,11 @@ class OpenVzConnection(driver.ComputeDriver):
         # the maximum cpuunits for the host.
         if units > self.utility['UNITS']:
             units = self.utility['UNITS']
+        return units
 
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--cpuunits', units, run_as_root=True)
-            LOG.debug(_('Stdout output from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Cannot set cpuunits for %s') %
-                                  instance['id'])
-
-    def _set_cpulimit(self, instance, percent_of_resource):
+    def _cpulimit_value(self, percent_of_resource):
         """
-        This is a number in % equal to the amount of cpu processing power
-        the container gets.  NOTE: 100% is 1 logical cpu so if you have 12
-        cores with hyperthreading enabled then 100% of the whole host machine
-        would be 2400% or --cpulimit 2400.
-
-        I run the command:
-
-        vzctl set <ctid> --save --cpulimit <cpulimit>
-
-        If I fail to run an exception is raised because this is the secret
-        sauce to constraining each container within it's subscribed slice of
-        the host node.
+        Return the cpulimit for a container's share of the host.
         """
         cpulimit = int(self.utility['CPULIMIT'] * percent_of_resource)
         # TODO(imsplitbit): Need to fix this so that we don't alocate
@@ -944,90 +1015,28 @@ class OpenVzConnection(driver.ComputeDriver):
         # than the maximum cpulimit for the host on any one container.
         if cpulimit > self.utility['CPULIMIT']:
             cpulimit = self.utility['CPULIMIT']
+        return cpulimit
 
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--cpulimit', cpulimit, run_as_root=True)
-            LOG.debug(_('Stdout output from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Unable to set cpulimit for %s') %
-                                  instance['id'])
-
-    def _set_cpus(self, instance, vcpus, multiplier=2):
+    def _cpus_value(self, vcpus, multiplier=2):
         """
-        The number of logical cpus that are made available to the container.
-        I default to showing 2 cpus to each container at a minimum.
-
-        I run the command:
-
-        vzctl set <ctid> --save --cpus <num_cpus>
-
-        If I fail to run an exception is raised because this limits the number
-        of cores that are presented to each container and if this fails to set
-        *ALL* cores will be presented to every container, that be bad.
+        Return the cpus shown to a container with the given vcpus.
         """
         vcpus = vcpus * multiplier
         # TODO(imsplitbit): We need to fix this to not allow allocation of
         # more than the maximum allowed cpus on the host.
         if vcpus > (self.utility['CPULIMIT'] / 100):
             vcpus = self.utility['CPULIMIT'] / 100
+        return vcpus
 
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--cpus', vcpus, run_as_root=True)
-            LOG.debug(_('Stdout output from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Unable to set cpus for %s') %
-                                  instance['id'])
-
-    def _set_ioprio(self, instance, percent_of_resource):
+    def _ioprio_value(self, percent_of_resource):
         """
-        Set the IO priority setting for a given container.  This is represented
-        by an integer between 0 and 7.  If no priority is given one will be
-        automatically calculated based on the percentage of allocated memory
-        for the container.
-
-        I run the command:
-
-        vzctl set <ctid> --save --ioprio <iopriority>
-
-        If I fail to run an exception is raised because all containers are
-        given the same weight by default which will cause bad performance
-        across all containers when there is input/outpu contention.
+        Return the IO priority for a container's share of the host.
         """
-        ioprio = int(float(FLAGS.ovz_ioprio_limit) * percent_of_resource)
+        return int(float(FLAGS.ovz_ioprio_limit) * percent_of_resource)
 
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--ioprio', ioprio, run_as_root=True)
-            LOG.debug(_('Stdout output from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Unable to set IO priority for %s') %
-                instance['id'])
-
-    def _set_diskspace(self, instance, instance_type):
+    def _diskspace_value(self, instance_type):
         """
-        Implement OpenVz disk quotas for local disk space usage.
-        This method takes a soft and hard limit.  This is also the amount
-        of diskspace that is reported by system tools such as du and df inside
-        the container.  If no argument is given then one will be calculated
-        based on the values in the instance_types table within the database.
-
-        I run the command:
-
-        vzctl set <ctid> --save --diskspace <soft_limit:hard_limit>
-
-        If I fail to run an exception is raised because this command limits a
-        container's ability to hijack all available disk space.
+        Return the diskspace <soft_limit>:<hard_limit> for an instance type.
         """
         soft = int(instance_type['local_gb'])
 
@@ -1038,18 +1047,7 @@ class OpenVzConnection(driver.ComputeDriver):
         # have to do this in every line above.
         soft = '%s%s' % (soft, FLAGS.ovz_disk_space_increment)
         hard = '%s%s' % (hard, FLAGS.ovz_disk_space_increment)
-
-        try:
-            out, err = utils.execute('vzctl', 'set', instance['id'], '--save',
-                                     '--diskspace', '%s:%s' % (soft, hard),
-                                     run_as_root=True)
-            LOG.debug(_('Stdout output from vzctl: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from vzctl: %s') % err)
-        except ProcessExecutionError as err:
-            LOG.error(_('Stderr output from vzctl: %s') % err)
-            raise exception.Error(_('Error setting diskspace quota for %s') %
-                                  instance['id'])
+        return '%s:%s' % (soft, hard)
 
     def plug_vifs(self, instance, network_info):
         """
@@ -1406,7 +1404,12 @@ class OpenVzConnection(driver.ComputeDriver):
             LOG.error(_('Output from db call: %s') % err)
             LOG.error(_('Instance %s Not Found') % instance_name)
             raise exception.NotFound('Instance %s Not Found' % instance_name)
+        return self._get_info(meta, instance)
 
+    def _get_info(self, meta, instance):
+        """
+        Build the get_info block of an instance from its vzlist metadata.
+        """
         # Store the assumed state as the default
         state = instance['power_state']
 
@@ -1565,9 +1568,52 @@ class OpenVzConnection(driver.ComputeDriver):
 
     def update_available_resource(self, ctxt, host):
         """
-        Added because now nova requires this method
+        Updates compute manager resource info on ComputeNode table.
+
+        This method is called when nova-compute launches, and
+        whenever admin executes "nova-manage service update_resource".
         """
-        return
+        try:
+            service_ref = db.service_get_all_compute_by_host(ctxt, host)[0]
+        except exception.NotFound:
+            raise exception.ComputeServiceUnavailable(host=host)
+
+        stats = self.get_host_stats(refresh=True)
+        dic = {'vcpus': stats['vcpus'],
+               'memory_mb': stats['host_memory_total'] / (1024 * 1024),
+               'local_gb': stats['disk_total'] / (1024 * 1024 * 1024),
+               'vcpus_used': stats['vcpus_used'],
+               'memory_mb_used': stats['host_memory_committed'] /
+                                 (1024 * 1024),
+               'local_gb_used': stats['disk_used'] / (1024 * 1024 * 1024),
+               'hypervisor_type': stats['hypervisor_type'],
+               'hypervisor_version': 0,
+               'cpu_info': ''}
+
+        compute_node_ref = service_ref['compute_node']
+        if not compute_node_ref:
+            LOG.info(_('Compute_service record created for %s ') % host)
+            dic['service_id'] = service_ref['id']
+            db.compute_node_create(ctxt, dic)
+        else:
+            LOG.info(_('Compute_service record updated for %s ') % host)
+            db.compute_node_update(ctxt, compute_node_ref[0]['id'], dic)
+
+    def update_host_status(self):
+        """
+        Read the host's stats again, returning them.
+        """
+        return self.get_host_stats(refresh=True)
+
+    def get_host_stats(self, refresh=False):
+        """
+        Return the free memory, cpuunits and disk of the host, reading them
+        again first if refresh is set.  The compute manager publishes these
+        as the host's capabilities every host_state_interval seconds.
+        """
+        if refresh or not self.host_stats:
+            self.host_stats = OVZHostStats().collect(self.utility['UNITS'])
+        return self.host_stats
 
     def _calc_pages(self, instance_memory_mb, block_size=4096):
         """
@@ -1580,7 +1626,7 @@ class OpenVzConnection(driver.ComputeDriver):
         In order to evenly distribute resources this method will calculate a
         multiplier based on memory consumption for the allocated container and
         the overall host memory. This can then be applied to the cpuunits in
-        self.utility to be passed as an argument to the self._set_cpuunits
+        self.utility to be passed as an argument to the self._cpuunits_value
         method to limit cpu usage of the container to an accurate percentage of
         the host.  This is only done on self.spawn so that later, should
         someone choose to do so, they can adjust the container's cpu usage
@@ -1605,29 +1651,20 @@ class OpenVzConnection(driver.ComputeDriver):
         Linux specific code but because OpenVz only runs on linux this really
         isn't a problem.
 
-        I run the command:
-
-        cat /proc/meminfo
+        I read /proc/meminfo.
 
-        If I fail to run an exception is raised as the returned value of this
-        method is required for all resource isolation to work correctly.
+        If I fail to read it an exception is raised as the returned value of
+        this method is required for all resource isolation to work correctly.
         """
         try:
-            out, err = utils.execute('cat', '/proc/meminfo', run_as_root=True)
-            LOG.debug(_('Stdout output from cat: %s') % out)
-            if err:
-                LOG.error(_('Stderr output from cat: %s') % err)
-            for line in out.splitlines():
-                line = line.split()
-                if line[0] == 'MemTotal:':
-                    LOG.debug(_('Total memory for host %s MB') % line[1])
-                    self.utility['MEMORY_MB'] = int(line[1]) / 1024
-            return True
-
-        except ProcessExecutionError as err:
+            total = OVZHostStats().meminfo()['MemTotal']
+        except (IOError, KeyError) as err:
             LOG.error(_('Cannot get memory info for host'))
-            LOG.error(_('Stderr output from cat: %s') % err)
+            LOG.error(_('Output from open: %s') % err)
             raise exception.Error(_('Cannot get memory info for host'))
+        LOG.debug(_('Total memory for host %s MB') % (total / 1024))
+        self.utility['MEMORY_MB'] = total / 1024
+        return True
 
     def _get_cpulimit(self):
         """
@@ -1637,34 +1674,20 @@ class OpenVzConnection(driver.ComputeDriver):
         processors then the total cpulimit for the host node will be
         2400.
 
-        I run the command:
-
-        cat /proc/cpuinfo
+        I read /proc/cpuinfo.
 
-        If I fail to run an exception is raised because the returned value
-        of this method is essential in calculating the number of cores
+        If I fail to read it an exception is raised because the returned
+        value of this method is essential in calculating the number of cores
         available on the host to be carved up for the guests.
         """
-        proc_count = 0
         try:
-            out, err = utils.execute('cat', '/proc/cpuinfo', run_as_root=True)
-            LOG.debug(_('Stdout output from cat %s') % out)
-            if err:
-                LOG.error(_('Stderr output from cat: %s') % err)
-
-            for line in out.splitlines():
-                line = line.split()
-                if len(line) > 0:
-                    if line[0] == 'processor':
-                        proc_count += 1
-
-            self.utility['CPULIMIT'] = proc_count * 100
-            return True
-
-        except ProcessExecutionError as err:
+            proc_count = OVZHostStats().cpu_count()
+        except IOError as err:
             LOG.error(_('Cannot get host node cpulimit'))
-            LOG.error(_('Stderr output from cat: %s') % err)
+            LOG.error(_('Output from open: %s') % err)
             raise exception.Error(err)
+        self.utility['CPULIMIT'] = proc_count * 100
+        return True
 
     def _get_cpuunits_capability(self):
         """
@@ -1729,6 +1752,384 @@ class OpenVzConnection(driver.ComputeDriver):
         except ProcessExecutionError as err:
             LOG.error(_('Stderr output from vzcpucheck: %s') % err)
 
+
+class OVZBootSteps(object):
+    """
+    Steps which each run in a green thread of their own as soon as the
+    steps they require are done, recording the seconds each took.  A step
+    whose requirements failed does not run.
+    """
+    def __init__(self):
+        self.steps = []
+        self.timings = {}
+        self.started_at = None
+
+    def add(self, name, method, *args, **kwargs):
+        """
+        Add a step calling method with args, once the steps named in the
+        requires keyword argument, which must already be added, are done.
+        """
+        requires = kwargs.pop('requires', [])
+        names = [step[0] for step in self.steps]
+        for required in requires:
+            if required not in names:
+                raise exception.Error(_('Step %(name)s requires unknown '
+                                        'step %(required)s') % locals())
+        self.steps.append((name, method, args, requires))
+
+    def run(self):
+        """
+        Run every step, raising the error of the first step to fail once
+        all of those which can run have.
+        """
+        self.started_at = time.time()
+        threads = {}
+        for name, method, args, requires in self.steps:
+            threads[name] = greenthread.spawn(
+                self._run_step, name, method, args,
+                [threads[required] for required in requires])
+        errors = [threads[step[0]].wait() for step in self.steps]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def _run_step(self, name, method, args, requires):
+        """
+        Return the error which stopped the step or its requirements, if
+        any.  Errors are returned rather than raised so the hub does not
+        print them for each green thread waiting on the step.
+        """
+        for thread in requires:
+            error = thread.wait()
+            if error is not None:
+                return error
+        start = time.time()
+        try:
+            method(*args)
+        except Exception as err:
+            LOG.exception(_('Step %s failed') % name)
+            return err
+        finally:
+            self.timings[name] = time.time() - start
+
+
+class OVZHostStats(object):
+    """
+    Reads the capacity of the host and what its containers have been given
+    straight from /proc and the container configs, so collecting them forks
+    no processes.  Only /proc/user_beancounters is readable by root alone,
+    so it falls back to sudo cat should it not be readable directly.
+    """
+    PAGE_SIZE = 4096
+
+    def __init__(self, proc_dir=None, config_dir=None, private_dir=None):
+        self.proc_dir = proc_dir or FLAGS.ovz_proc_dir
+        self.config_dir = config_dir or FLAGS.ovz_config_dir
+        self.private_dir = private_dir or FLAGS.ovz_ve_private_dir
+
+    def read(self, name, run_as_root=False):
+        """
+        Return the contents of a file in the proc dir.
+        """
+        path = os.path.join(self.proc_dir, name)
+        try:
+            with open(path, 'r') as fh:
+                return fh.read()
+        except IOError:
+            if not run_as_root:
+                raise
+        LOG.debug(_('Cannot read %s directly, reading it as root') % path)
+        try:
+            out, err = utils.execute('cat', path, run_as_root=True)
+            if err:
+                LOG.error(_('Stderr output from cat: %s') % err)
+            return out
+        except ProcessExecutionError as err:
+            LOG.error(_('Stderr output from cat: %s') % err)
+            raise IOError(str(err))
+
+    def meminfo(self):
+        """
+        Return the fields of /proc/meminfo, in kB.
+        """
+        fields = {}
+        for line in self.read('meminfo').splitlines():
+            line = line.split()
+            if len(line) >= 2 and line[0].endswith(':'):
+                fields[line[0][:-1]] = int(line[1])
+        return fields
+
+    def cpu_count(self):
+        """
+        Return the number of logical processors in /proc/cpuinfo.
+        """
+        return len([line for line in self.read('cpuinfo').splitlines()
+                    if line.split()[:1] == ['processor']])
+
+    def beancounters(self):
+        """
+        Return the barrier of each resource of each running container in
+        /proc/user_beancounters, by ctid.  The host itself is left out.
+        """
+        containers = {}
+        ctid = None
+        for line in self.read('user_beancounters',
+                              run_as_root=True).splitlines():
+            line = line.split()
+            if not line or line[0] in ('Version:', 'uid'):
+                continue
+            if line[0].endswith(':'):
+                ctid = line.pop(0)[:-1]
+                containers.setdefault(ctid, {})
+            if len(line) == 6 and ctid is not None:
+                containers[ctid][line[0]] = int(line[3])
+        containers.pop('0', None)
+        return containers
+
+    def container_config(self, ctid):
+        """
+        Return the settings in a container's config, which may be empty
+        should it not be readable.
+        """
+        settings = {}
+        path = os.path.join(self.config_dir, '%s.conf' % ctid)
+        try:
+            with open(path, 'r') as fh:
+                lines = fh.readlines()
+        except IOError as err:
+            LOG.error(_('Output from open: %s') % err)
+            return settings
+        for line in lines:
+            key, sep, value = line.strip().partition('=')
+            if sep and not key.startswith('#'):
+                settings[key] = value.strip('"')
+        return settings
+
+    def collect(self, cpuunits_total):
+        """
+        Return the host's capacity and what remains of it once the running
+        containers have been given their share, given the cpuunits of the
+        host as told by vzcpucheck.  Memory and disk are in bytes.
+        """
+        meminfo = self.meminfo()
+        memory_total = meminfo['MemTotal'] * 1024
+        memory_unused = (meminfo.get('MemFree', 0) +
+                         meminfo.get('Buffers', 0) +
+                         meminfo.get('Cached', 0)) * 1024
+
+        memory_committed = 0
+        cpuunits_used = 0
+        vcpus_used = 0
+        containers = self.beancounters()
+        for ctid, barriers in containers.iteritems():
+            memory_committed += barriers.get('vmguarpages', 0) * \
+                                self.PAGE_SIZE
+            config = self.container_config(ctid)
+            cpuunits_used += int(config.get('CPUUNITS') or 0)
+            vcpus_used += int(config.get('CPUS') or 0)
+
+        disk = os.statvfs(self.private_dir)
+        disk_total = disk.f_blocks * disk.f_frsize
+        disk_available = disk.f_bavail * disk.f_frsize
+
+        return {'hypervisor_type': 'openvz',
+                'containers': len(containers),
+                'vcpus': self.cpu_count(),
+                'vcpus_used': vcpus_used,
+                'host_memory_total': memory_total,
+                'host_memory_committed': memory_committed,
+                'host_memory_free': max(0, memory_total - memory_committed),
+                'host_memory_unused': memory_unused,
+                'cpuunits_total': cpuunits_total,
+                'cpuunits_used': cpuunits_used,
+                'cpuunits_free': max(0, cpuunits_total - cpuunits_used),
+                'disk_total': disk_total,
+                'disk_used': disk_total - disk_available,
+                'disk_available': disk_available}
+
+
+class OVZTemplateCache(object):
+    """
+    Keeps the images containers are created from as templates in the
+    template dir, with a manifest of the checksum, size and last use of
+    each.  An image is downloaded once however many spawns wait on it, and
+    should the templates outgrow ovz_template_cache_quota_mb the least
+    recently used of those not in use are deleted.
+    """
+    MANIFEST = 'nova-template-cache.json'
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, template_dir=None, quota_mb=None):
+        self.template_dir = template_dir or FLAGS.ovz_image_template_dir
+        if quota_mb is None:
+            quota_mb = FLAGS.ovz_template_cache_quota_mb
+        self.quota = quota_mb * 1024 * 1024
+        self.in_use = {}
+
+    def path(self, image_ref):
+        """
+        Return where vzctl create looks for the image's template.
+        """
+        return os.path.join(self.template_dir, '%s.tar.gz' % image_ref)
+
+    def read_manifest(self):
+        """
+        Return the manifest entry of each cached template, by image ref.
+        """
+        path = os.path.join(self.template_dir, self.MANIFEST)
+        try:
+            with open(path, 'r') as fh:
+                return json.load(fh)
+        except IOError:
+            return {}
+        except ValueError as err:
+            LOG.error(_('Ignoring the unreadable manifest %(path)s: %(err)s')
+                      % locals())
+            return {}
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.template_dir, self.MANIFEST)
+        with open('%s.part' % path, 'w') as fh:
+            json.dump(manifest, fh)
+        os.rename('%s.part' % path, path)
+
+    def _update_manifest(self, method, *args):
+        @utils.synchronized('ovz-template-manifest')
+        def _update():
+            manifest = self.read_manifest()
+            result = method(manifest, *args)
+            self._write_manifest(manifest)
+            return result
+        return _update()
+
+    def acquire(self, context, image_ref, user=None, project=None):
+        """
+        Fetch the image, keeping its template from being evicted until it
+        is released, which it must be whether or not the fetch succeeds.
+        """
+        self.in_use[image_ref] = self.in_use.get(image_ref, 0) + 1
+        return self.fetch(context, image_ref, user, project)
+
+    def release(self, image_ref):
+        count = self.in_use.pop(image_ref, 0) - 1
+        if count > 0:
+            self.in_use[image_ref] = count
+
+    def fetch(self, context, image_ref, user=None, project=None):
+        """
+        Download the image into the cache unless it is already there,
+        returning whether it was downloaded.  Spawns fetching the same
+        image wait on the one download.
+        """
+        @utils.synchronized('ovz-template-%s' % image_ref)
+        def _fetch():
+            path = self.path(image_ref)
+            if os.path.exists(path):
+                self._update_manifest(self._touch, image_ref, path)
+                return False
+            self._download(context, image_ref, path, user, project)
+            return True
+
+        fetched = _fetch()
+        if fetched:
+            self.evict(keep=image_ref)
+        return fetched
+
+    def _download(self, context, image_ref, path, user, project):
+        """
+        Download the image beside its template, moving it into place only
+        once its checksum is known to match the image service's, so vzctl
+        never sees a partial template.
+        """
+        part_path = '%s.part' % path
+        start = time.time()
+        try:
+            metadata = images.fetch(context, image_ref, part_path, user,
+                                    project) or {}
+            checksum = self.checksum(part_path)
+            expected = metadata.get('checksum')
+            if expected and expected != checksum:
+                raise exception.Error(
+                    _('Image %(image_ref)s has checksum %(checksum)s rather '
+                      'than %(expected)s') % locals())
+            os.rename(part_path, path)
+        except Exception:
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+            raise
+        size = os.path.getsize(path)
+        LOG.info(_('Cached image %(image_ref)s, %(size)s bytes, in '
+                   '%(elapsed).1f seconds') %
+                 {'image_ref': image_ref, 'size': size,
+                  'elapsed': time.time() - start})
+        self._update_manifest(self._add, image_ref, checksum, size)
+
+    def checksum(self, path):
+        """
+        Return the md5 of the file, as the image service reports it.
+        """
+        md5 = hashlib.md5()
+        with open(path, 'rb') as fh:
+            chunk = fh.read(self.CHUNK_SIZE)
+            while chunk:
+                md5.update(chunk)
+                # Let other green threads run while a large image is read.
+                greenthread.sleep(0)
+                chunk = fh.read(self.CHUNK_SIZE)
+        return md5.hexdigest()
+
+    def _add(self, manifest, image_ref, checksum, size):
+        manifest[str(image_ref)] = {'checksum': checksum, 'size': size,
+                                    'last_used': time.time()}
+
+    def _touch(self, manifest, image_ref, path):
+        entry = manifest.get(str(image_ref))
+        if entry is None:
+            # Templates cached before the manifest are taken in as they are.
+            entry = manifest[str(image_ref)] = {
+                'checksum': None, 'size': os.path.getsize(path)}
+        entry['last_used'] = time.time()
+
+    def evict(self, keep=None):
+        """
+        Delete the least recently used templates, other than those in use
+        and the one to keep, until those in the manifest fit the quota.
+        Return the image refs deleted.
+        """
+        if not self.quota:
+            return []
+        return self._update_manifest(self._evict, keep)
+
+    def _evict(self, manifest, keep):
+        for image_ref in manifest.keys():
+            if not os.path.exists(self.path(image_ref)):
+                del manifest[image_ref]
+        in_use = set(str(image_ref) for image_ref in self.in_use)
+        in_use.add(str(keep))
+        total = sum(entry['size'] for entry in manifest.values())
+        evicted = []
+        for image_ref in sorted(manifest,
+                                key=lambda ref: manifest[ref]['last_used']):
+            if total <= self.quota:
+                break
+            if image_ref in in_use:
+                continue
+            LOG.info(_('Evicting image %s from the template cache') %
+                     image_ref)
+            try:
+                os.unlink(self.path(image_ref))
+            except OSError as err:
+                LOG.error(_('Output from unlink: %s') % err)
+                continue
+            total -= manifest.pop(image_ref)['size']
+            evicted.append(image_ref)
+        if total > self.quota:
+            LOG.warn(_('Templates in use take %(total)s bytes, over the '
+                       'template cache quota of %(quota)s bytes') %
+                     {'total': total, 'quota': self.quota})
+        return evicted
+
+
 class OVZFile(object):
     """
     This is a generic file class for wrapping up standard file operations that
@@ -117,6 +117,8 @@ class APIRouter(wsgi.Router):
                                   controller=hosts.create_resource()) as m:
                 m.connect("", action="index",
                           conditions=dict(method=["GET"]))
+                m.connect("/prewarm", action="prewarm",
+                          conditions=dict(method=["POST"]))
                 m.connect("/{id}", action="show",
                           conditions=dict(method=["GET"]))
 
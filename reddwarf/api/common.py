@@ -16,8 +16,14 @@
 Common shared code across DBaaS API
 """
 
+import urllib
+
+from webob import exc
+
 from nova import exception as nova_exception
+from nova import flags
 from nova import log as logging
+from nova.api.openstack import wsgi
 from nova.compute import power_state
 from nova.db.sqlalchemy.api import is_admin_context
 
@@ -29,6 +35,9 @@ from reddwarf.guest.db import models
 XML_NS_V10 = 'http://docs.openstack.org/database/api/v1.0'
 LOG = logging.getLogger('reddwarf.api.common')
 
+FLAGS = flags.FLAGS
+flags.DECLARE('osapi_max_limit', 'nova.api.openstack.common')
+
 dbaas_mapping = {
     None: 'BUILD',
     power_state.NOSTATE: 'BUILD',
@@ -84,6 +93,37 @@ def populate_users(users):
         raise exception.BadRequest(ve.message)
 
 
+def get_pagination_params(req):
+    """
+    Returns the marker and limit requested for a paginated listing. The
+    marker is the id of the last item the client has seen. The limit
+    defaults to, and is capped at, the osapi_max_limit flag.
+    """
+    marker = req.GET.get('marker', None)
+    try:
+        limit = int(req.GET.get('limit', FLAGS.osapi_max_limit))
+    except ValueError:
+        raise exception.BadRequest("The limit param must be an integer.")
+    if limit <= 0:
+        raise exception.BadRequest("The limit param must be positive.")
+    return marker, min(limit, FLAGS.osapi_max_limit)
+
+
+def paginate(items, req, limit, key='id'):
+    """
+    Trims a listing fetched with one more item than the limit down to a
+    single page. Returns the page along with its links, which hold a next
+    link only when there are more items to fetch.
+    """
+    if len(items) <= limit:
+        return items, []
+    items = items[:limit]
+    params = dict(req.GET)
+    params.update({'marker': items[-1][key], 'limit': limit})
+    href = "%s?%s" % (req.path_url, urllib.urlencode(sorted(params.items())))
+    return items, [{'rel': 'next', 'href': href}]
+
+
 def instance_exists(ctxt, id, compute_api):
     """Verify the instance exists before issuing any other call"""
     try:
@@ -120,3 +160,27 @@ def verify_admin_context(f):
             raise exception.Unauthorized("User does not have admin privileges.")
         return f(*args, **kwargs)
     return wrapper
+
+
+def if_none_match(req):
+    """Returns the version given in the If-None-Match header, if any."""
+    header = req.headers.get('If-None-Match')
+    if not header:
+        return None
+    return header.split(',')[0].strip().strip('"') or None
+
+
+def not_modified(version):
+    """Returns the response telling the client its version is current."""
+    return exc.HTTPNotModified(headers=[('ETag', '"%s"' % version)])
+
+
+class VersionHeadersSerializer(wsgi.ResponseHeadersSerializer):
+    """Sets the ETag of a listing to the version its controller returned
+    under the 'version' key, which is left out of the body."""
+
+    def index(self, response, data):
+        self.default(response, data)
+        version = data.pop('version', None)
+        if version:
+            response.etag = version
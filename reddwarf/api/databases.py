@@ -24,6 +24,7 @@ from nova.api.openstack import wsgi
 from reddwarf import exception
 from reddwarf.api import common
 from reddwarf.api import deserializer
+from reddwarf.api import serializer
 from reddwarf.db import api as dbapi
 from reddwarf.guest import api as guest_api
 from reddwarf.guest.db import models
@@ -50,13 +51,25 @@ class Controller(object):
         local_id = dbapi.localid_from_uuid(instance_id)
         ctxt = req.environ['nova.context']
         common.instance_available(ctxt, instance_id, local_id, self.compute_api)
+        marker, limit = common.get_pagination_params(req)
         try:
-            result = self.guest_api.list_databases(ctxt, local_id)
+            summary = self.guest_api.get_guest_summary(ctxt, local_id,
+                                ('databases',),
+                                if_version=common.if_none_match(req),
+                                limit=limit + 1, marker=marker)
         except Exception as err:
             LOG.error(err)
+            summary = {'databases': None}
+        if summary.get('not_modified'):
+            return common.not_modified(summary['version'])
+        result = summary['databases']
+        if result is None:
             raise exception.InstanceFault("Unable to get the list of databases")
         LOG.debug("LIST DATABASES RESULT - %s", str(result))
-        databases = {'databases':[]}
+        result, links = common.paginate(result, req, limit, key='_name')
+        databases = {'databases':[], 'version': summary['version']}
+        if links:
+            databases['links'] = links
         for database in result:
             mysql_database = models.MySQLDatabase()
             mysql_database.deserialize(database)
@@ -117,7 +130,8 @@ def create_resource(version='1.0'):
 
     metadata = {
         "attributes": {
-            'database': ["name", "character_set", "collate"]
+            'database': ["name", "character_set", "collate"],
+            'link': ["rel", "href"],
         },
     }
 
@@ -126,15 +140,17 @@ def create_resource(version='1.0'):
     }[version]
 
     serializers = {
-        'application/xml': wsgi.XMLDictSerializer(metadata=metadata,
-                                                  xmlns=xmlns),
+        'application/xml': serializer.XMLDictSerializer(metadata=metadata,
+                                                        xmlns=xmlns),
     }
 
     deserializers = {
         'application/xml': deserializer.DatabaseXMLDeserializer(),
     }
 
-    response_serializer = wsgi.ResponseSerializer(body_serializers=serializers)
+    headers_serializer = common.VersionHeadersSerializer()
+    response_serializer = wsgi.ResponseSerializer(body_serializers=serializers,
+                                        headers_serializer=headers_serializer)
     request_deserializer = wsgi.RequestDeserializer(body_deserializers=deserializers)
 
     return wsgi.Resource(controller, deserializer=request_deserializer,
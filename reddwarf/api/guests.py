@@ -60,8 +60,8 @@ class Controller(object):
         ctxt = req.environ['nova.context']
         #TODO(rnirmal): Convert to using fanout once Nova code is merged in
         instances = self.compute_api.get_all(ctxt)
-        for instance in instances:
-            self.guest_api.upgrade(ctxt, str(instance['id']))
+        self.guest_api.upgrade_all(ctxt, [instance['id']
+                                          for instance in instances])
         return exc.HTTPAccepted()
 
 
@@ -13,12 +13,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from webob import exc
+
 from nova import exception as nova_exception
 from nova import flags
 from nova import log as logging
 from nova.api.openstack import wsgi
 from nova.db.sqlalchemy.api import service_get_all_compute_sorted
 
+from reddwarf import compute
 from reddwarf import exception
 from reddwarf.api import common
 from reddwarf.db import api as dbapi
@@ -35,6 +38,7 @@ class Controller(object):
     """ The Host Management Controller for the Platform API """
 
     def __init__(self):
+        self.compute_api = compute.API()
         super(Controller, self).__init__()
 
     @common.verify_admin_context
@@ -75,6 +79,28 @@ class Controller(object):
         except nova_exception.HostNotFound:
             raise exception.NotFound()
 
+    @common.verify_admin_context
+    def prewarm(self, req, body):
+        """Cache images on the given hosts, or all of them, ahead of
+        instances being built from them."""
+        LOG.info("Prewarm images on nova-compute hosts")
+        LOG.debug("%s - %s", req.environ, req.body)
+        ctxt = req.environ['nova.context']
+        try:
+            image_refs = body['prewarm']['images']
+            hosts = body['prewarm'].get('hosts')
+        except (KeyError, TypeError, AttributeError):
+            raise exception.BadRequest(_("Required element/key 'images' "
+                                         "was not specified"))
+        if not image_refs or not isinstance(image_refs, list):
+            raise exception.BadRequest(_("'images' must be a list of image "
+                                         "ids"))
+        if hosts is not None and not isinstance(hosts, list):
+            raise exception.BadRequest(_("'hosts' must be a list of host "
+                                         "names"))
+        self.compute_api.prewarm_images(ctxt, image_refs, hosts)
+        return exc.HTTPAccepted()
+
 
 def create_resource(version='1.0'):
     controller = {
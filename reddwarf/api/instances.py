@@ -23,6 +23,7 @@ from nova import db
 from nova import exception as nova_exception
 from nova import flags
 from nova import log as logging
+from nova import utils
 from nova.api.openstack import common as nova_common
 from nova.api.openstack import faults
 from nova.api.openstack import servers
@@ -37,6 +38,7 @@ from reddwarf import exception
 from reddwarf import volume
 from reddwarf.api import common
 from reddwarf.api import deserializer
+from reddwarf.api import serializer
 from reddwarf.api.status import InstanceStatus
 from reddwarf.api.status import InstanceStatusLookup
 from reddwarf.api.views import instances
@@ -59,6 +61,17 @@ flags.DEFINE_integer('reddwarf_max_accepted_volume_size', 128,
                     ' an instance.')
 
 
+# The search options of the instance listing, each with the filter of
+# dbapi.instance_list_get_all_filtered it maps to.
+SEARCH_OPTIONS = {'name': 'display_name',
+                  'status': 'vm_state',
+                  'changes-since': 'changes-since',
+                  'flavor': 'flavorid',
+                  'image': 'image_ref'}
+ADMIN_SEARCH_OPTIONS = {'fixed_ip': 'fixed_ip',
+                        'tenant_id': 'project_id'}
+
+
 def publisher_id(host=None):
     return notifier.publisher_id("reddwarf-api", host)
 
@@ -189,32 +202,60 @@ class Controller(object):
         """ Returns a list of instance names and ids for a given user """
         LOG.info("Call to Instances index")
         LOG.debug("%s - %s", req.environ, req.body)
-        servers_response = self.server_controller.index(req)
-        server_list = servers_response['servers']
-        context = req.environ['nova.context']
-
-        # Instances need the status for each instance in all circumstances,
-        # unlike servers.
-        server_states = dbapi.instance_state_get_all_filtered(context)
-        for server in server_list:
-            state = server_states[server['id']]
-            server['status'] = nova_common.status_from_state(state)
-
-        id_list = [server['id'] for server in server_list]
-        status_lookup = InstanceStatusLookup(id_list)
-        instances = [self.view.build_index(server, req, status_lookup)
-                        for server in server_list]
-        return {'instances': instances}
+        return self._list(req)
 
     def detail(self, req):
         """ Returns a list of instance details for a given user """
         LOG.debug("%s - %s", req.environ, req.body)
-        server_list = self.server_controller.detail(req)['servers']
-        id_list = [server['id'] for server in server_list]
-        status_lookup = InstanceStatusLookup(id_list)
-        instances = [self.view.build_detail(server, req, status_lookup)
-                        for server in server_list]
-        return {'instances': instances}
+        return self._list(req, is_detail=True)
+
+    def _list(self, req, is_detail=False):
+        """
+        Returns one page of instances, fetching a single extra row to find
+        out whether a next link is needed.
+        """
+        context = req.environ['nova.context']
+        marker, limit = common.get_pagination_params(req)
+        filters = self._get_search_filters(req)
+        try:
+            rows = dbapi.instance_list_get_all_filtered(context, marker,
+                                                        limit + 1,
+                                                        filters=filters)
+        except nova_exception.InstanceNotFound:
+            raise exception.BadRequest("marker [%s] not found" % marker)
+        instances = self.view.build_list(rows, req, is_detail=is_detail)
+        instances, links = common.paginate(instances, req, limit)
+        result = {'instances': instances}
+        if links:
+            result['links'] = links
+        return result
+
+    def _get_search_filters(self, req):
+        """Returns the listing filters for the search options of the
+        request, rejecting any option that isn't supported."""
+        options = dict(SEARCH_OPTIONS)
+        if req.environ['nova.context'].is_admin:
+            options.update(ADMIN_SEARCH_OPTIONS)
+        filters = {}
+        for option, value in req.str_GET.iteritems():
+            if option in ('marker', 'limit'):
+                continue
+            if option not in options:
+                raise exception.BadRequest("Invalid search option %s"
+                                           % option)
+            filters[options[option]] = value
+        if 'vm_state' in filters:
+            status = filters['vm_state']
+            filters['vm_state'] = nova_common.vm_state_from_status(status)
+            if filters['vm_state'] is None:
+                raise exception.BadRequest("Invalid status %s" % status)
+        if 'changes-since' in filters:
+            try:
+                filters['changes-since'] = utils.parse_isotime(
+                                               filters['changes-since'])
+            except ValueError:
+                raise exception.BadRequest("Invalid changes-since value")
+        return filters
 
     def show(self, req, id):
         """ Returns instance details by instance id """
@@ -285,6 +326,7 @@ class Controller(object):
         self.server_controller.delete(req, instance_id)
         #TODO(rnirmal): Use a deferred here to update status
         dbapi.guest_status_delete(instance_id)
+        guest_api.forget_routing_key(instance_id)
         return exc.HTTPAccepted()
 
     def create(self, req, body):
@@ -423,13 +465,15 @@ class Controller(object):
     def _get_guest_info(self, context, id):
         """Get the list of databases on a instance"""
         try:
-            result = self.guest_api.list_databases(context, id)
-            databases = [{'name': db['_name'],
-                         'collate': db['_collate'],
-                         'character_set': db['_character_set']}
-                         for db in result]
-            root_enabled = self.guest_api.is_root_enabled(context, id)
-            return databases, root_enabled
+            summary = self.guest_api.get_guest_summary(context, id,
+                                            ('databases', 'root_enabled'))
+            databases = None
+            if summary['databases'] is not None:
+                databases = [{'name': db['_name'],
+                             'collate': db['_collate'],
+                             'character_set': db['_character_set']}
+                             for db in summary['databases']]
+            return databases, summary['root_enabled']
         except Exception as err:
             LOG.error(err)
             LOG.error("guest not responding on instance %s" % id)
@@ -542,8 +586,8 @@ def create_resource(version='1.0'):
     }[version]
 
     serializers = {
-        'application/xml': wsgi.XMLDictSerializer(metadata=metadata,
-                                                  xmlns=xmlns),
+        'application/xml': serializer.XMLDictSerializer(metadata=metadata,
+                                                        xmlns=xmlns),
     }
 
     deserializers = {
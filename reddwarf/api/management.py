@@ -27,6 +27,7 @@ from nova.compute import power_state
 from reddwarf import exception
 from reddwarf import volume
 from reddwarf.api import common
+from reddwarf.api import serializer
 from reddwarf.api.status import InstanceStatusLookup
 from reddwarf.api.views import instances
 from reddwarf.db import api as dbapi
@@ -93,8 +94,8 @@ def create_resource(version='1.0'):
     }[version]
 
     serializers = {
-        'application/xml': wsgi.XMLDictSerializer(metadata=metadata,
-                                                  xmlns=xmlns),
+        'application/xml': serializer.XMLDictSerializer(metadata=metadata,
+                                                        xmlns=xmlns),
     }
 
     response_serializer = wsgi.ResponseSerializer(body_serializers=serializers)
@@ -163,7 +164,25 @@ class Controller(object):
                 deleted = False
 
         context = req.environ['nova.context']
-        instances, flavors, ips = dbapi.instances_mgmt_index(context, deleted)
+        marker, limit = common.get_pagination_params(req)
+        try:
+            instances, flavors, ips = dbapi.instances_mgmt_index(context,
+                                                                 deleted,
+                                                                 marker,
+                                                                 limit + 1)
+        except nova_exception.InstanceNotFound:
+            raise exception.BadRequest("marker [%s] not found" % marker)
+        # Index the flavors and IPs once so each instance is matched to its
+        # own in constant time, rather than scanning both lists per instance.
+        flavorids = dict((flavor['id'], flavor['flavorid'])
+                         for flavor in flavors)
+        ips_by_instance = {}
+        for ip in ips:
+            ips_by_instance.setdefault(ip['instance_id'], []).append({
+                'address': ip['address'],
+                'virtual_interface_id': ip['virtual_interface_id'],
+                })
+
         result = []
         for instance in instances:
             details = {
@@ -175,38 +194,35 @@ class Controller(object):
                 'deleted_at': instance['deleted_at'],
                 'deleted': instance['deleted'],
             }
-            # Associate the flavor.
-            # TODO(ed-): Should probably make the relational database do all the data relating.
-            flavor = [f for f in flavors if f['id'] == instance['instance_type_id']]
-            if len(flavor) > 0:
-                flavor = flavor[0]
-                details['flavorid'] = flavor['flavorid']
-
-            # Now associate the IPs.
-            # TODO(ed-): A join would be preferable.
-            details['ips'] = [{
-                'address': ip['address'],
-                'virtual_interface_id': ip['virtual_interface_id'],
-                } for ip in ips]
+            if instance['instance_type_id'] in flavorids:
+                details['flavorid'] = flavorids[instance['instance_type_id']]
+            details['ips'] = ips_by_instance.get(instance['id'], [])
             result.append(details)
 
-        return {"instances": result}
+        result, links = common.paginate(result, req, limit)
+        response = {"instances": result}
+        if links:
+            response['links'] = links
+        return response
 
     def _get_guest_info(self, context, id, status, instance):
         """Get all the guest details and add it to the response"""
         dbs = None
         users = None
         if status.is_sql_running:
-            db_list = self.guest_api.list_databases(context, id)
-
+            summary = self.guest_api.get_guest_summary(context, id,
+                                                       ('databases', 'users'))
+            db_list = summary['databases']
             LOG.debug("DBS: %r" % db_list)
-            dbs = [{
-                    'name': db['_name'],
-                    'collate': db['_collate'],
-                    'character_set': db['_character_set']
-                    } for db in db_list]
-            users = self.guest_api.list_users(context, id)
-            users = [{'name': user['_name']} for user in users]
+            if db_list is not None:
+                dbs = [{
+                        'name': db['_name'],
+                        'collate': db['_collate'],
+                        'character_set': db['_character_set']
+                        } for db in db_list]
+            if summary['users'] is not None:
+                users = [{'name': user['_name']}
+                         for user in summary['users']]
 
         root_access = dbapi.get_root_enabled_history(context, id)
 
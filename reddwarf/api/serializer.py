@@ -0,0 +1,35 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from xml.dom import minidom
+
+from nova.api.openstack import wsgi
+
+
+class XMLDictSerializer(wsgi.XMLDictSerializer):
+    """
+    Serializer to handle xml-formatted responses which may have pagination
+    links alongside the root element, such as {'instances': [...],
+    'links': [...]}. The links are added as link elements of the root.
+    """
+
+    def default(self, data):
+        root_key = [key for key in data.keys() if key != 'links'][0]
+        doc = minidom.Document()
+        node = self._to_xml_node(doc, self.metadata, root_key, data[root_key])
+        for link in data.get('links', []):
+            node.appendChild(self._to_xml_node(doc, self.metadata, 'link',
+                                               link))
+        return self.to_xml_string(node)
@@ -16,12 +16,14 @@ import os
 
 
 from nova import log as logging
+from nova import utils
 from nova.api.openstack import common as nova_common
 from nova.compute import power_state
 from nova.exception import InstanceNotFound
 from nova.notifier import api as notifier
 
 from reddwarf.api import common
+from reddwarf.api.status import InstanceStatus
 from reddwarf.api.views import flavors
 
 
@@ -86,14 +88,46 @@ class ViewBuilder(object):
         ]
         return links
 
-    def build_index(self, server, req, status_lookup):
-        """Build the response for an instance index call"""
-        return self._build_basic(server, req, status_lookup)
+    def build_list(self, rows, req, is_detail=False):
+        """Build the response for an index or detail call from the rows
+        returned by dbapi.instance_list_get_all_filtered."""
+        instances = []
+        seen = set()
+        for row in rows:
+            if row.id in seen:
+                self._notify_of_extra_volumes(row.id)
+                continue
+            seen.add(row.id)
+            instance = self._build_basic_from_row(row, req)
+            if is_detail:
+                instance = self._build_detail_from_row(row, req, instance)
+            instances.append(instance)
+        return instances
+
+    def _build_basic_from_row(self, row, req):
+        """Build the very basic information for an instance listing row"""
+        server_status = nova_common.status_from_state(row.vm_state,
+                                                      row.task_state)
+        status = InstanceStatus(guest_state=row.guest_state,
+                                server_status=server_status)
+        instance = {}
+        instance['id'] = row.uuid
+        instance['name'] = row.name
+        instance['status'] = status.status
+        instance['links'] = self._build_links(req, instance)
+        return instance
 
-    def build_detail(self, server, req, status_lookup):
-        """Build the response for an instance detail call"""
-        instance = self._build_basic(server, req, status_lookup)
-        instance = self._build_detail(server, req, instance)
+    def _build_detail_from_row(self, row, req, instance):
+        """Build out a more detailed view of an instance listing row"""
+        flavor_view = flavors.ViewBuilder(_base_url(req), _project_id(req))
+        instance['flavor'] = {'id': str(row.flavorid)}
+        instance['flavor']['links'] = flavor_view._build_links(instance['flavor'])
+        instance['created'] = utils.isotime(row.created_at)
+        instance['updated'] = utils.isotime(row.updated_at)
+        if row.hostname:
+            instance['hostname'] = row.hostname
+        if row.volume_size is not None:
+            instance['volume'] = {'size': row.volume_size}
         return instance
 
     def build_single(self, server, req, status_lookup, databases=None,
@@ -119,14 +153,18 @@ class ViewBuilder(object):
         except (KeyError, IndexError):
             return None
         if len(volumes) > 1:
-            error_msg = {'instanceId': server['id'],
-                         'msg': "> 1 volumes in the underlying instance!"}
-            LOG.error(error_msg)
-            notifier.notify(notifier.publisher_id("reddwarf-api"),
-                            'reddwarf.instance.list', notifier.ERROR,
-                            error_msg)
+            ViewBuilder._notify_of_extra_volumes(server['id'])
         return {'size': volume_dict['size']}
 
+    @staticmethod
+    def _notify_of_extra_volumes(id):
+        error_msg = {'instanceId': id,
+                     'msg': "> 1 volumes in the underlying instance!"}
+        LOG.error(error_msg)
+        notifier.notify(notifier.publisher_id("reddwarf-api"),
+                        'reddwarf.instance.list', notifier.ERROR,
+                        error_msg)
+
 
 class MgmtViewBuilder(ViewBuilder):
     """Management views for an instance"""
@@ -44,9 +44,14 @@ HTTP_X_AUTHORIZATION: the client identity being passed in
 
 import base64
 import json
+import socket
+import sys
+import time
 
-from beaker.cache import CacheManager
 from datetime import datetime
+from eventlet import event
+from eventlet import greenthread
+from eventlet import pools
 from eventlet import wsgi
 from eventlet.green import httplib
 from paste.deploy import loadapp
@@ -56,13 +61,22 @@ from nova import flags
 from nova.api.openstack import faults
 
 from reddwarf import exception
+from reddwarf.auth import cache
 
 FLAGS = flags.FLAGS
-flags.DEFINE_integer('reddwarf_auth_cache_expire_time', 60*5,
-                     'Time in seconds for the cache to expire user tokens')
+flags.DEFINE_integer('reddwarf_auth_cache_negative_expire_time', 30,
+                     'Time in seconds for the cache to expire tokens the '
+                     'auth service rejected')
+flags.DEFINE_integer('reddwarf_auth_cache_stats_interval', 300,
+                     'Time in seconds between logging the hits, misses and '
+                     'evictions of the token cache, or 0 not to log them')
 
 LOG = logging.getLogger(__name__)
 
+# Statuses the auth service answers for claims it has rejected. Any other
+# failure, such as a 503 from an overloaded service, is not cached.
+REJECTED_STATUSES = (401, 404)
+
 PROTOCOL_NAME = "Token Authentication"
 
 class AuthProtocol(object):
@@ -84,6 +98,16 @@ class AuthProtocol(object):
         self.service_host = conf.get('service_host')
         self.service_port = conf.get('service_port')
 
+        # Persistent connections to the auth service, shared by all requests
+        # handled by this worker.
+        self.auth_pool = HTTPConnectionPool(self.auth_protocol,
+                                            self.auth_host, self.auth_port,
+                                            int(conf.get('auth_pool_size',
+                                                         10)))
+        # Validations in progress, so concurrent requests presenting the same
+        # claims wait on a single call to the auth service.
+        self.pending_validations = {}
+
         # where to tell clients to find the auth service (default to url
         # constructed based on endpoint we have for the service to use)
         self.auth_location = conf.get('auth_uri', "%s://%s:%s/%s"
@@ -109,13 +133,15 @@ class AuthProtocol(object):
         self.basic_auth = base64.b64encode("%(service_user)s:%(service_pass)s"
                                            % locals())
 
-        # Create cache manager
+        # Cache of validated claims, shared within the process, or across
+        # processes with the memcache cache type
         self.cache_type = conf.get('cache_type', 'memory')
-        cm = CacheManager(type=self.cache_type)
-        self.cache = cm.get_cache('dbaas')
+        self.cache = cache.get_cache('dbaas', self.cache_type)
+        self.stats_logged_at = time.time()
 
     def __call__(self, env, start_response):
         """ Handle incoming request. Authenticate. And send downstream. """
+        self._log_cache_stats()
         proxy_headers = self._prep_headers(env)
 
         # Retrieve the tenant, if not reject the request
@@ -133,11 +159,14 @@ class AuthProtocol(object):
         cache_key = "%s/%s" % (claims,tenant)
 
         # this request is presenting claims. Let's validate them
-        #TODO(cp16net) what happens with 1000s of users being cached?
-        if self.cache.has_key(cache_key):
+        cached = self.cache.lookup(cache_key)
+        if cached is not None:
             # get the cached values
-            data, status = self.cache.get_value(cache_key)
+            (data, status), is_stale = cached
             valid = self._validate_status(status)
+            if is_stale:
+                # Serve the stale values while they are refreshed.
+                self._refresh_claims(claims, tenant)
 
             if not valid:
                 # Keystone rejected claim
@@ -145,22 +174,23 @@ class AuthProtocol(object):
         else:
             # need to get the values and then cache them if valid
             try:
-                data, status = self._validate_token(claims, tenant)
+                data, status = self._coalesced_validate_token(claims, tenant)
             except :
                 msg = "Authorization Service is not available at this time."
                 LOG.error(msg)
                 return faults.Fault(exception.ServiceUnavailable(msg)) \
                                     (env, start_response)
 
+            self._cache_claims(claims, tenant, data, status)
             valid = self._validate_status(status)
+            if not valid and status >= 500:
+                msg = "Authorization Service is not available at this time."
+                LOG.error(msg)
+                return faults.Fault(exception.ServiceUnavailable(msg)) \
+                                    (env, start_response)
             if not valid:
                 # rejected claim because claims are not valid
                 return self._reject_claims(env, start_response)
-            else:
-                # claim is valid so cache the result from validation
-                cache_key = "%s/%s" % (claims,tenant)
-                self.cache.set_value(cache_key, (data, status),
-                                     expiretime=FLAGS.reddwarf_auth_cache_expire_time)
 
         self._decorate_request("X_IDENTITY_STATUS", "Confirmed", env,
                                proxy_headers)
@@ -174,6 +204,44 @@ class AuthProtocol(object):
 
         return self.app(env, start_response)
 
+    def _log_cache_stats(self):
+        """Logs the counters of the token cache once every
+        reddwarf_auth_cache_stats_interval seconds"""
+        interval = FLAGS.reddwarf_auth_cache_stats_interval
+        now = time.time()
+        if not interval or now - self.stats_logged_at < interval:
+            return
+        self.stats_logged_at = now
+        stats = ", ".join("%s=%s" % item
+                          for item in sorted(self.cache.stats.items()))
+        LOG.info(_("Token cache %(cache_type)s stats: %(stats)s")
+                 % {'cache_type': self.cache_type, 'stats': stats})
+
+    def _cache_claims(self, claims, tenant, data, status):
+        """Cache the result of validating the claims. Rejected claims are
+        cached too, for a shorter time and without serving them stale, but
+        errors from the auth service are not cached at all."""
+        cache_key = "%s/%s" % (claims, tenant)
+        if self._validate_status(status):
+            self.cache.set_value(cache_key, (data, status),
+                                 expiretime=FLAGS.reddwarf_auth_cache_expire_time)
+        elif status in REJECTED_STATUSES:
+            self.cache.set_value(cache_key, (data, status),
+                    expiretime=FLAGS.reddwarf_auth_cache_negative_expire_time,
+                    stale_time=0)
+
+    def _refresh_claims(self, claims, tenant):
+        """Validate the claims again in the background and cache them"""
+        def refresh():
+            try:
+                data, status = self._coalesced_validate_token(claims, tenant)
+            except Exception as e:
+                LOG.warn("Unable to refresh cached claims: %s" % e)
+                return
+            self._cache_claims(claims, tenant, data, status)
+        if (claims, tenant) not in self.pending_validations:
+            greenthread.spawn_n(refresh)
+
     def _retrieve_tenant(self, env):
         # Retrieve the tenant/accountid from the url
         path_info = env.get('PATH_INFO', '/')
@@ -206,15 +274,12 @@ class AuthProtocol(object):
                    'Accept': 'application/json'}
         request_body = {'passwordCredentials': {'username': username,
                                                 'password': password}}
-        conn = get_connection(self.auth_protocol, self.auth_host,
-                              self.auth_port)
-        conn.request("POST", self.service_auth_path, json.dumps(request_body),
-                     headers=headers)
-        response = conn.getresponse()
-        data = response.read()
+        status, data = self.auth_pool.request("POST", self.service_auth_path,
+                                              json.dumps(request_body),
+                                              headers=headers)
         try:
-            if not data or not self._validate_status(response.status):
-                if response.status == 302:
+            if not data or not self._validate_status(status):
+                if status == 302:
                     # Can be ignored because the service relies on basic auth
                     return ""
                 raise exception.Unauthorized("Error authenticating service")
@@ -233,6 +298,24 @@ class AuthProtocol(object):
         """Client sent bad claims"""
         return faults.Fault(exception.Unauthorized())(env, start_response)
 
+    def _coalesced_validate_token(self, claims, tenant=None):
+        """Validate the claims, sharing the result with any other request
+        validating the same claims at the same time"""
+        key = (claims, tenant)
+        if key in self.pending_validations:
+            return self.pending_validations[key].wait()
+        pending = event.Event()
+        self.pending_validations[key] = pending
+        try:
+            result = self._validate_token(claims, tenant)
+            pending.send(result)
+            return result
+        except:
+            pending.send_exception(*sys.exc_info())
+            raise
+        finally:
+            del self.pending_validations[key]
+
     def _validate_token(self, claims, tenant=None):
         """Make the call to Keystone and get the return code and data"""
         headers = {'Content-type': 'application/json',
@@ -240,15 +323,12 @@ class AuthProtocol(object):
                    'X-Auth-Token': self.admin_token,
                    'Authorization': 'Basic %s' % self.basic_auth}
 
-        conn = get_connection(self.auth_protocol, self.auth_host,
-                              self.auth_port)
-        conn.request("GET", "%s/%s?belongsTo=%s&type=%s" %
-                     (self.validate_token_path, claims, tenant, self.auth_type),
-                     headers=headers)
-        response = conn.getresponse()
-        data = response.read()
-        conn.close()
-        return data, response.status
+        status, data = self.auth_pool.request("GET",
+                           "%s/%s?belongsTo=%s&type=%s" %
+                           (self.validate_token_path, claims, tenant,
+                            self.auth_type),
+                           headers=headers)
+        return data, status
 
     def _validate_status(self, status):
         """Check status is in list of OK http statuses"""
@@ -323,6 +403,50 @@ def app_factory(global_conf, **local_conf):
     return AuthProtocol(None, conf)
 
 
+class HTTPConnectionPool(pools.Pool):
+    """Pool of keep-alive connections to the auth service.
+
+    At most max_size connections are opened; further requests wait for one
+    to be returned to the pool.
+
+    """
+
+    def __init__(self, protocol, host, port, max_size):
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        super(HTTPConnectionPool, self).__init__(max_size=max_size)
+
+    def create(self):
+        return get_connection(self.protocol, self.host, self.port)
+
+    def request(self, method, path, body=None, headers=None):
+        """Make a request over a pooled connection, returning the status
+        and data of the response"""
+        conn = self.get()
+        try:
+            try:
+                response = self._request(conn, method, path, body, headers)
+            except (httplib.HTTPException, socket.error):
+                # The server may have dropped an idle connection, so try
+                # once more with a new one.
+                conn.close()
+                response = self._request(conn, method, path, body, headers)
+            data = response.read()
+            if response.getheader('connection', '').lower() == 'close':
+                conn.close()
+            return response.status, data
+        except:
+            conn.close()
+            raise
+        finally:
+            self.put(conn)
+
+    def _request(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers=headers or {})
+        return conn.getresponse()
+
+
 def get_connection(type, host, port):
     if type == "https":
         return httplib.HTTPSConnection("%(host)s:%(port)s" % locals())
@@ -0,0 +1,227 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Caches for the results of token validation.
+
+Entries are (data, status) tuples returned by the auth service, kept until
+their expire time. Once expired an entry is still returned as stale for a
+further stale_time seconds, so the caller can serve it while it refreshes
+the entry in the background.
+
+The memory cache is private to each worker process. The memcache cache is
+shared by every worker using the same memcached servers, so a token need
+only be validated once for all of them.
+
+"""
+
+import hashlib
+import json
+import math
+import time
+
+from nova import flags
+from nova import log as logging
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('reddwarf_auth_cache_expire_time', 60*5,
+                     'Time in seconds for the cache to expire user tokens')
+flags.DEFINE_integer('reddwarf_auth_cache_max_entries', 10000,
+                     'Most tokens kept in the in-memory token cache.')
+flags.DEFINE_integer('reddwarf_auth_cache_max_bytes', 16 * 1024 * 1024,
+                     'Most bytes of token data kept in the in-memory token '
+                     'cache.')
+flags.DEFINE_integer('reddwarf_auth_cache_stale_time', 60,
+                     'Time in seconds an expired token may still be used '
+                     'while it is validated again in the background.')
+flags.DECLARE('memcached_servers', 'nova.flags')
+
+LOG = logging.getLogger(__name__)
+
+# Rough per entry overhead of the dict, list and tuples holding an entry.
+ENTRY_OVERHEAD = 256
+
+CACHES = {}
+
+
+def get_cache(name, cache_type='memory'):
+    """Returns the token cache of the given name shared within a process.
+
+    :param cache_type: 'memory' for a cache private to the process, or
+                       'memcache' for one shared through the servers in the
+                       memcached_servers flag.
+
+    """
+    if (name, cache_type) not in CACHES:
+        if cache_type == 'memory':
+            cache = LRUTokenCache(FLAGS.reddwarf_auth_cache_max_entries,
+                                  FLAGS.reddwarf_auth_cache_max_bytes,
+                                  FLAGS.reddwarf_auth_cache_stale_time)
+        elif cache_type == 'memcache':
+            if FLAGS.memcached_servers:
+                import memcache
+            else:
+                LOG.warn(_("The %s token cache is set to memcache but no "
+                           "memcached_servers are set, so tokens are cached "
+                           "in this process only.") % name)
+                from nova import fakememcache as memcache
+            client = memcache.Client(FLAGS.memcached_servers, debug=0)
+            cache = MemcacheTokenCache(client, name,
+                                       FLAGS.reddwarf_auth_cache_stale_time)
+        else:
+            raise ValueError("Unknown token cache type %s" % cache_type)
+        CACHES[(name, cache_type)] = cache
+    return CACHES[(name, cache_type)]
+
+
+class LRUTokenCache(object):
+    """In-memory cache bounded by entry count and approximate size.
+
+    The least recently used entries are evicted first once either bound is
+    exceeded. Hits, stale hits, misses and evictions are counted in stats.
+
+    """
+
+    def __init__(self, max_entries, max_bytes, stale_time):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_time = stale_time
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0,
+                      'evictions': 0, 'entries': 0, 'bytes': 0}
+        # Maps keys to the nodes of a circular doubly linked list, which
+        # orders the entries from least to most recently used. Each node is
+        # a list of [prev, next, key, value, expires_at, stale_until, size].
+        self._entries = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, 0, 0, 0]
+
+    def has_key(self, key):
+        return self.lookup(key, count=False) is not None
+
+    def get_value(self, key):
+        entry = self.lookup(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def lookup(self, key, count=True):
+        """Returns a (value, is_stale) tuple for the key, or None."""
+        node = self._entries.get(key)
+        now = time.time()
+        if node is None or now >= node[5]:
+            if node is not None:
+                self._remove(node)
+            if count:
+                self.stats['misses'] += 1
+            return None
+        self._move_to_end(node)
+        is_stale = now >= node[4]
+        if count:
+            self.stats['stale_hits' if is_stale else 'hits'] += 1
+        return node[3], is_stale
+
+    def set_value(self, key, value, expiretime=None, stale_time=None):
+        """Caches the value for expiretime seconds, after which it is stale
+        for stale_time more seconds."""
+        if key in self._entries:
+            self._remove(self._entries[key])
+        if expiretime is None:
+            expiretime = FLAGS.reddwarf_auth_cache_expire_time
+        if stale_time is None:
+            stale_time = self.stale_time
+        expires_at = time.time() + expiretime
+        size = ENTRY_OVERHEAD + len(key) + \
+               sum(len(str(item)) for item in value)
+        last = self._root[0]
+        node = [last, self._root, key, value, expires_at,
+                expires_at + stale_time, size]
+        last[1] = self._root[0] = self._entries[key] = node
+        self.stats['entries'] += 1
+        self.stats['bytes'] += size
+        while (self.stats['entries'] > self.max_entries or
+               self.stats['bytes'] > self.max_bytes):
+            self._remove(self._root[1])
+            self.stats['evictions'] += 1
+
+    def _move_to_end(self, node):
+        prev, next = node[0], node[1]
+        prev[1], next[0] = next, prev
+        last = self._root[0]
+        node[0], node[1] = last, self._root
+        last[1] = self._root[0] = node
+
+    def _remove(self, node):
+        prev, next = node[0], node[1]
+        prev[1], next[0] = next, prev
+        del self._entries[node[2]]
+        self.stats['entries'] -= 1
+        self.stats['bytes'] -= node[6]
+
+
+class MemcacheTokenCache(object):
+    """Cache kept in memcached, shared by every process using the servers.
+
+    Values are stored as JSON along with their expire time, under a hash
+    of the key so tokens are neither exposed nor too long for memcached.
+    Memcached drops entries once they are no longer of use even stale.
+
+    """
+
+    def __init__(self, client, prefix, stale_time):
+        self.client = client
+        self.prefix = prefix
+        self.stale_time = stale_time
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0}
+
+    def _key(self, key):
+        return "%s-%s" % (self.prefix, hashlib.sha1(key).hexdigest())
+
+    def has_key(self, key):
+        return self.lookup(key, count=False) is not None
+
+    def get_value(self, key):
+        entry = self.lookup(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def lookup(self, key, count=True):
+        """Returns a (value, is_stale) tuple for the key, or None."""
+        serialized = self.client.get(self._key(key))
+        now = time.time()
+        entry = serialized and json.loads(serialized)
+        if not entry or now >= entry['stale_until']:
+            if count:
+                self.stats['misses'] += 1
+            return None
+        is_stale = now >= entry['expires_at']
+        if count:
+            self.stats['stale_hits' if is_stale else 'hits'] += 1
+        return tuple(entry['value']), is_stale
+
+    def set_value(self, key, value, expiretime=None, stale_time=None):
+        """Caches the value for expiretime seconds, after which it is stale
+        for stale_time more seconds."""
+        if expiretime is None:
+            expiretime = FLAGS.reddwarf_auth_cache_expire_time
+        if stale_time is None:
+            stale_time = self.stale_time
+        expires_at = time.time() + expiretime
+        entry = {'value': list(value),
+                 'expires_at': expires_at,
+                 'stale_until': expires_at + stale_time}
+        # A time of 0 means never expire to memcached, so keep it at least 1.
+        ttl = max(1, int(math.ceil(expiretime + stale_time)))
+        self.client.set(self._key(key), json.dumps(entry), time=ttl)
@@ -81,6 +81,21 @@ class API(nova_compute_api.API):
                  "args": {"instance_id": instance['id'],
                           "volume_id": volume_id}})
 
+    def prewarm_images(self, ctxt, image_refs, hosts=None):
+        """
+        Have the given compute hosts, or every one of them, cache the images
+        so instances built from them need not wait for the download.
+        """
+        msg = {"method": "prewarm_images",
+               "args": {"image_refs": image_refs}}
+        if not hosts:
+            rpc.fanout_cast(ctxt, FLAGS.compute_topic, msg)
+            return
+        for host in hosts:
+            rpc.cast(ctxt,
+                     self.db.queue_get_for(ctxt, FLAGS.compute_topic, host),
+                     msg)
+
     @scheduler_api.reroute_compute("restart")
     def restart(self, ctxt, instance_id):
         """Reboot the given instance."""
@@ -35,7 +35,11 @@ from nova.volume import api as volume_api
 from reddwarf import guest
 from reddwarf.db import api as dbapi
 from reddwarf import exception
-from reddwarf.utils import poll_until
+from reddwarf.utils import db_poll_budget
+from reddwarf.utils import get_wait_metrics
+from reddwarf.utils import notify_status_change
+from reddwarf.utils import status_key
+from reddwarf.utils import wait_for_status
 
 
 flags.DEFINE_integer('reddwarf_guest_initialize_time_out', 10 * 60,
@@ -133,10 +137,13 @@ class ReddwarfInstanceInitializer(object):
             self._set_instance_status_to_fail()
             return instance_state in VALID_ABORT_STATES
 
-        poll_until(get_instance_state,
-                         confirm_state_is_suspended,
-                         sleep_time=1,
-                         time_out=FLAGS.reddwarf_instance_suspend_time_out)
+        wait_for_status(status_key('instance', self.instance_id),
+                        get_instance_state,
+                        confirm_state_is_suspended,
+                        sleep_time=1,
+                        time_out=FLAGS.reddwarf_instance_suspend_time_out,
+                        phase='abort_suspend', backoff='jitter',
+                        budget=db_poll_budget())
         self._abort_volume()
 
     def _abort_volume(self):
@@ -166,10 +173,13 @@ class ReddwarfInstanceInitializer(object):
             memory_mb = instance_ref['memory_mb']
             guest_api.prepare(self.context, self.instance_id, memory_mb,
                                           self.databases)
-            poll_until(lambda : dbapi.guest_status_get(self.instance_id),
-                             lambda status : status.state == power_state.RUNNING,
-                             sleep_time=2,
-                             time_out=FLAGS.reddwarf_guest_initialize_time_out)
+            wait_for_status(status_key('guest_status', self.instance_id),
+                            lambda : dbapi.guest_status_get(self.instance_id),
+                            lambda status : status.state == power_state.RUNNING,
+                            sleep_time=2,
+                            time_out=FLAGS.reddwarf_guest_initialize_time_out,
+                            phase='guest_initialize', backoff='jitter',
+                            budget=db_poll_budget())
             LOG.info("Guest is now running on instance %s" % self.instance_id)
             return True
         except exception.PollTimeOut as pto:
@@ -242,7 +252,10 @@ class ReddwarfInstanceInitializer(object):
                 LOG.error("STATUS: %s" % status)
                 raise exception.VolumeProvisioningError(
                     volume_id=self.volume_id)
-        poll_until(volume_is_available, sleep_time=1, time_out=time_out)
+        wait_for_status(status_key('volume', self.volume_id),
+                        volume_is_available, sleep_time=1, time_out=time_out,
+                        phase='volume_provision', backoff='jitter',
+                        budget=db_poll_budget())
 
 class ReddwarfComputeManager(ComputeManager):
     """Manages the running Reddwarf instances."""
@@ -252,6 +265,14 @@ class ReddwarfComputeManager(ComputeManager):
         self.guest_api = guest.API()
         self.compute_manager = super(ReddwarfComputeManager, self)
 
+    def status_changed(self, context, keys):
+        """Wakes up provisioning waiting on the status behind the keys."""
+        notify_status_change(*keys)
+
+    def get_wait_metrics(self, context):
+        """Returns the time spent waiting on each phase of provisioning."""
+        return get_wait_metrics()
+
     def resize_in_place(self, context, instance_id, new_instance_type_id):
         """Changes the size of instance.
 
@@ -326,6 +347,14 @@ class ReddwarfComputeManager(ComputeManager):
         finally:
             self._instance_update(context,instance_id, task_state=None)
 
+    def prewarm_images(self, context, image_refs):
+        """Has the driver cache the images before instances need them."""
+        method = 'prewarm_images'
+        if not hasattr(self.driver, method):
+            raise exception.UnsupportedDriver(method=method)
+        LOG.audit(_("Prewarming images %s"), image_refs, context=context)
+        self.driver.prewarm_images(context.elevated(), image_refs)
+
     def run_instance(self, context, instance_id, **kwargs):
         """Launch a new instance with specified options.
 
@@ -416,10 +445,13 @@ class ReddwarfComputeManager(ComputeManager):
         resizing has been completed.
         """
         try:
-            poll_until(lambda: self.db.volume_get(context, volume_id),
-                       lambda volume: volume['status'] == 'resized',
-                       sleep_time=2,
-                       time_out=FLAGS.reddwarf_volume_time_out)
+            wait_for_status(status_key('volume', volume_id),
+                            lambda: self.db.volume_get(context, volume_id),
+                            lambda volume: volume['status'] == 'resized',
+                            sleep_time=2,
+                            time_out=FLAGS.reddwarf_volume_time_out,
+                            phase='volume_resize', backoff='jitter',
+                            budget=db_poll_budget())
             self.volume_api.update(context, volume_id, {'status': 'rescanning'})
             self.volume_client.resize_fs(context, volume_id)
             self.volume_api.update(context, volume_id, {'status': 'in-use'})
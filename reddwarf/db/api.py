@@ -18,10 +18,14 @@ API Interface for reddwarf datastore operations
 
 import datetime
 
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import func
+from sqlalchemy.sql import select
 from sqlalchemy.sql import text
 
 from nova import exception as nova_exception
@@ -114,6 +118,37 @@ def guest_status_update(instance_id, state, description=None):
                         'state_description': description})
 
 
+def guest_status_update_many(states, alive_ids=None):
+    """Update the state of many guests at once, along with the liveness
+       timestamp of guests whose state has not changed
+
+    :param states: dict of instance id to a (state, description) tuple
+    :param alive_ids: instance ids of guests that only reported liveness
+    """
+    now = datetime.datetime.utcnow()
+    table = models.GuestStatus.__table__
+    session = get_session()
+    with session.begin():
+        if states:
+            ids = states.keys()
+            new_states = dict((id, state)
+                              for id, (state, _desc) in states.items())
+            descriptions = dict((id, description or power_state.name(state))
+                                for id, (state, description) in states.items())
+            session.execute(table.update().
+                    where(table.c.instance_id.in_(ids)).
+                    where(table.c.deleted == False).
+                    values(state=case(new_states, value=table.c.instance_id),
+                           state_description=case(descriptions,
+                                                  value=table.c.instance_id),
+                           updated_at=now))
+        if alive_ids:
+            session.execute(table.update().
+                    where(table.c.instance_id.in_(list(alive_ids))).
+                    where(table.c.deleted == False).
+                    values(updated_at=now))
+
+
 def guest_status_delete(instance_id):
     """Set the specified instance state as deleted
 
@@ -129,6 +164,24 @@ def guest_status_delete(instance_id):
                         'state': state,
                         'state_description': power_state.name(state)})
 
+def guest_status_delete_stale():
+    """Set the guest status of every deleted instance as deleted, returning
+       how many were"""
+    state = power_state.SHUTDOWN
+    table = models.GuestStatus.__table__
+    deleted_ids = select([Instance.__table__.c.id],
+                         Instance.__table__.c.deleted == True)
+    session = get_session()
+    with session.begin():
+        result = session.execute(table.update().
+                where(and_(table.c.deleted == False,
+                           table.c.instance_id.in_(deleted_ids))).
+                values(deleted=True,
+                       deleted_at=datetime.datetime.utcnow(),
+                       state=state,
+                       state_description=power_state.name(state)))
+        return result.rowcount
+
 @require_admin_context
 def show_instances_on_host(context, id):
     """Show all the instances that are on the given host id."""
@@ -146,12 +199,53 @@ def show_instances_on_host(context, id):
                         filter_by(deleted=False).all()
     return result
 
+def _instance_scope(context, query):
+    """Limits an instance query to the instances of the context's project,
+    or of its user without a project, unless the context is an admin's."""
+    if context.is_admin:
+        return query
+    if context.project_id:
+        return query.filter(Instance.project_id == context.project_id)
+    return query.filter(Instance.user_id == context.user_id)
+
+
+def _instance_keyset_paginate(context, session, query, marker=None,
+                              limit=None):
+    """Orders an instance query by (created_at, id) and returns the page
+    that follows the instance whose uuid is the given marker.
+
+    The marker may be a deleted instance, but must be one the context is
+    allowed to list.
+
+    :param session: the session the query belongs to
+    :param query: a query involving the instances table
+    :param marker: uuid of the last instance of the previous page
+    :param limit: maximum number of rows to return
+    """
+    if marker is not None:
+        markers = session.query(Instance.created_at, Instance.id).\
+                          filter_by(uuid=marker)
+        result = _instance_scope(context, markers).first()
+        if not result:
+            raise nova_exception.InstanceNotFound(instance_id=marker)
+        created_at, id = result
+        query = query.filter(or_(Instance.created_at > created_at,
+                                 and_(Instance.created_at == created_at,
+                                      Instance.id > id)))
+    query = query.order_by(Instance.created_at, Instance.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 @require_admin_context
-def instances_mgmt_index(context, deleted=None):
+def instances_mgmt_index(context, deleted=None, marker=None, limit=None):
     session = get_session()
     instances = session.query(Instance)
     if deleted is not None:
         instances = instances.filter_by(deleted=deleted)
+    instances = _instance_keyset_paginate(context, session, instances,
+                                          marker, limit).all()
 
     # Join to get the flavor types.
     # TODO(ed-): The join works, but the model doesn't hand over the columns.
@@ -161,25 +255,54 @@ def instances_mgmt_index(context, deleted=None):
     # Fetch the instance_types, or "flavors"
     flavors = session.query(InstanceTypes)
 
-    # Fetch the IPs for mapping.
-    ips = session.query(FixedIp).filter(FixedIp.instance_id != None)
+    # Fetch the IPs for mapping, only for the instances on this page.
+    ips = []
+    if instances:
+        ids = [instance['id'] for instance in instances]
+        ips = session.query(FixedIp).\
+                      filter(FixedIp.instance_id.in_(ids)).\
+                      all()
 
-    return instances.all(), flavors.all(), ips.all()
+    return instances, flavors.all(), ips
 
 @require_admin_context
 def instance_get_by_state_and_updated_before(context, state, time):
-    """Finds instances in a specific state updated before some time."""
+    """Finds instances in a specific vm state updated before some time."""
     session = get_session()
     result = session.query(Instance).\
                       filter_by(deleted=False).\
-                      filter_by(state=state).\
-                      filter(Instance.updated_at < time).\
+                      filter_by(vm_state=state).\
+                      filter(func.coalesce(Instance.updated_at,
+                                           Instance.created_at) < time).\
                       all()
     if not result:
         return []
     return result
 
 
+@require_admin_context
+def instance_get_hostnames(context, instance_ids):
+    """Returns a dict of the hostname of each of the given instances, in a
+       single query."""
+    if not instance_ids:
+        return {}
+    session = get_session()
+    rows = session.query(Instance.id, Instance.hostname).\
+                   filter_by(deleted=False).\
+                   filter(Instance.id.in_([int(id) for id in instance_ids])).\
+                   all()
+    return dict(rows)
+
+
+@require_admin_context
+def instance_get_all_ids(context):
+    """Returns the id and uuid of every instance not deleted."""
+    session = get_session()
+    return session.query(Instance.id, Instance.uuid).\
+                   filter_by(deleted=False).\
+                   all()
+
+
 @require_admin_context
 def instance_get_memory_sum_by_host(context, hostname):
     session = get_session()
@@ -220,15 +343,50 @@ def volume_get_by_state_and_updated_before(context, state, time):
     return result
 
 @require_admin_context
-def volume_get_orphans(context, latest_time):
+def volume_get_orphans(context, latest_time, marker=None, limit=None):
+    """Finds available volumes without an instance updated before some
+    time, in order of id.
+
+    :param marker: only return volumes with an id greater than this
+    :param limit: most volumes to return
+    """
     session = get_session()
-    result = session.query(Volume).\
-                     filter_by(deleted=False).\
-                     filter_by(instance_id=None).\
-                     filter(Volume.status=='available').\
-                     filter(Volume.updated_at < latest_time).\
-                     all()                     
-    return result
+    query = session.query(Volume).\
+                    filter_by(deleted=False).\
+                    filter_by(instance_id=None).\
+                    filter(Volume.status=='available').\
+                    filter(Volume.updated_at < latest_time)
+    if marker is not None:
+        query = query.filter(Volume.id > marker)
+    query = query.order_by(Volume.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+@require_admin_context
+def volume_get_all_by_ids(context, volume_ids):
+    """Returns the volumes with the given ids, in a single query."""
+    if not volume_ids:
+        return []
+    session = get_session()
+    return session.query(Volume).\
+                   filter_by(deleted=False).\
+                   filter(Volume.id.in_(list(volume_ids))).\
+                   all()
+
+
+@require_admin_context
+def volume_update_many(context, volume_ids, values):
+    """Sets the same values on many volumes, in a single statement."""
+    if not volume_ids:
+        return
+    values = dict(values, updated_at=datetime.datetime.utcnow())
+    session = get_session()
+    with session.begin():
+        session.query(Volume).\
+                filter(Volume.id.in_(list(volume_ids))).\
+                update(values, synchronize_session=False)
 
 def get_root_enabled_history(context, id):
     """
@@ -461,18 +619,82 @@ def fixed_ip_get_by_instance_for_network(context, instance_id, bridge_name):
     return rv
 
 
-@require_context
-def instance_state_get_all_filtered(context):
-    """Returns a dictionary mapping instance IDs to their state."""
-    session = get_session()
-    query = session.query(nova_models.Instance).filter_by(deleted=False)
+def _instance_list_filter(query, filters):
+    """Filters an instance query by the filters of
+    instance_list_get_all_filtered."""
+    if 'display_name' in filters:
+        name = filters['display_name']
+        for char in ('\\', '%', '_'):
+            name = name.replace(char, '\\' + char)
+        query = query.filter(Instance.display_name.like(name + '%',
+                                                        escape='\\'))
+    if 'vm_state' in filters:
+        query = query.filter(Instance.vm_state == filters['vm_state'])
+    if 'changes-since' in filters:
+        query = query.filter(Instance.updated_at > filters['changes-since'])
+    if 'flavorid' in filters:
+        flavors = select([InstanceTypes.id],
+                         InstanceTypes.flavorid == filters['flavorid'])
+        query = query.filter(Instance.instance_type_id.in_(flavors))
+    if 'image_ref' in filters:
+        query = query.filter(Instance.image_ref == filters['image_ref'])
+    if 'fixed_ip' in filters:
+        addresses = select([FixedIp.instance_id],
+                           FixedIp.address == filters['fixed_ip'])
+        query = query.filter(Instance.id.in_(addresses))
+    if 'project_id' in filters:
+        query = query.filter(Instance.project_id == filters['project_id'])
+    return query
 
-    if not context.is_admin:
-        if context.project_id:
-            results = query.filter_by(project_id=context.project_id).all()
-        else:
-            results = query.filter_by(user_id=context.user_id).all()
-    else:
-        results = query.all()
 
-    return dict((result['id'], result['power_state']) for result in results)
+@require_context
+def instance_list_get_all_filtered(context, marker=None, limit=None,
+                                   filters=None):
+    """Returns the columns needed to list instances, in a single query.
+
+    Each instance is joined with its guest status, flavor and volume so the
+    instances API doesn't have to go back to the database for them. The
+    rows have the attributes id, uuid, name, hostname, vm_state, task_state,
+    created_at, updated_at, flavorid, guest_state and volume_size. An
+    instance with more than one volume appears once per volume.
+
+    :param marker: uuid of the last instance of the previous page
+    :param limit: maximum number of instances to return
+    :param filters: dict of the instances to list, which may have the keys
+                    display_name (a prefix of the name), vm_state,
+                    changes-since (instances updated after that time),
+                    flavorid, image_ref, fixed_ip (an address of the
+                    instance) and project_id
+    """
+    session = get_session()
+    instances = session.query(Instance.id).\
+                        filter(Instance.deleted == False)
+    instances = _instance_scope(context, instances)
+    instances = _instance_list_filter(instances, filters or {})
+    # Page over the instances rather than the joined rows, so an instance
+    # with several volumes takes a single place in the page.
+    page = _instance_keyset_paginate(context, session, instances, marker,
+                                     limit).subquery()
+
+    query = session.query(Instance.id,
+                          Instance.uuid,
+                          Instance.display_name.label('name'),
+                          Instance.hostname,
+                          Instance.vm_state,
+                          Instance.task_state,
+                          Instance.created_at,
+                          Instance.updated_at,
+                          InstanceTypes.flavorid,
+                          models.GuestStatus.state.label('guest_state'),
+                          Volume.size.label('volume_size')).\
+                    join((page, page.c.id == Instance.id)).\
+                    outerjoin((InstanceTypes,
+                               Instance.instance_type_id == InstanceTypes.id)).\
+                    outerjoin((models.GuestStatus,
+                               and_(models.GuestStatus.instance_id ==
+                                    Instance.id,
+                                    models.GuestStatus.deleted == False))).\
+                    outerjoin((Volume,
+                               and_(Volume.instance_id == Instance.id,
+                                    Volume.deleted == False)))
+    return query.order_by(Instance.created_at, Instance.id).all()
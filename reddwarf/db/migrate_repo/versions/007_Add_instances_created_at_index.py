@@ -0,0 +1,39 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+
+meta = MetaData()
+
+INDEX_NAME = 'instances_created_at_id_idx'
+
+
+def _index(migrate_engine):
+    instances_table = Table('instances', meta, autoload=True,
+                            autoload_with=migrate_engine)
+    return Index(INDEX_NAME, instances_table.c.created_at,
+                 instances_table.c.id)
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    _index(migrate_engine).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    _index(migrate_engine).drop(migrate_engine)
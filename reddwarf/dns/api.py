@@ -61,6 +61,14 @@ class API(base.Base):
                   'args': {'instance': converted_instance,
                            'content': content}})
 
+    def delete_entry(self, context, name, type='A'):
+        """Make an asynchronous call to delete an entry by its name."""
+        LOG.debug("Deleting entry %s of type %s" % (name, type))
+        rpc.cast(context,  FLAGS.dns_topic,
+                 {'method': 'delete_entry',
+                  'args': {'name': name,
+                           'type': type}})
+
     def delete_instance_entry(self, context, instance, content):
         """Make an asynchronous call to delete an entry for an instance."""
         LOG.debug("Deleting instance entry for instance %s, with content %s"
@@ -66,3 +66,8 @@ class DnsManager(Manager):
         if entry:
             entry.content = content
             self.driver.delete_entry(entry.name, entry.type)
+
+    def delete_entry(self, context, name, type):
+        """Removes a DNS entry by its name."""
+        LOG.debug("Deleting entry %s of type %s" % (name, type))
+        self.driver.delete_entry(name, type)
@@ -19,6 +19,10 @@
 Handles all request to the Platform or Guest VM
 """
 
+import time
+
+from eventlet import greenthread
+from eventlet import timeout
 
 from nova import flags
 from nova import log as logging
@@ -28,10 +32,63 @@ from nova.db import base
 
 from reddwarf import rpc as reddwarf_rpc
 from reddwarf import exception
+from reddwarf.db import api as reddwarf_dbapi
 
 FLAGS = flags.FLAGS
+flags.DEFINE_integer('guest_routing_key_cache_size', 10000,
+                     'Most guest routing keys cached by the guest API.')
+flags.DEFINE_integer('guest_summary_time_out', 10,
+                     'Seconds to wait for a guest to report its databases, '
+                     'users and root access, after which whatever it has '
+                     'not reported is left out.')
 LOG = logging.getLogger('nova.guest.api')
 
+# Maps instance ids, as strings, to the routing key of their guest. The
+# hostname of an instance never changes once it is created, so entries are
+# only dropped when the instance is deleted.
+_ROUTING_KEYS = {}
+
+# The parts of a guest summary and the calls reporting each of them, for
+# guests without get_guest_summary.
+SUMMARY_CALLS = {'databases': 'list_databases',
+                 'users': 'list_users',
+                 'root_enabled': 'is_root_enabled'}
+
+
+def _routing_key(hostname):
+    return "guest.%s" % hostname.split(".")[0]
+
+
+def _cache_routing_key(id, key):
+    if len(_ROUTING_KEYS) >= FLAGS.guest_routing_key_cache_size:
+        _ROUTING_KEYS.popitem()
+    _ROUTING_KEYS[str(id)] = key
+
+
+def _page_args(limit, marker):
+    """The args of a listing call. Only those given are passed, as guests
+    from before pagination accept none."""
+    args = {}
+    if limit is not None:
+        args["limit"] = limit
+    if marker is not None:
+        args["marker"] = marker
+    return args
+
+
+def _page(items, limit, marker):
+    """Pages a listing in full from a guest without pagination."""
+    if marker is not None:
+        items = [item for item in items if item['_name'] > marker]
+    if limit is not None:
+        items = items[:limit]
+    return items
+
+
+def forget_routing_key(id):
+    """Drops the cached routing key of an instance which is deleted."""
+    _ROUTING_KEYS.pop(str(id), None)
+
 
 class API(base.Base):
     """API for interacting with the guest manager."""
@@ -41,8 +98,34 @@ class API(base.Base):
 
     def _get_routing_key(self, context, id):
         """Create the routing key based on the container id"""
-        instance_ref = dbapi.instance_get(context, id)
-        return "guest.%s" % instance_ref['hostname'].split(".")[0]
+        key = _ROUTING_KEYS.get(str(id))
+        if key is None:
+            instance_ref = dbapi.instance_get(context, id)
+            key = _routing_key(instance_ref['hostname'])
+            _cache_routing_key(id, key)
+        return key
+
+    def _get_routing_keys(self, context, ids):
+        """Returns a dict of the routing key of each container id, looking
+           up all those not cached in a single query. Ids of containers
+           which do not exist are left out. Requires an admin context."""
+        keys = {}
+        missing = []
+        for id in ids:
+            key = _ROUTING_KEYS.get(str(id))
+            if key is None:
+                missing.append(id)
+            else:
+                keys[id] = key
+        if missing:
+            hostnames = reddwarf_dbapi.instance_get_hostnames(context,
+                                                              missing)
+            for id in missing:
+                hostname = hostnames.get(int(id))
+                if hostname is not None:
+                    keys[id] = _routing_key(hostname)
+                    _cache_routing_key(id, keys[id])
+        return keys
 
     def create_user(self, context, id, users):
         """Make an asynchronous call to create a new database user"""
@@ -52,11 +135,15 @@ class API(base.Base):
                   "args": {"users": users}
                  })
 
-    def list_users(self, context, id):
-        """Make an asynchronous call to list database users"""
+    def list_users(self, context, id, limit=None, marker=None):
+        """Make a synchronous call to list database users, at most limit
+           of them named after marker should either be given"""
         LOG.debug("Listing Users for Instance %s", id)
-        return rpc.call(context, self._get_routing_key(context, id),
-                 {"method": "list_users"})
+        msg = {"method": "list_users"}
+        args = _page_args(limit, marker)
+        if args:
+            msg["args"] = args
+        return rpc.call(context, self._get_routing_key(context, id), msg)
 
     def delete_user(self, context, id, user):
         """Make an asynchronous call to delete an existing database user"""
@@ -76,11 +163,15 @@ class API(base.Base):
                   "args": {"databases": databases}
                  })
 
-    def list_databases(self, context, id):
-        """Make an asynchronous call to list database users"""
-        LOG.debug("Listing Users for Instance %s", id)
-        return rpc.call(context, self._get_routing_key(context, id),
-                 {"method": "list_databases"})
+    def list_databases(self, context, id, limit=None, marker=None):
+        """Make a synchronous call to list databases, at most limit of
+           them named after marker should either be given"""
+        LOG.debug("Listing Databases for Instance %s", id)
+        msg = {"method": "list_databases"}
+        args = _page_args(limit, marker)
+        if args:
+            msg["args"] = args
+        return rpc.call(context, self._get_routing_key(context, id), msg)
 
     def delete_database(self, context, id, database):
         """Make an asynchronous call to delete an existing database
@@ -113,6 +204,87 @@ class API(base.Base):
         return rpc.call(context, self._get_routing_key(context, id),
                  {"method": "is_root_enabled"})
 
+    def get_guest_summary(self, context, id, parts, time_out=None,
+                          if_version=None, limit=None, marker=None):
+        """Make a synchronous call to get the databases, users and root
+           access of the container, as asked for in parts
+
+        Returns a dict of each part, which is None when the guest did not
+        report it within time_out seconds, and of the version of the parts
+        reported. Should the version still be if_version the parts are left
+        out and not_modified is set instead. Should limit or marker be
+        given the databases and users are only the page of at most limit
+        named after marker. Guests without get_guest_summary are called for
+        each part at once, and give no version.
+        """
+        LOG.debug("Getting %s for Instance %s", ", ".join(parts), id)
+        topic = self._get_routing_key(context, id)
+        if time_out is None:
+            time_out = FLAGS.guest_summary_time_out
+        deadline = time.time() + time_out
+        summary = dict((part, None) for part in parts)
+        summary['version'] = None
+        args = {"parts": list(parts)}
+        if if_version is not None:
+            args["if_version"] = if_version
+        args.update(_page_args(limit, marker))
+        call = greenthread.spawn(self._timed_call, context, topic,
+                                 "get_guest_summary", args)
+        try:
+            reply = self._wait(call, deadline)
+            if reply.get('not_modified'):
+                return reply
+            summary.update(reply)
+            return summary
+        except rpc.RemoteError as err:
+            if err.exc_type != "NotFound":
+                raise
+            LOG.debug("Guest %s has no get_guest_summary, calling it for "
+                      "each part", topic)
+        except timeout.Timeout:
+            LOG.error("Guest %s did not report its summary within %s "
+                      "seconds" % (topic, time_out))
+            return summary
+        calls = dict((part, greenthread.spawn(self._timed_call, context,
+                                              topic, SUMMARY_CALLS[part]))
+                     for part in parts)
+        for part, call in calls.iteritems():
+            try:
+                summary[part] = self._wait(call, deadline)
+                if part in ('databases', 'users'):
+                    summary[part] = _page(summary[part], limit, marker)
+            except timeout.Timeout:
+                LOG.error("Guest %s did not report %s within %s seconds"
+                          % (topic, part, time_out))
+            except Exception as err:
+                LOG.error("Guest %s failed to report %s: %s"
+                          % (topic, part, err))
+        return summary
+
+    def _timed_call(self, context, topic, method, args=None):
+        msg = {"method": method}
+        if args is not None:
+            msg["args"] = args
+        start = time.time()
+        try:
+            return rpc.call(context, topic, msg)
+        finally:
+            LOG.debug("Call of %s on %s took %.3f seconds"
+                      % (method, topic, time.time() - start))
+
+    @staticmethod
+    def _wait(call, deadline):
+        """Returns the result of the call, raising Timeout should the
+           deadline pass first. A call which times out is killed, since
+           rpc.call would otherwise hold its connection until the guest
+           replies, which a dead guest never does."""
+        try:
+            with timeout.Timeout(max(0, deadline - time.time())):
+                return call.wait()
+        except timeout.Timeout:
+            call.kill()
+            raise
+
     def get_diagnostics(self, context, id):
         """Make a synchronous call to get diagnostics for the container"""
         LOG.debug("Check diagnostics on Instance %s", id)
@@ -166,3 +338,11 @@ class API(base.Base):
         topic = self._get_routing_key(context, id)
         LOG.debug("Sending an upgrade call to nova-guest %s", topic)
         reddwarf_rpc.cast_with_consumer(context, topic, {"method": "upgrade"})
+
+    def upgrade_all(self, context, ids):
+        """Make an asynchronous call to self upgrade the guest agent of
+           each of the containers"""
+        for id, topic in self._get_routing_keys(context, ids).iteritems():
+            LOG.debug("Sending an upgrade call to nova-guest %s", topic)
+            reddwarf_rpc.cast_with_consumer(context, topic,
+                                            {"method": "upgrade"})
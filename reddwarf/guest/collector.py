@@ -0,0 +1,112 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Collects the status reported by the Guest VMs and writes it to the database
+
+The :py:class:`GuestStatusCollector` class is a :py:class:`nova.manager.Manager`
+that receives status changes and heartbeats from the guests over RPC. Reports
+are coalesced in memory, keeping only the latest state for each guest, and
+flushed periodically as a couple of bulk updates rather than a write per guest.
+Heartbeats carry the guest's state as well, so a state change whose report was
+lost, or still pending when the collector stopped, is written by the next one.
+The compute nodes are then told which guests changed state, so provisioning
+waiting on a guest resumes without polling.
+
+**Related Flags**
+
+:guest_status_topic:  Topic the collector listens on.
+:guest_status_flush_interval:  Seconds between flushes to the database.
+
+"""
+
+from nova import context
+from nova import flags
+from nova import log as logging
+from nova import manager
+from nova import utils
+
+from reddwarf.db import api as dbapi
+from reddwarf.utils import publish_status_change
+from reddwarf.utils import status_key
+
+
+LOG = logging.getLogger('reddwarf.guest.collector')
+FLAGS = flags.FLAGS
+flags.DEFINE_string('guest_status_topic', 'guest_status',
+                    'the topic the guest status collector listens on')
+flags.DEFINE_integer('guest_status_flush_interval', 5,
+                     'Seconds between writes of the collected guest statuses')
+
+
+class GuestStatusCollector(manager.Manager):
+
+    """Coalesces guest status reports into bulk database updates."""
+
+    def __init__(self, *args, **kwargs):
+        self.pending_states = {}
+        self.pending_heartbeats = {}
+        self.flusher = None
+        super(GuestStatusCollector, self).__init__(*args, **kwargs)
+
+    def init_host(self):
+        """Start flushing the collected statuses periodically"""
+        self.flusher = utils.LoopingCall(self.flush)
+        self.flusher.start(interval=FLAGS.guest_status_flush_interval,
+                           now=False)
+
+    def update_status(self, context, instance_id, state, description=None):
+        """Record a change in the state of a guest"""
+        self.pending_states[instance_id] = (state, description)
+
+    def heartbeat(self, context, instance_id, state=None):
+        """Record that a guest is alive and its state is unchanged. Older
+           guests send no state, only refreshing the timestamp."""
+        self.pending_heartbeats[instance_id] = state
+
+    def flush(self):
+        """Write the collected statuses to the database"""
+        changes, self.pending_states = self.pending_states, {}
+        heartbeats, self.pending_heartbeats = self.pending_heartbeats, {}
+        states = dict(changes)
+        alive = set()
+        for instance_id, state in heartbeats.items():
+            # A state change refreshes the timestamp as well.
+            if instance_id in states:
+                continue
+            if state is None:
+                alive.add(instance_id)
+            else:
+                states[instance_id] = (state, None)
+        if not states and not alive:
+            return
+        LOG.debug("Flushing %d guest state changes and %d heartbeats"
+                  % (len(changes), len(heartbeats)))
+        try:
+            dbapi.guest_status_update_many(states, alive)
+        except Exception:
+            LOG.exception("Unable to flush the guest statuses, will retry")
+            # Keep any newer reports received while flushing.
+            for instance_id, status in changes.items():
+                self.pending_states.setdefault(instance_id, status)
+            for instance_id, state in heartbeats.items():
+                self.pending_heartbeats.setdefault(instance_id, state)
+            return
+        if changes:
+            keys = [status_key('guest_status', instance_id)
+                    for instance_id in changes]
+            publish_status_change(context.get_admin_context(), *keys)
@@ -26,9 +26,11 @@ handles RPC calls relating to Platform specific operations.
 """
 
 
+import functools
 import os
 import re
 import sys
+import time
 import uuid
 
 from datetime import date
@@ -37,29 +39,79 @@ from sqlalchemy import exc
 from sqlalchemy import interfaces
 from sqlalchemy.sql.expression import text
 
+from nova import context
 from nova import flags
 from nova import log as logging
+from nova import rpc
+from nova import utils
 from nova.compute import power_state
 from nova.exception import ProcessExecutionError
 
-from reddwarf.db import api as dbapi
-from reddwarf.guest import utils as guest_utils, utils
+from reddwarf.guest import utils as guest_utils
 from reddwarf.guest.db import models
 
 ADMIN_USER_NAME = "os_admin"
 LOG = logging.getLogger('nova.guest.dbaas')
+
 FLAGS = flags.FLAGS
+flags.DECLARE('guest_status_topic', 'reddwarf.guest.collector')
+flags.DEFINE_integer('guest_status_heartbeat_interval', 300,
+                     'Seconds between liveness reports while the state of '
+                     'the guest is unchanged')
+flags.DEFINE_boolean('guest_sql_echo', False,
+                     'Log every SQL statement the guest agent runs')
+flags.DEFINE_integer('guest_user_batch_size', 100,
+                     'Most users created, or granted access to a database, '
+                     'by a single statement')
+flags.DEFINE_integer('guest_result_cache_ttl', 60,
+                     'Seconds the guest agent keeps its listings of databases '
+                     'and users before reading them again, to catch changes '
+                     'not made through the agent. 0 keeps them until the '
+                     'agent changes them.')
+flags.DEFINE_integer('guest_result_cache_max_pages', 100,
+                     'Most pages of paged database and user listings the '
+                     'guest agent keeps, dropping the oldest read first.')
 FLUSH = text("""FLUSH PRIVILEGES;""")
+# Statements writing to the grant tables directly, which only take effect
+# once the privileges are flushed.
+GRANT_TABLE_CHANGE = re.compile(r"^\s*(INSERT\s+INTO|REPLACE\s+INTO|UPDATE|"
+                                r"DELETE\s+FROM)\s+`?mysql`?\.",
+                                re.IGNORECASE)
+
+# The parts of get_guest_summary and the methods reading them.
+SUMMARY_PARTS = ('databases', 'users', 'root_enabled')
+SUMMARY_READERS = {'databases': '_list_databases',
+                   'users': '_list_users',
+                   'root_enabled': '_is_root_enabled'}
+# The parts which may be read a page at a time.
+PAGED_PARTS = ('databases', 'users')
 
 ENGINE = None
+ADMIN_PASSWORD = None
+RESULT_CACHE = None
 MYSQLD_ARGS = None
 PREPARING = False
+LAST_REPORTED = None
 
 
 def generate_random_password():
     return str(uuid.uuid4())
 
 
+def get_admin_password():
+        """Return the admin user password, read from my.cnf only once"""
+        global ADMIN_PASSWORD
+        if ADMIN_PASSWORD is None:
+            pwd, err = utils.execute("sudo", "awk",
+                                     "/password\\t=/{print $3}",
+                                     "/etc/mysql/my.cnf")
+            if err:
+                LOG.error(_(err))
+                return None
+            ADMIN_PASSWORD = pwd.strip()
+        return ADMIN_PASSWORD
+
+
 def get_engine():
         """Create the default engine with the updated admin user"""
         #TODO(rnirmal):Based on permissions issues being resolved we may revert
@@ -69,18 +121,182 @@ def get_engine():
         if ENGINE:
             return ENGINE
         #ENGINE = create_engine(name_or_url=url)
-        pwd, err = utils.execute("sudo", "awk", "/password\\t=/{print $3}",
-                                 "/etc/mysql/my.cnf")
-        if not err:
+        pwd = get_admin_password()
+        if pwd is not None:
             ENGINE = create_engine("mysql://%s:%s@localhost:3306" %
-                                   (ADMIN_USER_NAME, pwd.strip()),
-                                   pool_recycle=7200, echo=True,
+                                   (ADMIN_USER_NAME, pwd),
+                                   pool_recycle=7200,
+                                   echo=FLAGS.guest_sql_echo,
                                    listeners=[KeepAliveConnection()])
-        else:
-            LOG.error(_(err))
         return ENGINE
 
 
+def get_result_cache():
+    """Return the cache of the agent's reads, created only once"""
+    global RESULT_CACHE
+    if RESULT_CACHE is None:
+        RESULT_CACHE = ResultCache(FLAGS.guest_result_cache_ttl,
+                                   FLAGS.guest_result_cache_max_pages)
+    return RESULT_CACHE
+
+
+def invalidates_results(f):
+    """Drop the cached reads once the decorated method, which may change
+       them, has run"""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        finally:
+            get_result_cache().invalidate()
+    return wrapper
+
+
+def _page_params(limit, marker):
+    """Return the bind parameters of a page of a listing"""
+    params = {}
+    if limit is not None:
+        params['limit'] = limit
+    if marker is not None:
+        params['marker'] = marker
+    return params
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _validate_user(item, names):
+    """Return the name of the serialized user and why it cannot be created,
+       or None if it can, given the names of the users already valid"""
+    user = models.MySQLUser()
+    name = item.get('_name')
+    try:
+        user.name = name
+        user.password = item.get('_password')
+        for database in item.get('_databases', []):
+            user.databases = database.get('_name')
+    except (ValueError, TypeError, AttributeError) as err:
+        return name, str(err)
+    if name in names:
+        return name, "User %s is given more than once" % name
+    return name, None
+
+
+def _existing_users(client, names, host, batch_size):
+    """Return which of the named users already exist"""
+    existing = []
+    for batch in _batches(names, batch_size):
+        params = dict(("user%d" % i, name) for i, name in enumerate(batch))
+        t = text("""SELECT User FROM mysql.user WHERE Host = :host
+                    AND User IN (%s);"""
+                 % ", ".join(":%s" % param for param in sorted(params)))
+        result = client.execute(t, host=host, **params)
+        existing.extend(row['User'] for row in result)
+    return existing
+
+
+def _execute_for_users(client, errors, statement, users, user_clause,
+                       succeeded=None):
+    """Run the statement for all the users at once, falling back to each
+       user alone should that fail, recording the error of each user which
+       fails in errors. The users are listed in the statement by the
+       clauses user_clause returns, along with their parameters, given the
+       position and the user. MySQL carries out such a statement for the
+       users it can even when it fails for others, so succeeded, if given,
+       returns which of the users it did not fail for."""
+    def execute(users):
+        clauses = []
+        params = {}
+        for i, user in enumerate(users):
+            clause, user_params = user_clause(i, user)
+            clauses.append(clause)
+            params.update(user_params)
+        client.execute(text(statement % ", ".join(clauses)), **params)
+    try:
+        execute(users)
+        return
+    except Exception as err:
+        if len(users) == 1:
+            errors[users[0]['_name']] = str(err)
+            return
+        LOG.debug("Falling back to one user at a time: %s" % err)
+    if succeeded is not None:
+        done = succeeded(users)
+        users = [user for user in users if user['_name'] not in done]
+    for user in users:
+        try:
+            execute([user])
+        except Exception as err:
+            errors[user['_name']] = str(err)
+
+
+class ResultCache(object):
+    """Results of the agent's reads, along with a version which changes
+       whenever they may have
+
+    Every change made through the agent drops the results. Should a ttl be
+    given they are also read again once that old, the version changing if
+    they differ, to catch changes made some other way. Pages, which are
+    cached under (part, limit, marker) keys, are kept to max_pages as the
+    pages asked for are up to the client.
+    """
+
+    def __init__(self, ttl, max_pages=None):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        # Tells the versions of agents started at different times apart.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.revision = 0
+        self.generation = 0
+        self.results = {}
+
+    @property
+    def version(self):
+        return "%s-%d" % (self.epoch, self.revision)
+
+    def get(self, part):
+        """Return the cached result, raising KeyError if none is fresh"""
+        value, read_at = self.results[part]
+        if self._expired(read_at):
+            raise KeyError(part)
+        return value
+
+    def _expired(self, read_at):
+        return self.ttl and time.time() - read_at >= self.ttl
+
+    def set(self, part, value, generation):
+        """Cache a result read at the given generation, unless the results
+           have been dropped since"""
+        if generation != self.generation:
+            return
+        if part in self.results and self.results[part][0] != value:
+            self.revision += 1
+        self.results[part] = (value, time.time())
+        if isinstance(part, tuple):
+            self._prune_pages()
+
+    def _prune_pages(self):
+        """Drop the expired pages, and the oldest beyond max_pages. Only
+           pages are dropped, as the other parts are kept to be compared
+           with when they are read again."""
+        pages = sorted((read_at, key)
+                       for key, (value, read_at) in self.results.items()
+                       if isinstance(key, tuple))
+        excess = 0
+        if self.max_pages is not None:
+            excess = max(0, len(pages) - self.max_pages)
+        for index, (read_at, key) in enumerate(pages):
+            if index < excess or self._expired(read_at):
+                del self.results[key]
+
+    def invalidate(self):
+        self.results.clear()
+        self.generation += 1
+        self.revision += 1
+
+
 def load_mysqld_options():
     try:
         out, err = utils.execute("/usr/sbin/mysqld", "--print-defaults", run_as_root=True)
@@ -100,47 +316,107 @@ def load_mysqld_options():
 class DBaaSAgent(object):
     """ Database as a Service Agent Controller """
 
+    @invalidates_results
     def create_user(self, users):
         """Create users and grant them privileges for the
-           specified databases"""
+           specified databases
+
+        Every user is validated before any is created. Users are then
+        created, and granted access to each database, up to
+        guest_user_batch_size at a time by a single statement. Should such
+        a statement fail its users are tried one at a time, so only those
+        at fault fail.
+
+        Returns a list of the name and error of each user, the error being
+        None for those created.
+        """
         host = "%"
+        results = []
+        valid = []
+        names = set()
+        for item in users:
+            name, error = _validate_user(item, names)
+            results.append({'name': name, 'error': error})
+            if error is None:
+                valid.append(item)
+                names.add(name)
+        errors = {}
+        batch_size = FLAGS.guest_user_batch_size
         client = LocalSqlClient(get_engine())
         with client:
-            for item in users:
-                user = models.MySQLUser()
-                user.deserialize(item)
-                # TODO(cp16net):Should users be allowed to create users
-                # 'os_admin' or 'debian-sys-maint'
-                t = text("""CREATE USER `%s`@:host IDENTIFIED BY '%s';"""
-                         % (user.name, user.password))
-                client.execute(t, host=host)
-                for database in user.databases:
-                    mydb = models.MySQLDatabase()
-                    mydb.deserialize(database)
-                    t = text("""
-                            GRANT ALL PRIVILEGES ON `%s`.* TO `%s`@:host;"""
-                            % (mydb.name, user.name))
-                    client.execute(t, host=host)
-
-    def list_users(self):
-        """List users that have access to the database"""
+            names = [user['_name'] for user in valid]
+            for name in _existing_users(client, names, host, batch_size):
+                errors[name] = "User %s already exists" % name
+            valid = [user for user in valid if user['_name'] not in errors]
+
+            def new_user(i, user):
+                return (":user%d@:host IDENTIFIED BY :password%d" % (i, i),
+                        {'host': host, 'user%d' % i: user['_name'],
+                         'password%d' % i: user['_password']})
+
+            def grantee(i, user):
+                return (":user%d@:host" % i,
+                        {'host': host, 'user%d' % i: user['_name']})
+
+            # TODO(cp16net):Should users be allowed to create users
+            # 'os_admin' or 'debian-sys-maint'
+            def created(users):
+                return _existing_users(client,
+                                       [user['_name'] for user in users],
+                                       host, batch_size)
+
+            for batch in _batches(valid, batch_size):
+                _execute_for_users(client, errors, "CREATE USER %s;", batch,
+                                   new_user, created)
+            grantees = {}
+            for user in valid:
+                if user['_name'] not in errors:
+                    for database in user['_databases']:
+                        grantees.setdefault(database['_name'], []).append(user)
+            for database, grantee_users in sorted(grantees.items()):
+                statement = "GRANT ALL PRIVILEGES ON `%s`.* TO %%s;" % database
+                for batch in _batches(grantee_users, batch_size):
+                    _execute_for_users(client, errors, statement, batch,
+                                       grantee)
+        for result in results:
+            if result['error'] is None:
+                result['error'] = errors.get(result['name'])
+            if result['error']:
+                LOG.error("Unable to create user %s: %s"
+                          % (result['name'], result['error']))
+        return results
+
+    def list_users(self, limit=None, marker=None):
+        """List users that have access to the database, at most limit of
+           them named after marker should either be given"""
+        return self._read(['users'], raise_errors=True, limit=limit,
+                          marker=marker)['users']
+
+    def _list_users(self, client, limit=None, marker=None):
         LOG.debug("---Listing Users---")
         users = []
-        client = LocalSqlClient(get_engine())
-        with client:
-            mysql_user = models.MySQLUser()
+        if limit is None and marker is None:
             t = text("""select User from mysql.user where host !=
                      'localhost';""")
-            result = client.execute(t)
-            LOG.debug("result = " + str(result))
-            for row in result:
-                LOG.debug("user = " + str(row))
-                mysql_user = models.MySQLUser()
-                mysql_user.name = row['User']
-                users.append(mysql_user.serialize())
+        else:
+            # A user may be allowed in from several hosts, but should only
+            # take up one place in a page.
+            t = text("""SELECT DISTINCT User FROM mysql.user
+                        WHERE Host != 'localhost'
+                        %s ORDER BY User %s;"""
+                     % ("AND User > :marker" if marker is not None else "",
+                        "LIMIT :limit" if limit is not None else ""))
+        result = client.execute(t, **_page_params(limit, marker))
+        LOG.debug("result = " + str(result))
+        for row in result:
+            LOG.debug("user = " + str(row))
+            mysql_user = models.MySQLUser()
+            mysql_user.name = row['User']
+            users.append(mysql_user.serialize())
         LOG.debug("users = " + str(users))
         return users
 
+    @invalidates_results
     def delete_user(self, user):
         """Delete the specified users"""
         client = LocalSqlClient(get_engine())
@@ -150,6 +426,7 @@ class DBaaSAgent(object):
             t = text("""DROP USER `%s`""" % mysql_user.name)
             client.execute(t)
 
+    @invalidates_results
     def create_database(self, databases):
         """Create the list of specified databases"""
         client = LocalSqlClient(get_engine())
@@ -162,41 +439,49 @@ class DBaaSAgent(object):
                          % (mydb.name, mydb.character_set, mydb.collate))
                 client.execute(t)
 
-    def list_databases(self):
-        """List databases the user created on this mysql instance"""
+    def list_databases(self, limit=None, marker=None):
+        """List databases the user created on this mysql instance, at most
+           limit of them named after marker should either be given"""
+        return self._read(['databases'], raise_errors=True, limit=limit,
+                          marker=marker)['databases']
+
+    def _list_databases(self, client, limit=None, marker=None):
         LOG.debug("---Listing Databases---")
         databases = []
-        client = LocalSqlClient(get_engine())
-        with client:
-            # If you have an external volume mounted at /var/lib/mysql
-            # the lost+found directory will show up in mysql as a database
-            # which will create errors if you try to do any database ops
-            # on it.  So we remove it here if it exists.
-            t = text('''
-            SELECT
-                schema_name as name,
-                default_character_set_name as charset,
-                default_collation_name as collation
-            FROM
-                information_schema.schemata
-            WHERE
-                schema_name not in
-                ('mysql', 'information_schema', 'lost+found')
-            ORDER BY
-                schema_name ASC;
-            ''')
-            database_names = client.execute(t)
-            LOG.debug("database_names = %r" % database_names)
-            for database in database_names:
-                LOG.debug("database = %s " % str(database))
-                mysql_db = models.MySQLDatabase()
-                mysql_db.name = database[0]
-                mysql_db.character_set = database[1]
-                mysql_db.collate = database[2]
-                databases.append(mysql_db.serialize())
+        # If you have an external volume mounted at /var/lib/mysql
+        # the lost+found directory will show up in mysql as a database
+        # which will create errors if you try to do any database ops
+        # on it.  So we remove it here if it exists.
+        t = text('''
+        SELECT
+            schema_name as name,
+            default_character_set_name as charset,
+            default_collation_name as collation
+        FROM
+            information_schema.schemata
+        WHERE
+            schema_name not in
+            ('mysql', 'information_schema', 'lost+found')
+            %s
+        ORDER BY
+            schema_name ASC
+        %s;
+        ''' % ("AND schema_name > :marker" if marker is not None else "",
+               "LIMIT :limit" if limit is not None else ""))
+        database_names = client.execute(t, **_page_params(limit,
+                                                           marker))
+        LOG.debug("database_names = %r" % database_names)
+        for database in database_names:
+            LOG.debug("database = %s " % str(database))
+            mysql_db = models.MySQLDatabase()
+            mysql_db.name = database[0]
+            mysql_db.character_set = database[1]
+            mysql_db.collate = database[2]
+            databases.append(mysql_db.serialize())
         LOG.debug("databases = " + str(databases))
         return databases
 
+    @invalidates_results
     def delete_database(self, database):
         """Delete the specified database"""
         client = LocalSqlClient(get_engine())
@@ -206,6 +491,7 @@ class DBaaSAgent(object):
             t = text("""DROP DATABASE `%s`;""" % mydb.name)
             client.execute(t)
 
+    @invalidates_results
     def enable_root(self):
         """Enable the root user global access and/or reset the root password"""
         host = "%"
@@ -230,6 +516,7 @@ class DBaaSAgent(object):
             client.execute(t, user=user.name, host=host)
             return user.serialize()
 
+    @invalidates_results
     def disable_root(self):
         """Disable root access apart from localhost"""
         host = "localhost"
@@ -247,14 +534,77 @@ class DBaaSAgent(object):
 
     def is_root_enabled(self):
         """Return True if root access is enabled; False otherwise."""
+        return self._read(['root_enabled'], raise_errors=True)['root_enabled']
+
+    def _is_root_enabled(self, client):
+        t = text("""SELECT User FROM mysql.user where User = 'root'
+                    and host != 'localhost';""")
+        result = client.execute(t)
+        LOG.debug("result = " + str(result))
+        return result.rowcount != 0
+
+    def get_guest_summary(self, parts=SUMMARY_PARTS, if_version=None,
+                          limit=None, marker=None):
+        """Return the databases, users and root access of the guest, as
+           asked for in parts, along with their version. A part which
+           cannot be read is None. Should the version still be if_version
+           only the version is returned, with not_modified set. Should
+           limit or marker be given only that page of the databases and
+           users is returned."""
+        # Should a change through the agent land while reading, the results
+        # may predate it, so they are given the version from before it.
+        cache = get_result_cache()
+        version, generation = cache.version, cache.generation
+        summary = self._read(parts, limit=limit, marker=marker)
+        if cache.generation == generation:
+            # Only reading results which had changed moved the version on.
+            version = cache.version
+        if if_version is not None and if_version == version:
+            return {'version': version, 'not_modified': True}
+        summary['version'] = version
+        return summary
+
+    def _read(self, parts, raise_errors=False, limit=None, marker=None):
+        """Return a dict of the parts, reading those not cached over a
+           single connection. A part which cannot be read is None unless
+           raise_errors is set. Paged parts are read limit at a time from
+           after marker, each page cached by itself."""
+        cache = get_result_cache()
+        results = {}
+        missing = []
+        keys = {}
+        for part in parts:
+            if part in PAGED_PARTS and (limit, marker) != (None, None):
+                keys[part] = (part, limit, marker)
+            else:
+                keys[part] = part
+            try:
+                results[part] = cache.get(keys[part])
+            except KeyError:
+                missing.append(part)
+        if not missing:
+            return results
+        generation = cache.generation
         client = LocalSqlClient(get_engine())
         with client:
-            mysql_user = models.MySQLUser()
-            t = text("""SELECT User FROM mysql.user where User = 'root'
-                        and host != 'localhost';""")
-            result = client.execute(t)
-            LOG.debug("result = " + str(result))
-            return result.rowcount != 0
+            for part in missing:
+                start = time.time()
+                reader = getattr(self, SUMMARY_READERS[part])
+                page = {}
+                if keys[part] != part:
+                    page = {'limit': limit, 'marker': marker}
+                try:
+                    results[part] = reader(client, **page)
+                except Exception:
+                    if raise_errors:
+                        raise
+                    LOG.exception(_("Error reading %s") % part)
+                    results[part] = None
+                else:
+                    cache.set(keys[part], results[part], generation)
+                LOG.debug("Read %s in %.3f seconds"
+                          % (part, time.time() - start))
+        return results
 
     def prepare(self, databases):
         """Makes ready DBAAS on a Guest container."""
@@ -270,44 +620,68 @@ class DBaaSAgent(object):
 
     def update_status(self):
         """Update the status of the MySQL service"""
-        global MYSQLD_ARGS
-        global PREPARING
         instance_id = guest_utils.get_instance_id()
+        self._report_status(instance_id, self._get_mysql_state())
 
+    def _get_mysql_state(self):
+        """Returns the power state matching the MySQL service"""
+        global MYSQLD_ARGS
         if PREPARING:
-            dbapi.guest_status_update(instance_id, power_state.BUILDING)
-            return
+            return power_state.BUILDING
 
         try:
             out, err = utils.execute("/usr/bin/mysqladmin", "ping", run_as_root=True)
-            dbapi.guest_status_update(instance_id, power_state.RUNNING)
+            return power_state.RUNNING
         except ProcessExecutionError as e:
             try:
                 out, err = utils.execute("ps", "-C", "mysqld", "h")
                 pid = out.split()[0]
                 # TODO(rnirmal): Need to create new statuses for instances where
                 # the mysql service is up, but unresponsive
-                dbapi.guest_status_update(instance_id, power_state.BLOCKED)
+                return power_state.BLOCKED
             except ProcessExecutionError as e:
                 if not MYSQLD_ARGS:
                     MYSQLD_ARGS = load_mysqld_options()
                 pid_file = MYSQLD_ARGS.get('pid-file', '/var/run/mysqld/mysqld.pid')
                 if os.path.exists(pid_file):
-                    dbapi.guest_status_update(instance_id, power_state.CRASHED)
+                    return power_state.CRASHED
                 else:
-                    dbapi.guest_status_update(instance_id, power_state.SHUTDOWN)
+                    return power_state.SHUTDOWN
+
+    def _report_status(self, instance_id, state):
+        """Send the state to the status collector if it has changed since
+           the last report, otherwise a heartbeat carrying it once due"""
+        global LAST_REPORTED
+        now = time.time()
+        if LAST_REPORTED is None or LAST_REPORTED[0] != state:
+            method = 'update_status'
+            args = {'instance_id': instance_id, 'state': state}
+        elif now - LAST_REPORTED[1] >= FLAGS.guest_status_heartbeat_interval:
+            method = 'heartbeat'
+            args = {'instance_id': instance_id, 'state': state}
+        else:
+            return
+        rpc.cast(context.get_admin_context(), FLAGS.guest_status_topic,
+                 {'method': method, 'args': args})
+        LAST_REPORTED = (state, now)
 
 
 class LocalSqlClient(object):
-    """A sqlalchemy wrapper to manage transactions"""
+    """A sqlalchemy wrapper to manage transactions
+
+    Privileges are flushed on commit only if a statement wrote to the grant
+    tables directly, GRANT and CREATE USER taking effect without a flush.
+    """
 
     def __init__(self, engine, use_flush=True):
         self.engine = engine
         self.use_flush = use_flush
+        self.grants_changed = False
 
     def __enter__(self):
         self.conn = self.engine.connect()
         self.trans = self.conn.begin()
+        self.grants_changed = False
         return self.conn
 
     def __exit__(self, type, value, traceback):
@@ -315,17 +689,20 @@ class LocalSqlClient(object):
             if type is not None:  # An error occurred
                 self.trans.rollback()
             else:
-                if self.use_flush:
+                if self.use_flush and self.grants_changed:
                     self.conn.execute(FLUSH)
                 self.trans.commit()
         self.conn.close()
 
     def execute(self, t, **kwargs):
+        if GRANT_TABLE_CHANGE.match(str(t)):
+            self.grants_changed = True
         try:
             return self.conn.execute(t, kwargs)
         except:
-            self.trans.rollback()
-            self.trans = None
+            if self.trans:
+                self.trans.rollback()
+                self.trans = None
             raise
 
 
@@ -357,7 +734,8 @@ class DBaaSPreparer(object):
 
     def __init__(self, pkg_agent):
         """ By default login with root no password for initial setup. """
-        self.engine = create_engine("mysql://root:@localhost:3306", echo=True)
+        self.engine = create_engine("mysql://root:@localhost:3306",
+                                    echo=FLAGS.guest_sql_echo)
         self.pkg = pkg_agent
 
     def _generate_root_password(self, client):
@@ -462,6 +840,7 @@ class DBaaSPreparer(object):
 
     def prepare(self):
         """Prepare the guest machine with a secure mysql server installation"""
+        global ADMIN_PASSWORD
         LOG.info(_("Preparing Guest as MySQL Server"))
         try:
             utils.execute("apt-get", "update", run_as_root=True)
@@ -480,5 +859,7 @@ class DBaaSPreparer(object):
             self._create_admin_user(client, admin_password)
 
         self._init_mycnf(admin_password)
+        # Remember the password so it need not be read back from my.cnf.
+        ADMIN_PASSWORD = admin_password
         self._restart_mysql()
         LOG.info(_("Dbaas preparation complete."))
@@ -15,13 +15,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
 from datetime import timedelta
 
+from eventlet import greenpool
+from eventlet import greenthread
+
 from nova import flags
 from nova import log as logging
 from nova import volume
 from nova import utils
+from reddwarf import exception
 from reddwarf.db import api as reddwarf_db
+from reddwarf.dns import api as dns_api
+from reddwarf.reaper import tasks as reaper_tasks
+from reddwarf.utils import RateBudget
 
 
 FLAGS = flags.FLAGS
@@ -31,6 +39,24 @@ LOG = logging.getLogger(__name__)
 flags.DEFINE_integer('reddwarf_reaper_orphan_volume_expiration_time',
                      60 * 60 * 24 * 7,
                      'Time until reaper will destroy orphaned volumes.')
+flags.DEFINE_integer('reddwarf_reaper_page_size', 100,
+                     'Orphaned volumes fetched from the database at a time.')
+flags.DEFINE_integer('reddwarf_reaper_concurrency', 4,
+                     'Most orphaned volumes deleted at once.')
+flags.DEFINE_integer('reddwarf_reaper_delete_rate', 5,
+                     'Most orphaned volumes deleted per second.')
+flags.DEFINE_integer('reddwarf_reaper_max_deletes_per_run', 500,
+                     'Most orphaned volumes deleted each time the reaper '
+                     'runs, leaving the rest to later runs.')
+flags.DEFINE_list('reddwarf_reaper_tasks',
+                  ['orphan_volumes', 'building_instances',
+                   'stale_guest_status'],
+                  'Reaper tasks to run, from orphan_volumes, '
+                  'building_instances, stale_guest_status and dns_records. '
+                  'Only add dns_records when instances are given DNS entries.')
+
+# Config entry holding the id of the last orphaned volume reaped.
+ORPHAN_VOLUME_CURSOR = 'reaper_orphan_volume_cursor'
 
 
 class ReaperDriver(object):
@@ -38,28 +64,119 @@ class ReaperDriver(object):
     def periodic_tasks(self, context):
         pass
 
+    def get_metrics(self):
+        return {}
+
 
 class ReddwarfReaperDriver(object):
     """
     Searches for failed resources.
     """
-    def __init__(self, orphan_time_out=None):
+    def __init__(self, orphan_time_out=None, task_names=None):
         self.volume_api = volume.API()
+        self.dns_api = dns_api.API()
         self.orphan_time_out = orphan_time_out or \
             FLAGS.reddwarf_reaper_orphan_volume_expiration_time
+        task_names = task_names or FLAGS.reddwarf_reaper_tasks
+        self.tasks = [reaper_tasks.TASKS[name](self) for name in task_names]
+        self._running = {}
+
+    def clean_up_volumes(self, context, deadline=None, concurrency=None):
+        """Deletes the volumes which are not associated to an instance.
 
-    def clean_up_volumes(self, context):
-        """Finds all volumes which are not associated to an instance."""
+        Orphans are paged through in order of id, starting after the id
+        kept in the config table, so a reaper stopped part way through
+        resumes where it left off. Once the last orphan has been reaped the
+        next run starts over from the beginning. No further page is started
+        once the deadline, if given, has passed.
+
+        Returns the number of orphans reaped.
+
+        """
         expiration_time = self.orphan_time_out
         latest_valid_time = utils.utcnow() - timedelta(seconds=expiration_time)
         LOG.debug("Preparing to delete orphaned volumes updated before %s" %
                   latest_valid_time)
-        volumes = reddwarf_db.volume_get_orphans(context, latest_valid_time)
-        if volumes:
+        cursor = self._get_orphan_cursor()
+        budget = RateBudget(FLAGS.reddwarf_reaper_delete_rate)
+        pool = greenpool.GreenPool(concurrency or
+                                   FLAGS.reddwarf_reaper_concurrency)
+        max_deletes = FLAGS.reddwarf_reaper_max_deletes_per_run
+        remaining = max_deletes
+        while remaining > 0:
+            if deadline is not None and time.time() >= deadline:
+                break
+            limit = min(FLAGS.reddwarf_reaper_page_size, remaining)
+            volumes = reddwarf_db.volume_get_orphans(context,
+                                                     latest_valid_time,
+                                                     marker=cursor,
+                                                     limit=limit)
             for volume_ref in volumes:
-                self.volume_api.delete(context, volume_ref['id'])
-                LOG.warn("Deleting an orphaned volume, %s with description %s" %
-                         (volume_ref['id'], volume_ref['display_description']))
+                pool.spawn_n(self._delete_orphan, context, volume_ref, budget)
+            pool.waitall()
+            remaining -= len(volumes)
+            if len(volumes) < limit:
+                self._set_orphan_cursor(0)
+                break
+            cursor = volumes[-1]['id']
+            self._set_orphan_cursor(cursor)
+        return max_deletes - remaining
+
+    def _delete_orphan(self, context, volume_ref, budget):
+        budget.acquire()
+        LOG.warn("Deleting an orphaned volume, %s with description %s" %
+                 (volume_ref['id'], volume_ref['display_description']))
+        try:
+            self.volume_api.delete(context, volume_ref['id'])
+        except Exception:
+            LOG.exception(_("Error deleting orphaned volume %s") %
+                          volume_ref['id'])
+
+    @staticmethod
+    def _get_orphan_cursor():
+        try:
+            return int(reddwarf_db.config_get(ORPHAN_VOLUME_CURSOR).value)
+        except exception.ConfigNotFound:
+            return 0
+
+    @staticmethod
+    def _set_orphan_cursor(volume_id):
+        try:
+            reddwarf_db.config_get(ORPHAN_VOLUME_CURSOR)
+        except exception.ConfigNotFound:
+            reddwarf_db.config_create(ORPHAN_VOLUME_CURSOR, str(volume_id),
+                                      "Id of the last orphaned volume "
+                                      "reaped")
+        else:
+            reddwarf_db.config_update(ORPHAN_VOLUME_CURSOR, str(volume_id))
 
     def periodic_tasks(self, context):
-        self.clean_up_volumes(context)
+        """Starts each task which is due in its own greenthread.
+
+        A task still running from an earlier call is skipped rather than
+        started twice.
+
+        """
+        now = time.time()
+        for task in self.tasks:
+            if task.name in self._running:
+                if task.is_due(now):
+                    task.stats['skipped'] += 1
+                continue
+            if task.is_due(now):
+                self._running[task.name] = greenthread.spawn(self._run_task,
+                                                             context, task)
+
+    def _run_task(self, context, task):
+        try:
+            task.run_once(context)
+        finally:
+            del self._running[task.name]
+
+    def wait(self):
+        """Waits for the tasks running to finish."""
+        for thread in self._running.values():
+            thread.wait()
+
+    def get_metrics(self):
+        return dict((task.name, task.get_metrics()) for task in self.tasks)
@@ -50,3 +50,7 @@ class ReaperManager(manager.SchedulerDependentManager):
         """Tasks to be run at a periodic interval."""
         super(ReaperManager, self).periodic_tasks(context)
         self.driver.periodic_tasks(context)
+
+    def get_task_metrics(self, context):
+        """Returns the run counts and run times of each reaper task."""
+        return self.driver.get_metrics()
@@ -0,0 +1,262 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cleanup tasks run by the reaper.
+
+Each task has its own interval, time budget and concurrency, read from the
+reddwarf_reaper_<name>_* flags, and keeps metrics of its runs. The driver
+runs each task in its own greenthread, so a slow task only delays its own
+next run.
+
+"""
+
+import time
+from datetime import timedelta
+
+from eventlet import greenpool
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+from nova.compute import power_state
+from nova.compute import vm_states
+from nova.notifier import api as notifier
+from reddwarf.db import api as reddwarf_db
+from reddwarf.utils import LatencyHistogram
+
+
+FLAGS = flags.FLAGS
+LOG = logging.getLogger(__name__)
+
+flags.DECLARE('dns_instance_entry_factory', 'reddwarf.dns')
+flags.DEFINE_integer('reddwarf_reaper_building_expiration_time', 60 * 60,
+                     'Time until reaper marks instances still building as '
+                     'failed.')
+
+TASKS = {}
+
+
+def register(cls):
+    """Class decorator adding a task to those the reaper can run."""
+    TASKS[cls.name] = cls
+    return cls
+
+
+def _define_task_flags(name, interval, time_budget, concurrency):
+    flags.DEFINE_integer('reddwarf_reaper_%s_interval' % name, interval,
+                         'Seconds between runs of the %s reaper task.' % name)
+    flags.DEFINE_integer('reddwarf_reaper_%s_time_budget' % name, time_budget,
+                         'Seconds the %s reaper task may run before it stops '
+                         'and leaves the rest to its next run.' % name)
+    if concurrency is not None:
+        flags.DEFINE_integer('reddwarf_reaper_%s_concurrency' % name,
+                             concurrency,
+                             'Most items the %s reaper task cleans up at '
+                             'once.' % name)
+
+
+class ReaperTask(object):
+    """A cleanup run by the reaper every interval seconds.
+
+    Subclasses set name and implement run, which cleans up what it can
+    before the deadline and returns the number of items cleaned up.
+
+    """
+
+    name = None
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.last_run_at = None
+        self.stats = {'runs': 0, 'failures': 0, 'items': 0, 'overruns': 0,
+                      'skipped': 0, 'last_run_time': None}
+        self.run_time = LatencyHistogram()
+
+    @property
+    def interval(self):
+        return getattr(FLAGS, 'reddwarf_reaper_%s_interval' % self.name)
+
+    @property
+    def time_budget(self):
+        return getattr(FLAGS, 'reddwarf_reaper_%s_time_budget' % self.name)
+
+    @property
+    def concurrency(self):
+        return getattr(FLAGS, 'reddwarf_reaper_%s_concurrency' % self.name)
+
+    def is_due(self, now):
+        return self.last_run_at is None or \
+               now - self.last_run_at >= self.interval
+
+    def run_once(self, context):
+        """Runs the task within its time budget and records its metrics."""
+        start = time.time()
+        self.last_run_at = start
+        items = 0
+        try:
+            items = self.run(context, start + self.time_budget)
+        except Exception:
+            self.stats['failures'] += 1
+            LOG.exception(_("Reaper task %s failed") % self.name)
+        elapsed = time.time() - start
+        self.stats['runs'] += 1
+        self.stats['items'] += items or 0
+        self.stats['last_run_time'] = elapsed
+        if elapsed > self.time_budget:
+            self.stats['overruns'] += 1
+            LOG.warn(_("Reaper task %(name)s ran for %(elapsed).1f seconds, "
+                       "over its budget of %(budget)s seconds") %
+                     {'name': self.name, 'elapsed': elapsed,
+                      'budget': self.time_budget})
+        self.run_time.record(elapsed)
+
+    def run(self, context, deadline):
+        raise NotImplementedError()
+
+    def get_metrics(self):
+        metrics = dict(self.stats)
+        metrics['interval'] = self.interval
+        metrics['time_budget'] = self.time_budget
+        metrics['run_time'] = self.run_time.to_dict()
+        return metrics
+
+    def _run_each(self, items, method, deadline):
+        """Calls method on each item, concurrency at a time, until the
+        deadline passes. Returns the number of items it was called on."""
+        pool = greenpool.GreenPool(self.concurrency)
+        count = 0
+        for item in items:
+            if time.time() >= deadline:
+                break
+            pool.spawn_n(method, item)
+            count += 1
+        pool.waitall()
+        return count
+
+
+_define_task_flags('orphan_volumes', 60, 5 * 60, None)
+
+
+@register
+class OrphanVolumeTask(ReaperTask):
+    """Deletes volumes left without an instance."""
+
+    name = 'orphan_volumes'
+
+    @property
+    def concurrency(self):
+        return FLAGS.reddwarf_reaper_concurrency
+
+    def run(self, context, deadline):
+        return self.driver.clean_up_volumes(context, deadline=deadline,
+                                            concurrency=self.concurrency)
+
+
+_define_task_flags('building_instances', 60, 60, 4)
+
+
+@register
+class BuildingInstanceTask(ReaperTask):
+    """Fails instances which have been building for too long."""
+
+    name = 'building_instances'
+
+    def run(self, context, deadline):
+        latest_valid_time = utils.utcnow() - \
+            timedelta(seconds=FLAGS.reddwarf_reaper_building_expiration_time)
+        instances = reddwarf_db.instance_get_by_state_and_updated_before(
+            context, vm_states.BUILDING, latest_valid_time)
+        return self._run_each(instances,
+                              lambda instance: self._fail(context, instance),
+                              deadline)
+
+    def _fail(self, context, instance):
+        LOG.warn("Instance %s has been building since %s, marking it failed"
+                 % (instance['id'], instance['updated_at']))
+        try:
+            db.instance_update(context, instance['id'],
+                               {'vm_state': vm_states.ERROR,
+                                'power_state': power_state.FAILED})
+            reddwarf_db.guest_status_update(instance['id'],
+                                            power_state.FAILED)
+            notifier.notify(notifier.publisher_id("reddwarf-reaper"),
+                            'reaper.instance.building_timeout',
+                            notifier.ERROR,
+                            {'instance_id': instance['id']})
+        except Exception:
+            LOG.exception(_("Error failing building instance %s") %
+                          instance['id'])
+
+
+_define_task_flags('stale_guest_status', 10 * 60, 60, None)
+
+
+@register
+class StaleGuestStatusTask(ReaperTask):
+    """Deletes the guest status of instances which have been deleted."""
+
+    name = 'stale_guest_status'
+    concurrency = 1
+
+    def run(self, context, deadline):
+        count = reddwarf_db.guest_status_delete_stale()
+        if count:
+            LOG.info("Deleted the guest status of %s deleted instances"
+                     % count)
+        return count
+
+
+_define_task_flags('dns_records', 60 * 60, 5 * 60, 4)
+
+
+@register
+class DnsRecordTask(ReaperTask):
+    """Deletes DNS records of instances which no longer exist."""
+
+    name = 'dns_records'
+
+    def __init__(self, driver):
+        super(DnsRecordTask, self).__init__(driver)
+        self.entry_factory = utils.import_object(
+            FLAGS.dns_instance_entry_factory)
+
+    def run(self, context, deadline):
+        # Records are listed before instances, so a record added for an
+        # instance created in between is never mistaken for a stale one.
+        names = [record.name for record in reddwarf_db.rsdns_record_list()
+                 if not record.deleted]
+        live_names = set()
+        for id, uuid in reddwarf_db.instance_get_all_ids(context):
+            entry = self.entry_factory.create_entry({'id': id, 'uuid': uuid})
+            if not entry:
+                LOG.debug("Instances are not given DNS entries, so no DNS "
+                          "records are reaped.")
+                return 0
+            live_names.add(entry.name)
+        stale = [name for name in names if name not in live_names]
+        return self._run_each(stale,
+                              lambda name: self._delete(context, name),
+                              deadline)
+
+    def _delete(self, context, name):
+        LOG.warn("Deleting DNS record %s without an instance" % name)
+        try:
+            self.driver.dns_api.delete_entry(context, name)
+        except Exception:
+            LOG.exception(_("Error deleting DNS record %s") % name)
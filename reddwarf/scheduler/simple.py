@@ -23,6 +23,7 @@ Simple Scheduler
 
 from nova import db
 from nova import flags
+from nova import rpc
 from nova import utils
 from nova import log as logging
 from nova.compute import power_state
@@ -126,20 +127,57 @@ class SimpleScheduler(chance.ChanceScheduler):
             db.volume_update(context, volume_id, {'host': host,
                                                   'scheduled_at': now})
             return host
+        host = self._pick_volume_host(context, volume_ref['size'])
+        # NOTE(vish): this probably belongs in the manager, if we
+        #             can generalize this somehow
+        now = utils.utcnow()
+        db.volume_update(context, volume_id, {'host': host,
+                                              'scheduled_at': now})
+        return host
+
+    def schedule_create_volumes(self, context, volume_ids, *_args, **_kwargs):
+        """Places each volume on the host that is up and has the fewest
+        volume gigabytes, counting the volumes placed before it, then casts
+        to each host the volumes placed on it. Nothing is cast should any
+        volume not fit."""
+        volumes = db_api.volume_get_all_by_ids(context, volume_ids)
+        gigabytes = []
+        for service, volume_gigabytes in \
+                db.service_get_all_volume_sorted(context):
+            if self.service_is_up(service):
+                gigabytes.append([volume_gigabytes, service['host']])
+        if not gigabytes:
+            raise driver.NoValidHost(_("Scheduler was unable to locate a "
+                                       "host for this request. Is the "
+                                       "appropriate service running?"))
+        placed = {}
+        for volume in volumes:
+            least = min(gigabytes)
+            if least[0] + volume['size'] > FLAGS.max_gigabytes:
+                raise driver.NoValidHost(_("All hosts have too many "
+                                           "gigabytes"))
+            least[0] += volume['size']
+            placed.setdefault(least[1], []).append(volume['id'])
+        now = utils.utcnow()
+        for host, ids in placed.iteritems():
+            db_api.volume_update_many(context, ids, {'host': host,
+                                                     'scheduled_at': now})
+            rpc.cast(context,
+                     db.queue_get_for(context, FLAGS.volume_topic, host),
+                     {"method": "create_volumes",
+                      "args": {"volume_ids": ids}})
+        # The volumes have been cast to their hosts already.
+        return None
+
+    def _pick_volume_host(self, context, size):
+        """Picks a host that is up and has the fewest volume gigabytes."""
         results = db.service_get_all_volume_sorted(context)
         for result in results:
             (service, volume_gigabytes) = result
-            if volume_gigabytes + volume_ref['size'] > FLAGS.max_gigabytes:
+            if volume_gigabytes + size > FLAGS.max_gigabytes:
                 raise driver.NoValidHost(_("All hosts have too many "
                                            "gigabytes"))
             if self.service_is_up(service):
-                # NOTE(vish): this probably belongs in the manager, if we
-                #             can generalize this somehow
-                now = utils.utcnow()
-                db.volume_update(context,
-                                 volume_id,
-                                 {'host': service['host'],
-                                  'scheduled_at': now})
                 return service['host']
         raise driver.NoValidHost(_("Scheduler was unable to locate a host"
                                    " for this request. Is the appropriate"
@@ -101,3 +101,37 @@ class MgmtApiTest(test.TestCase):
 
     def test_instances_index_restricted(self):
         self._test_path_restricted('instances')
+
+    def _prewarm(self, body, ctxt):
+        req = webob.Request.blank(mgmt_url + 'hosts/prewarm')
+        req.method = 'POST'
+        req.headers['Content-Type'] = 'application/json'
+        req.body = json.dumps(body)
+        return req.get_response(util.wsgi_app(fake_auth_context=ctxt))
+
+    def test_prewarm_restricted(self):
+        res = self._prewarm({'prewarm': {'images': ['1']}}, self.context)
+        self.assertEqual(res.status_int, 401)
+
+    def test_prewarm_images_on_hosts(self):
+        prewarmed = []
+        self.stubs.Set(reddwarf.compute.API, "prewarm_images",
+                       lambda self, ctxt, image_refs, hosts:
+                           prewarmed.append((image_refs, hosts)))
+        admin_context = context.RequestContext('fake', 'fake',
+                                               auth_token=True, is_admin=True)
+        res = self._prewarm({'prewarm': {'images': ['1', '2'],
+                                         'hosts': ['host-1']}},
+                            admin_context)
+        self.assertEqual(res.status_int, 202)
+        res = self._prewarm({'prewarm': {'images': ['3']}}, admin_context)
+        self.assertEqual(res.status_int, 202)
+        self.assertEqual([(['1', '2'], ['host-1']), (['3'], None)],
+                         prewarmed)
+
+    def test_prewarm_requires_images(self):
+        admin_context = context.RequestContext('fake', 'fake',
+                                               auth_token=True, is_admin=True)
+        res = self._prewarm({'prewarm': {'hosts': ['host-1']}},
+                            admin_context)
+        self.assertEqual(res.status_int, 400)
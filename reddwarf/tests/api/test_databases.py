@@ -20,6 +20,7 @@ import mox
 import stubout
 import webob
 from paste import urlmap
+from xml.dom import minidom
 from nose.tools import raises
 
 from nova import context
@@ -43,9 +44,25 @@ def guest_status_get(id):
 def localid_from_uuid(id):
     return id
 
-def list_databases_exception(self, req, instance_id):
+def get_guest_summary_exception(self, ctxt, id, parts, **kwargs):
     raise Exception()
 
+def get_guest_summary(self, ctxt, id, parts, time_out=None, if_version=None,
+                      limit=None, marker=None):
+    if if_version == "a-1":
+        return {'version': "a-1", 'not_modified': True}
+    return {'databases': [{'_name': 'testdb', '_collate': 'utf8_general_ci',
+                           '_character_set': 'utf8'}],
+            'version': "a-1"}
+
+def get_guest_summary_paged(self, ctxt, id, parts, time_out=None,
+                            if_version=None, limit=None, marker=None):
+    names = ["db%d" % i for i in range(5)]
+    if marker is not None:
+        names = [name for name in names if name > marker]
+    return {'databases': [{'_name': name} for name in names[:limit]],
+            'version': "a-1"}
+
 def instance_exists(ctxt, instance_id, compute_api):
     return True
 
@@ -73,12 +90,70 @@ class DatabaseApiTest(test.TestCase):
         super(DatabaseApiTest, self).tearDown()
 
     def test_list_databases(self):
-        self.stubs.Set(reddwarf.guest.api.API, "list_databases",
-                       list_databases_exception)
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary_exception)
         req = webob.Request.blank(databases_url)
         res = req.get_response(util.wsgi_app())
         self.assertEqual(res.status_int, 500)
 
+    def test_list_databases_has_etag(self):
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary)
+        req = webob.Request.blank(databases_url)
+        res = req.get_response(util.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers['ETag'], '"a-1"')
+        self.assertEqual(json.loads(res.body),
+                         {'databases': [{'name': 'testdb'}]})
+
+    def test_list_databases_not_modified(self):
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary)
+        req = webob.Request.blank(databases_url)
+        req.headers['If-None-Match'] = '"a-1"'
+        res = req.get_response(util.wsgi_app())
+        self.assertEqual(res.status_int, 304)
+        self.assertEqual(res.headers['ETag'], '"a-1"')
+
+    def test_list_databases_next_link(self):
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary_paged)
+        req = webob.Request.blank("%s?limit=2&marker=db0" % databases_url)
+        res = req.get_response(util.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        body = json.loads(res.body)
+        self.assertEqual(body['databases'], [{'name': 'db1'}, {'name': 'db2'}])
+        self.assertEqual(len(body['links']), 1)
+        self.assertEqual(body['links'][0]['rel'], 'next')
+        self.assertTrue(body['links'][0]['href'].endswith(
+            "/1/databases?limit=2&marker=db2"))
+
+    def test_list_databases_last_page(self):
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary_paged)
+        req = webob.Request.blank("%s?limit=2&marker=db2" % databases_url)
+        res = req.get_response(util.wsgi_app())
+        self.assertEqual(json.loads(res.body),
+                         {'databases': [{'name': 'db3'}, {'name': 'db4'}]})
+
+    def test_list_databases_xml_next_link(self):
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary_paged)
+        req = webob.Request.blank("%s?limit=2" % databases_url)
+        req.headers["accept"] = "application/xml"
+        res = req.get_response(util.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        root = minidom.parseString(res.body).documentElement
+        self.assertEqual(root.nodeName, 'databases')
+        self.assertEqual([node.getAttribute('name') for node in
+                          root.getElementsByTagName('database')],
+                         ['db0', 'db1'])
+        links = root.getElementsByTagName('link')
+        self.assertEqual(len(links), 1)
+        self.assertEqual(links[0].getAttribute('rel'), 'next')
+        self.assertTrue(links[0].getAttribute('href').endswith(
+            "/1/databases?limit=2&marker=db1"))
+
     def test_show_database(self):
         req = webob.Request.blank('%s/testdb' % databases_url)
         res = req.get_response(util.wsgi_app())
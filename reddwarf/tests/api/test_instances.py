@@ -15,16 +15,19 @@
 Tests for Instances API calls
 """
 
+import datetime
 import mox
 import json
 import stubout
 import webob
 from paste import urlmap
+from xml.dom import minidom
 
 import nova
 from nova import context
 from nova import test
 from nova.compute import vm_states
+from nova.db import api as db_api
 from nova.compute import power_state
 import nova.exception as nova_exception
 
@@ -67,6 +70,37 @@ def guest_status_get_failed(id, session=None):
     status.state = power_state.FAILED
     return status
 
+class FakeInstanceRow(object):
+    """Mimics a row from dbapi.instance_list_get_all_filtered."""
+
+    def __init__(self, id, guest_state=power_state.RUNNING, volume_size=2):
+        self.id = id
+        self.uuid = "uuid-%s" % id
+        self.name = "instance-%s" % id
+        self.hostname = "instance-%s" % id
+        self.vm_state = vm_states.ACTIVE
+        self.task_state = None
+        self.created_at = datetime.datetime(2012, 1, 1)
+        self.updated_at = datetime.datetime(2012, 1, 2)
+        self.flavorid = 1
+        self.guest_state = guest_state
+        self.volume_size = volume_size
+
+def instance_list_get_all_filtered(context, marker=None, limit=None,
+                                   filters=None):
+    return [FakeInstanceRow(1),
+            FakeInstanceRow(2, guest_state=power_state.BUILDING),
+            FakeInstanceRow(2, guest_state=power_state.BUILDING)]
+
+def instance_list_paginated(context, marker=None, limit=None, filters=None):
+    rows = [FakeInstanceRow(id) for id in range(1, 6)]
+    if marker is not None:
+        ids = [row.uuid for row in rows]
+        if marker not in ids:
+            raise nova_exception.InstanceNotFound(instance_id=marker)
+        rows = rows[ids.index(marker) + 1:]
+    return rows[:limit]
+
 def request_obj(url, method, body={}):
     req = webob.Request.blank(url)
     req.method = method
@@ -110,6 +144,179 @@ class InstanceApiTest(test.TestCase):
         res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
         self.assertEqual(res.status_int, 202)
 
+    def test_instances_index(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_get_all_filtered)
+        req = request_obj(instances_url, 'GET')
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        instances = json.loads(res.body)['instances']
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(instances[0]['id'], 'uuid-1')
+        self.assertEqual(instances[0]['status'], 'ACTIVE')
+        self.assertEqual(instances[1]['status'], 'BUILD')
+        self.assertFalse('volume' in instances[0])
+
+    def test_instances_detail(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_get_all_filtered)
+        req = request_obj('%s/detail' % instances_url, 'GET')
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        instances = json.loads(res.body)['instances']
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(instances[0]['volume'], {'size': 2})
+        self.assertEqual(instances[0]['flavor']['id'], '1')
+        self.assertEqual(instances[0]['hostname'], 'instance-1')
+        self.assertEqual(instances[0]['created'], '2012-01-01T00:00:00Z')
+
+    def test_instances_index_paginated(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_paginated)
+        req = request_obj('%s?limit=2' % instances_url, 'GET')
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        body = json.loads(res.body)
+        self.assertEqual([i['id'] for i in body['instances']],
+                         ['uuid-1', 'uuid-2'])
+        self.assertEqual(body['links'][0]['rel'], 'next')
+        self.assertTrue(body['links'][0]['href'].endswith(
+                        '/instances?limit=2&marker=uuid-2'))
+
+    def test_instances_index_last_page(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_paginated)
+        req = request_obj('%s?limit=2&marker=uuid-4' % instances_url, 'GET')
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        body = json.loads(res.body)
+        self.assertEqual([i['id'] for i in body['instances']], ['uuid-5'])
+        self.assertFalse('links' in body)
+
+    def test_instances_index_bad_marker(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_paginated)
+        req = request_obj('%s?marker=nonexistent' % instances_url, 'GET')
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 400)
+
+    def test_instances_index_bad_limit(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_paginated)
+        for limit in ['0', '-1', 'abc']:
+            req = request_obj('%s?limit=%s' % (instances_url, limit), 'GET')
+            res = req.get_response(
+                util.wsgi_app(fake_auth_context=self.context))
+            self.assertEqual(res.status_int, 400)
+
+    def test_instances_index_xml_links(self):
+        self.stubs.Set(reddwarf.db.api, "instance_list_get_all_filtered",
+                       instance_list_paginated)
+        req = request_obj('%s?limit=2' % instances_url, 'GET')
+        req.headers["accept"] = "application/xml"
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        dom = minidom.parseString(res.body)
+        root = dom.documentElement
+        self.assertEqual(root.nodeName, 'instances')
+        links = [node for node in root.childNodes
+                 if node.nodeName == 'link']
+        self.assertEqual(len(links), 1)
+        self.assertEqual(links[0].getAttribute('rel'), 'next')
+
+
+class InstanceListPaginationTest(test.TestCase):
+    """Test paging through instances stored in the database"""
+
+    def setUp(self):
+        super(InstanceListPaginationTest, self).setUp()
+        self.context = context.RequestContext('pager', 'pager-project')
+        self.instances = []
+        self.volumes = []
+        # The first instance has two volumes, so it joins to two rows.
+        for i, (volumes, vm_state) in enumerate(((2, vm_states.ACTIVE),
+                                                 (0, vm_states.BUILDING),
+                                                 (0, vm_states.ACTIVE))):
+            instance = db_api.instance_create(self.context,
+                               {'project_id': self.context.project_id,
+                                'user_id': self.context.user_id,
+                                'display_name': "db_%d" % i,
+                                'vm_state': vm_state})
+            self.instances.append(instance)
+            for i in range(volumes):
+                volume = db_api.volume_create(self.context,
+                                 {'instance_id': instance['id'], 'size': 1})
+                self.volumes.append(volume)
+
+    def tearDown(self):
+        admin = context.get_admin_context()
+        for volume in self.volumes:
+            db_api.volume_destroy(admin, volume['id'])
+        for instance in self.instances:
+            db_api.instance_destroy(admin, instance['id'])
+        super(InstanceListPaginationTest, self).tearDown()
+
+    def test_limit_counts_instances_not_volumes(self):
+        rows = reddwarf.db.api.instance_list_get_all_filtered(self.context,
+                                                              limit=2)
+        self.assertEqual([row.id for row in rows],
+                         [self.instances[0]['id'], self.instances[0]['id'],
+                          self.instances[1]['id']])
+
+    def _list(self, query):
+        url = "/v1.0/%s/instances?%s" % (self.context.project_id, query)
+        req = request_obj(url, 'GET')
+        return req.get_response(util.wsgi_app(fake_auth_context=self.context))
+
+    def test_list_filtered_by_status(self):
+        res = self._list('status=ACTIVE')
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual([i['id'] for i in json.loads(res.body)['instances']],
+                         [self.instances[0]['uuid'],
+                          self.instances[2]['uuid']])
+
+    def test_list_filtered_by_name(self):
+        rows = reddwarf.db.api.instance_list_get_all_filtered(self.context,
+                                   filters={'display_name': "db_1"})
+        self.assertEqual([row.id for row in rows], [self.instances[1]['id']])
+        # The name is a prefix, in which % is not a wildcard.
+        rows = reddwarf.db.api.instance_list_get_all_filtered(self.context,
+                                   filters={'display_name': "db%"})
+        self.assertEqual(rows, [])
+
+    def test_list_with_bad_search_options(self):
+        for query in ('status=SLEEPY', 'changes-since=yesterday',
+                      'tenant_id=other', 'color=blue'):
+            self.assertEqual(self._list(query).status_int, 400)
+
+    def test_marker_of_another_project_is_not_found(self):
+        other = db_api.instance_create(self.context,
+                                       {'project_id': "other-project",
+                                        'user_id': "other"})
+        self.instances.append(other)
+        res = self._list('marker=%s' % other['uuid'])
+        self.assertEqual(res.status_int, 400)
+
+    def test_deleted_marker_continues_the_listing(self):
+        db_api.instance_destroy(context.get_admin_context(),
+                                self.instances[1]['id'])
+        res = self._list('marker=%s' % self.instances[1]['uuid'])
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual([i['id'] for i in json.loads(res.body)['instances']],
+                         [self.instances[2]['uuid']])
+
+    def test_next_link_after_an_instance_with_two_volumes(self):
+        url = "/v1.0/%s/instances" % self.context.project_id
+        req = request_obj('%s?limit=1' % url, 'GET')
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        body = json.loads(res.body)
+        self.assertEqual([i['id'] for i in body['instances']],
+                         [self.instances[0]['uuid']])
+        self.assertTrue(body['links'][0]['href'].endswith(
+                        '/instances?limit=1&marker=%s'
+                        % self.instances[0]['uuid']))
+
 
 class InstanceApiValidation(test.TestCase):
     """
@@ -0,0 +1,85 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for the Management API instance listing
+"""
+
+import datetime
+
+from nova import context
+from nova import test
+from nova.api.openstack import wsgi
+
+import reddwarf
+from reddwarf.api import management
+from reddwarf.tests import util
+
+mgmt_url = util.v1_mgmt_prefix
+
+INSTANCE_COUNT = 5
+IPS_PER_INSTANCE = 2
+FLAVOR_COUNT = 5
+
+
+def fake_instances_mgmt_index(context, deleted=None, marker=None, limit=None):
+    """Synthetic fleet of INSTANCE_COUNT instances with IPS_PER_INSTANCE
+    fixed IPs apiece."""
+    created_at = datetime.datetime(2012, 1, 1)
+    instances = [{'id': id,
+                  'uuid': 'uuid-%s' % id,
+                  'project_id': 'project-%s' % (id % 100),
+                  'host': 'host-%s' % (id % 50),
+                  'vm_state': 'active',
+                  'instance_type_id': id % FLAVOR_COUNT,
+                  'created_at': created_at,
+                  'deleted_at': None,
+                  'deleted': False,
+                  } for id in range(INSTANCE_COUNT)][:limit]
+    flavors = [{'id': id, 'flavorid': id + 100}
+               for id in range(FLAVOR_COUNT)]
+    ips = [{'instance_id': id,
+            'address': '10.%s.%s.%s' % (n, id / 256 % 256, id % 256),
+            'virtual_interface_id': id,
+            } for id in range(INSTANCE_COUNT)
+              for n in range(IPS_PER_INSTANCE)]
+    return instances, flavors, ips
+
+
+class MgmtInstanceIndexTest(test.TestCase):
+    """Test the Management API instance index"""
+
+    def setUp(self):
+        super(MgmtInstanceIndexTest, self).setUp()
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token=True, is_admin=True)
+        self.flags(osapi_max_limit=INSTANCE_COUNT)
+        self.stubs.Set(reddwarf.db.api, "instances_mgmt_index",
+                       fake_instances_mgmt_index)
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(MgmtInstanceIndexTest, self).tearDown()
+
+    def test_index_associates_flavors_and_ips(self):
+        req = wsgi.Request.blank(mgmt_url + 'instances')
+        req.environ['nova.context'] = self.context
+        controller = management.Controller()
+        instances = controller.index(req=req)['instances']
+        self.assertEqual(len(instances), INSTANCE_COUNT)
+        for instance in (instances[0], instances[3], instances[-1]):
+            id = int(instance['id'].split('-')[1])
+            self.assertEqual(instance['flavorid'], id % FLAVOR_COUNT + 100)
+            self.assertEqual(len(instance['ips']), IPS_PER_INSTANCE)
+            for ip in instance['ips']:
+                self.assertEqual(ip['virtual_interface_id'], id)
@@ -20,6 +20,7 @@ import mox
 import stubout
 import webob
 from paste import urlmap
+from xml.dom import minidom
 from nose.tools import raises
 
 from nova import context
@@ -44,6 +45,14 @@ def guest_status_get(id):
 def localid_from_uuid(id):
     return id
 
+def get_guest_summary_paged(self, ctxt, id, parts, time_out=None,
+                            if_version=None, limit=None, marker=None):
+    names = ["user%d" % i for i in range(5)]
+    if marker is not None:
+        names = [name for name in names if name > marker]
+    return {'users': [{'_name': name} for name in names[:limit]],
+            'version': "a-1"}
+
 def instance_exists(ctxt, instance_id, compute_api):
     return True
 
@@ -70,6 +79,24 @@ class UserApiTest(test.TestCase):
         self.stubs.UnsetAll()
         super(UserApiTest, self).tearDown()
 
+    def test_list_users_xml_next_link(self):
+        self.stubs.Set(reddwarf.guest.api.API, "get_guest_summary",
+                       get_guest_summary_paged)
+        req = webob.Request.blank("%s?limit=2" % databases_url)
+        req.headers["accept"] = "application/xml"
+        res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
+        self.assertEqual(res.status_int, 200)
+        root = minidom.parseString(res.body).documentElement
+        self.assertEqual(root.nodeName, 'users')
+        self.assertEqual([node.getAttribute('name') for node in
+                          root.getElementsByTagName('user')],
+                         ['user0', 'user1'])
+        links = root.getElementsByTagName('link')
+        self.assertEqual(len(links), 1)
+        self.assertEqual(links[0].getAttribute('rel'), 'next')
+        self.assertTrue(links[0].getAttribute('href').endswith(
+            "/1/users?limit=2&marker=user1"))
+
     def test_delete_user_name_begin_space(self):
         req = request_obj(databases_url+"/%20test", 'DELETE')
         res = req.get_response(util.wsgi_app(fake_auth_context=self.context))
@@ -18,15 +18,21 @@ Tests the Authorization Service
 
 import json
 import mox
+import socket
 import stubout
 import webob
 
+from eventlet import greenpool
+from eventlet import greenthread
+
 from nova import test
 from nova import flags
 from nova import context
+from nova import fakememcache
 
 from reddwarf.api import flavors
 from reddwarf.auth import auth_token
+from reddwarf.auth import cache
 from reddwarf.auth import nova_auth_token
 from reddwarf.tests import util
 
@@ -53,6 +59,41 @@ def validate_token(self, claims, tenant=None):
         return data, 401
 
 
+class FakeResponse(object):
+
+    def __init__(self, status, data):
+        self.status = status
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def getheader(self, name, default=None):
+        return default
+
+
+class FakeConnection(object):
+
+    created = 0
+
+    def __init__(self, *args):
+        FakeConnection.created += 1
+        self.requests = 0
+        self.fail_next = False
+
+    def request(self, method, path, body=None, headers=None):
+        if self.fail_next:
+            self.fail_next = False
+            raise socket.error("Connection reset by peer")
+        self.requests += 1
+
+    def getresponse(self):
+        return FakeResponse(200, data)
+
+    def close(self):
+        pass
+
+
 class AuthApiTest(test.TestCase):
     """Test various configuration update scenarios"""
 
@@ -60,6 +101,7 @@ class AuthApiTest(test.TestCase):
         super(AuthApiTest, self).setUp()
         self.context = context.get_admin_context()
         self.controller = flavors.ControllerV10()
+        self.stubs.Set(cache, "CACHES", {})
         self.stubs.Set(auth_token.AuthProtocol, "get_admin_auth_token",
                        get_admin_auth_token)
         self.stubs.Set(auth_token.AuthProtocol, "_validate_token",
@@ -118,3 +160,183 @@ class AuthApiTest(test.TestCase):
         req.headers = [("X-AUTH-TOKEN", "aat")]
         res = req.get_response(util.wsgi_app(fake_auth=False))
         self.assertEqual(res.status_int, 200)
+
+    def test_connections_are_reused(self):
+        FakeConnection.created = 0
+        self.stubs.Set(auth_token, "get_connection", FakeConnection)
+        pool = auth_token.HTTPConnectionPool("https", "localhost", 443, 2)
+        for i in range(3):
+            self.assertEqual((200, data), pool.request("GET", "/v1.1/token"))
+        self.assertEqual(FakeConnection.created, 1)
+
+    def test_dropped_connection_is_retried(self):
+        self.stubs.Set(auth_token, "get_connection", FakeConnection)
+        pool = auth_token.HTTPConnectionPool("https", "localhost", 443, 2)
+        conn = pool.get()
+        conn.fail_next = True
+        pool.put(conn)
+        self.assertEqual((200, data), pool.request("GET", "/v1.1/token"))
+        self.assertEqual(conn.requests, 1)
+
+    def test_concurrent_validations_are_coalesced(self):
+        calls = []
+
+        def slow_validate_token(claims, tenant=None):
+            calls.append(claims)
+            greenthread.sleep(0.01)
+            return data, 200
+
+        self.stubs.Set(self.auth, "_validate_token", slow_validate_token)
+        pool = greenpool.GreenPool()
+        results = list(pool.imap(
+            lambda i: self.auth._coalesced_validate_token(TOKEN, "dbaas"),
+            range(5)))
+        self.assertEqual(calls, [TOKEN])
+        self.assertEqual(results, [(data, 200)] * 5)
+        self.assertEqual(self.auth.pending_validations, {})
+
+    def test_invalid_token_is_cached(self):
+        calls = []
+
+        def count_validate_token(auth, claims, tenant=None):
+            calls.append(claims)
+            return validate_token(auth, claims, tenant)
+
+        self.stubs.Set(auth_token.AuthProtocol, "_validate_token",
+                       count_validate_token)
+        for i in range(2):
+            req = webob.Request.blank(flavors_url)
+            req.headers = [("X-AUTH-TOKEN", "negative-token")]
+            res = req.get_response(util.wsgi_app(fake_auth=False))
+            self._assert_401(res)
+        self.assertEqual(calls, ["negative-token"])
+
+    def test_auth_service_error_is_not_cached(self):
+        calls = []
+
+        def unavailable_validate_token(auth, claims, tenant=None):
+            calls.append(claims)
+            return "Service Unavailable", 503
+
+        self.stubs.Set(auth_token.AuthProtocol, "_validate_token",
+                       unavailable_validate_token)
+        for i in range(2):
+            req = webob.Request.blank(flavors_url)
+            req.headers = [("X-AUTH-TOKEN", TOKEN)]
+            res = req.get_response(util.wsgi_app(fake_auth=False))
+            self.assertEqual(res.status_int, 503)
+        self.assertEqual(calls, [TOKEN, TOKEN])
+        self.assertEqual(self.auth.cache.lookup("%s/dbaas" % TOKEN), None)
+
+    def test_cache_stats_are_logged_each_interval(self):
+        logged = []
+        self.stubs.Set(auth_token.LOG, "info", logged.append)
+        self.flags(reddwarf_auth_cache_stats_interval=60)
+        self.auth.cache.lookup("missing")
+        self.auth.stats_logged_at = 0
+        for i in range(2):
+            req = webob.Request.blank(flavors_url)
+            self._assert_401(req.get_response(self.auth))
+        self.assertEqual(len(logged), 1)
+        self.assertTrue("memory" in logged[0])
+        self.assertTrue("misses=1" in logged[0])
+
+    def test_stale_token_is_served_and_refreshed(self):
+        refreshed = []
+        self.stubs.Set(auth_token.AuthProtocol, "_refresh_claims",
+                       lambda auth, claims, tenant:
+                           refreshed.append((claims, tenant)))
+        self.auth.cache.set_value("stale-token/dbaas", (data, 200),
+                                  expiretime=0)
+        req = webob.Request.blank(flavors_url)
+        req.headers = [("X-AUTH-TOKEN", "stale-token")]
+        res = req.get_response(util.wsgi_app(fake_auth=False))
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(refreshed, [("stale-token", "dbaas")])
+
+
+class LRUTokenCacheTest(test.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUTokenCache(max_entries=2, max_bytes=1024 * 1024,
+                                  stale_time=0)
+        lru.set_value("a", (data, 200))
+        lru.set_value("b", (data, 200))
+        lru.lookup("a")
+        lru.set_value("c", (data, 200))
+        self.assertTrue(lru.has_key("a"))
+        self.assertFalse(lru.has_key("b"))
+        self.assertTrue(lru.has_key("c"))
+        self.assertEqual(lru.stats['evictions'], 1)
+        self.assertEqual(lru.stats['entries'], 2)
+
+    def test_bounded_by_bytes(self):
+        lru = cache.LRUTokenCache(max_entries=100,
+                                  max_bytes=3 * cache.ENTRY_OVERHEAD,
+                                  stale_time=0)
+        for key in range(5):
+            lru.set_value(str(key), ("x", 200))
+        self.assertEqual(lru.stats['entries'], 2)
+        self.assertTrue(lru.stats['bytes'] <= 3 * cache.ENTRY_OVERHEAD)
+
+    def test_stale_and_expired_entries(self):
+        lru = cache.LRUTokenCache(max_entries=10, max_bytes=1024 * 1024,
+                                  stale_time=60)
+        lru.set_value("fresh", (data, 200), expiretime=60)
+        lru.set_value("stale", (data, 200), expiretime=0)
+        lru.set_value("expired", (data, 200), expiretime=0, stale_time=0)
+        self.assertEqual(lru.lookup("fresh"), ((data, 200), False))
+        self.assertEqual(lru.lookup("stale"), ((data, 200), True))
+        self.assertEqual(lru.lookup("expired"), None)
+        self.assertEqual(lru.lookup("missing"), None)
+        self.assertEqual(lru.stats['hits'], 1)
+        self.assertEqual(lru.stats['stale_hits'], 1)
+        self.assertEqual(lru.stats['misses'], 2)
+        self.assertEqual(lru.stats['entries'], 2)
+
+
+class MemcacheTokenCacheTest(test.TestCase):
+
+    def setUp(self):
+        super(MemcacheTokenCacheTest, self).setUp()
+        self.client = fakememcache.Client()
+
+    def test_entries_are_shared_between_workers(self):
+        worker_a = cache.MemcacheTokenCache(self.client, "dbaas", 60)
+        worker_b = cache.MemcacheTokenCache(self.client, "dbaas", 60)
+        worker_a.set_value("%s/dbaas" % TOKEN, (data, 200))
+        self.assertEqual(worker_b.lookup("%s/dbaas" % TOKEN),
+                         ((data, 200), False))
+        self.assertEqual(worker_b.get_value("%s/dbaas" % TOKEN), (data, 200))
+        self.assertEqual(worker_b.stats['hits'], 2)
+
+    def test_token_is_not_used_as_the_key(self):
+        memcache = cache.MemcacheTokenCache(self.client, "dbaas", 60)
+        memcache.set_value("%s/dbaas" % TOKEN, (data, 200))
+        for key in self.client.cache.keys():
+            self.assertFalse(TOKEN in key)
+
+    def test_stale_and_expired_entries(self):
+        memcache = cache.MemcacheTokenCache(self.client, "dbaas", 60)
+        memcache.set_value("stale", (data, 200), expiretime=0)
+        memcache.set_value("expired", (data, 401), expiretime=0,
+                           stale_time=0)
+        self.assertEqual(memcache.lookup("stale"), ((data, 200), True))
+        self.assertEqual(memcache.lookup("expired"), None)
+        self.assertEqual(memcache.lookup("missing"), None)
+        self.assertEqual(memcache.stats['misses'], 2)
+
+    def test_auth_protocol_uses_memcache(self):
+        self.stubs.Set(cache, "CACHES", {})
+        self.stubs.Set(auth_token.AuthProtocol, "get_admin_auth_token",
+                       get_admin_auth_token)
+        auth = auth_token.AuthProtocol(None, {'cache_type': 'memcache'})
+        self.assertTrue(isinstance(auth.cache, cache.MemcacheTokenCache))
+
+    def test_memcache_without_servers_is_warned(self):
+        warnings = []
+        self.stubs.Set(cache, "CACHES", {})
+        self.stubs.Set(cache.LOG, "warn", warnings.append)
+        self.flags(memcached_servers=None)
+        cache.get_cache("dbaas", "memcache")
+        self.assertEqual(len(warnings), 1)
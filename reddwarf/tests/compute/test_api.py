@@ -22,6 +22,7 @@ from paste import urlmap
 from nova import db
 from nova import context
 from nova import exception
+from nova import rpc
 from nova import test
 from nova.compute import instance_types
 from nova.compute import vm_states
@@ -155,3 +156,27 @@ class ResizeInPlaceTest(test.TestCase):
                                  self.inst_type_big['id'])
         instance = self.api.get(self.ctxt, self.instance_id)
         self.assertEqual(vm_states.RESIZING, instance['vm_state'])
+
+
+class PrewarmImagesTest(test.TestCase):
+    """Tests the prewarm_images method of compute.api."""
+
+    def setUp(self):
+        super(PrewarmImagesTest, self).setUp()
+        self.api = API()
+        self.ctxt = context.get_admin_context()
+        self.casts = []
+        self.stubs.Set(rpc, 'cast', lambda ctxt, topic, msg:
+                       self.casts.append(('cast', topic, msg)))
+        self.stubs.Set(rpc, 'fanout_cast', lambda ctxt, topic, msg:
+                       self.casts.append(('fanout_cast', topic, msg)))
+
+    def test_prewarm_on_every_host(self):
+        self.api.prewarm_images(self.ctxt, ['1', '2'])
+        msg = {'method': 'prewarm_images', 'args': {'image_refs': ['1', '2']}}
+        self.assertEqual([('fanout_cast', 'compute', msg)], self.casts)
+
+    def test_prewarm_on_given_hosts(self):
+        self.api.prewarm_images(self.ctxt, ['1'], ['host-1', 'host-2'])
+        self.assertEqual(['compute.host-1', 'compute.host-2'],
+                         [topic for method, topic, msg in self.casts])
@@ -27,6 +27,7 @@ from nova import utils
 from nova.compute import instance_types
 from nova.compute import vm_states
 from reddwarf import exception as reddwarf_exception
+from reddwarf import utils as reddwarf_utils
 from reddwarf.compute.api import API
 from reddwarf.compute import manager
 from reddwarf.compute.manager import ReddwarfComputeManager
@@ -239,3 +240,32 @@ class RdComputeManagerResizeInPlaceTest(test.TestCase):
 
         self.rd_compute.resize_in_place(self.ctxt, self.instance_id,
                                         self.new_instance_type_id)
+
+
+class RdComputeManagerWaitMetricsTest(test.TestCase):
+    """Tests the wait metrics served by the compute manager."""
+
+    def setUp(self):
+        super(RdComputeManagerWaitMetricsTest, self).setUp()
+        self.flags(connection_type='openvz',
+            compute_manager="reddwarf.compute.manager.ReddwarfComputeManager",
+                   stub_network=True,
+                   network_manager='nova.network.manager.FlatManager')
+        self.rd_compute = utils.import_object(FLAGS.compute_manager)
+        self.ctxt = context.get_admin_context()
+
+    def tearDown(self):
+        reddwarf_utils.WAIT_METRICS.clear()
+        super(RdComputeManagerWaitMetricsTest, self).tearDown()
+
+    def test_get_wait_metrics(self):
+        key = reddwarf_utils.status_key('volume', 1)
+        for i in range(2):
+            reddwarf_utils.wait_for_status(key, lambda: True,
+                                           phase='volume_provision')
+        metrics = self.rd_compute.get_wait_metrics(self.ctxt)
+        self.assertEqual(['volume_provision'], metrics.keys())
+        self.assertEqual(2, metrics['volume_provision']['count'])
+        metrics['volume_provision']['count'] = 0
+        self.assertEqual(2, self.rd_compute.get_wait_metrics(
+            self.ctxt)['volume_provision']['count'])
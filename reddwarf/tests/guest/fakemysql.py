@@ -0,0 +1,124 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+A stand-in for the MySQL server the guest agent manages.
+
+Understands the user statements the agent runs, keeping the users and
+their grants in memory and failing statements as MySQL would, and lists
+the databases and users a page at a time. Each
+statement may take a latency in seconds, so round trips can be compared.
+
+"""
+
+import re
+import time
+
+
+GRANT = re.compile(r"^GRANT ALL PRIVILEGES ON `(.+)`\.\* TO ")
+
+
+class FakeMySqlError(Exception):
+    pass
+
+
+class FakeMySqlTransaction(object):
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeMySqlConnection(object):
+
+    def __init__(self, server):
+        self.server = server
+
+    def begin(self):
+        return FakeMySqlTransaction()
+
+    def execute(self, t, params=None):
+        return self.server.execute(" ".join(str(t).split()), params or {})
+
+    def close(self):
+        pass
+
+
+class FakeMySqlServer(object):
+    """Acts as a sqlalchemy engine connected to the server."""
+
+    def __init__(self, databases=(), latency=0):
+        self.databases = set(databases)
+        self.latency = latency
+        self.users = set()
+        # Names CREATE USER fails for, as if MySQL refused them.
+        self.rejected = set()
+        self.grants = set()
+        self.statements = []
+
+    def connect(self):
+        return FakeMySqlConnection(self)
+
+    def execute(self, statement, params):
+        self.statements.append(statement)
+        if self.latency:
+            time.sleep(self.latency)
+        names = [params[key] for key in sorted(params, key=_position)
+                 if key.startswith('user')]
+        if "FROM information_schema.schemata" in statement:
+            return [(name, "utf8", "utf8_general_ci") for name in
+                    _page(self.databases, statement, params)]
+        if statement.startswith("SELECT DISTINCT User FROM mysql.user"):
+            return [{'User': name} for name in
+                    _page(self.users, statement, params)]
+        if statement.startswith("SELECT User FROM mysql.user"):
+            return [{'User': name} for name in names if name in self.users]
+        if statement.startswith("CREATE USER"):
+            # As with MySQL the users which can be created are, even
+            # should the statement fail for the others.
+            failed = [name for name in names
+                      if name in self.users or name in self.rejected]
+            self.users.update(name for name in names if name not in failed)
+            if failed:
+                raise FakeMySqlError("Operation CREATE USER failed for %s"
+                                     % ", ".join(failed))
+        match = GRANT.match(statement)
+        if match:
+            database = match.group(1)
+            if database not in self.databases:
+                raise FakeMySqlError("Unknown database '%s'" % database)
+            missing = [name for name in names if name not in self.users]
+            if missing:
+                raise FakeMySqlError("No such grant for %s"
+                                     % ", ".join(missing))
+            self.grants.update((name, database) for name in names)
+
+
+def _page(names, statement, params):
+    names = sorted(names)
+    if ":marker" in statement:
+        names = [name for name in names if name > params['marker']]
+    if ":limit" in statement:
+        names = names[:params['limit']]
+    return names
+
+
+def _position(key):
+    digits = key.lstrip("abcdefghijklmnopqrstuvwxyz_")
+    return (key[:len(key) - len(digits)], int(digits or 0))
@@ -0,0 +1,189 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import greenlet
+
+from eventlet import greenthread
+
+from nova import context
+from nova import rpc
+from nova import test
+from nova.db import api as db_api
+
+from reddwarf import rpc as reddwarf_rpc
+from reddwarf.db import api as dbapi
+from reddwarf.guest import api as guest_api
+
+
+class GuestRoutingKeyTest(test.TestCase):
+
+    def setUp(self):
+        super(GuestRoutingKeyTest, self).setUp()
+        self.context = context.get_admin_context()
+        self.stubs.Set(guest_api, '_ROUTING_KEYS', {})
+        self.instance_ids = []
+        for hostname in ('host-1.example.com', 'host-2'):
+            instance = db_api.instance_create(self.context,
+                                              {'hostname': hostname})
+            self.instance_ids.append(instance['id'])
+        self.lookups = []
+        instance_get = db_api.instance_get
+        self.stubs.Set(db_api, 'instance_get', lambda ctxt, id:
+                       self.lookups.append(id) or instance_get(ctxt, id))
+        self.api = guest_api.API()
+
+    def tearDown(self):
+        for instance_id in self.instance_ids:
+            db_api.instance_destroy(self.context, instance_id)
+        super(GuestRoutingKeyTest, self).tearDown()
+
+    def test_routing_key_is_looked_up_once(self):
+        id = self.instance_ids[0]
+        self.assertEqual("guest.host-1",
+                         self.api._get_routing_key(self.context, id))
+        self.assertEqual("guest.host-1",
+                         self.api._get_routing_key(self.context, str(id)))
+        self.assertEqual([id], self.lookups)
+
+    def test_forgotten_routing_key_is_looked_up_again(self):
+        id = self.instance_ids[0]
+        self.api._get_routing_key(self.context, id)
+        guest_api.forget_routing_key(id)
+        self.api._get_routing_key(self.context, id)
+        self.assertEqual([id, id], self.lookups)
+
+    def test_routing_keys_are_looked_up_in_one_query(self):
+        first, second = self.instance_ids
+        self.api._get_routing_key(self.context, first)
+        queried = []
+        get_hostnames = dbapi.instance_get_hostnames
+        self.stubs.Set(dbapi, 'instance_get_hostnames', lambda ctxt, ids:
+                       queried.append(ids) or get_hostnames(ctxt, ids))
+        keys = self.api._get_routing_keys(self.context,
+                                          [first, second, second + 1000])
+        self.assertEqual({first: "guest.host-1", second: "guest.host-2"},
+                         keys)
+        self.assertEqual([[second, second + 1000]], queried)
+        self.assertEqual("guest.host-2",
+                         self.api._get_routing_key(self.context, second))
+        self.assertEqual([first], self.lookups)
+
+    def test_upgrade_all_casts_to_each_guest(self):
+        topics = []
+        self.stubs.Set(reddwarf_rpc, 'cast_with_consumer',
+                       lambda ctxt, topic, msg: topics.append(topic))
+        self.api.upgrade_all(self.context, self.instance_ids)
+        self.assertEqual(["guest.host-1", "guest.host-2"], sorted(topics))
+        self.assertEqual([], self.lookups)
+
+
+class GuestSummaryTest(test.TestCase):
+
+    def setUp(self):
+        super(GuestSummaryTest, self).setUp()
+        self.context = context.get_admin_context()
+        self.stubs.Set(guest_api.API, '_get_routing_key',
+                       lambda self, ctxt, id: "guest.host")
+        self.calls = []
+        self.args = []
+        self.replies = {}
+        self.killed = []
+        self.stubs.Set(rpc, 'call', self._fake_call)
+        self.api = guest_api.API()
+
+    def _fake_call(self, ctxt, topic, msg):
+        self.calls.append(msg['method'])
+        self.args.append(msg.get('args'))
+        reply = self.replies[msg['method']]
+        if isinstance(reply, Exception):
+            raise reply
+        if reply == 'hang':
+            try:
+                greenthread.sleep(1)
+            except greenlet.GreenletExit:
+                self.killed.append(msg['method'])
+                raise
+        return reply
+
+    def test_summary_is_one_call(self):
+        self.replies['get_guest_summary'] = {'databases': [], 'users': [],
+                                             'version': "a-1"}
+        summary = self.api.get_guest_summary(self.context, 1,
+                                             ('databases', 'users'))
+        self.assertEqual({'databases': [], 'users': [], 'version': "a-1"},
+                         summary)
+        self.assertEqual(['get_guest_summary'], self.calls)
+
+    def test_unchanged_summary_is_not_modified(self):
+        self.replies['get_guest_summary'] = {'version': "a-1",
+                                             'not_modified': True}
+        summary = self.api.get_guest_summary(self.context, 1, ('users',),
+                                             if_version="a-1")
+        self.assertEqual({'version': "a-1", 'not_modified': True}, summary)
+        self.assertEqual([{'parts': ['users'], 'if_version': "a-1"}],
+                         self.args)
+
+    def test_summary_times_out_without_any_parts(self):
+        self.replies['get_guest_summary'] = 'hang'
+        summary = self.api.get_guest_summary(self.context, 1,
+                                             ('databases', 'root_enabled'),
+                                             time_out=0.01)
+        self.assertEqual({'databases': None, 'root_enabled': None,
+                          'version': None}, summary)
+        self.assertEqual(['get_guest_summary'], self.killed)
+
+    def test_older_guest_is_called_for_each_part_at_once(self):
+        self.replies['get_guest_summary'] = rpc.RemoteError("NotFound",
+                                                            "No method", "")
+        self.replies['list_databases'] = []
+        self.replies['list_users'] = 'hang'
+        self.replies['is_root_enabled'] = rpc.RemoteError("OperationalError",
+                                                          "Gone away", "")
+        summary = self.api.get_guest_summary(self.context, 1,
+                                             ('databases', 'users',
+                                              'root_enabled'),
+                                             time_out=0.05)
+        self.assertEqual({'databases': [], 'users': None,
+                          'root_enabled': None, 'version': None}, summary)
+        self.assertEqual(['get_guest_summary', 'is_root_enabled',
+                          'list_databases', 'list_users'],
+                         sorted(self.calls))
+        self.assertEqual(['list_users'], self.killed)
+
+    def test_summary_is_paged_by_the_guest(self):
+        self.replies['get_guest_summary'] = {'users': [], 'version': "a-1"}
+        self.api.get_guest_summary(self.context, 1, ('users',), limit=2,
+                                   marker="bob")
+        self.assertEqual([{'parts': ['users'], 'limit': 2,
+                           'marker': "bob"}], self.args)
+
+    def test_older_guest_listing_is_paged_here(self):
+        self.replies['get_guest_summary'] = rpc.RemoteError("NotFound",
+                                                            "No method", "")
+        self.replies['list_users'] = [{'_name': name} for name in
+                                      ("alice", "bob", "carol", "dave")]
+        summary = self.api.get_guest_summary(self.context, 1, ('users',),
+                                             limit=2, marker="alice")
+        self.assertEqual([{'_name': "bob"}, {'_name': "carol"}],
+                         summary['users'])
+        self.assertEqual(None, self.args[-1])
+
+    def test_summary_error_is_raised(self):
+        self.replies['get_guest_summary'] = rpc.RemoteError("OperationalError",
+                                                            "Gone away", "")
+        self.assertRaises(rpc.RemoteError, self.api.get_guest_summary,
+                          self.context, 1, ('databases',))
@@ -0,0 +1,161 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import rpc
+from nova import test
+from nova.compute import power_state
+from nova.db.sqlalchemy.session import get_session
+
+from reddwarf.db import api as dbapi
+from reddwarf.db import models
+from reddwarf.guest import dbaas
+from reddwarf.guest.collector import GuestStatusCollector
+
+
+class GuestStatusCollectorTest(test.TestCase):
+
+    def setUp(self):
+        super(GuestStatusCollectorTest, self).setUp()
+        self.published = []
+        self.stubs.Set(rpc, 'fanout_cast', lambda ctxt, topic, msg:
+                       self.published.extend(msg['args']['keys']))
+        self.collector = GuestStatusCollector()
+        for instance_id in (1, 2, 3):
+            dbapi.guest_status_create(instance_id)
+
+    def tearDown(self):
+        session = get_session()
+        with session.begin():
+            session.query(models.GuestStatus).\
+                    filter(models.GuestStatus.instance_id.in_([1, 2, 3])).\
+                    delete(synchronize_session=False)
+        super(GuestStatusCollectorTest, self).tearDown()
+
+    def test_flush_writes_latest_state(self):
+        self.collector.update_status(None, 1, power_state.RUNNING)
+        self.collector.update_status(None, 1, power_state.BLOCKED)
+        self.collector.update_status(None, 2, power_state.CRASHED)
+        self.collector.flush()
+        self.assertEqual(dbapi.guest_status_get(1).state, power_state.BLOCKED)
+        self.assertEqual(dbapi.guest_status_get(1).state_description,
+                         power_state.name(power_state.BLOCKED))
+        self.assertEqual(dbapi.guest_status_get(2).state, power_state.CRASHED)
+        self.assertEqual(dbapi.guest_status_get(3).state,
+                         power_state.BUILDING)
+        self.assertEqual(self.collector.pending_states, {})
+        self.assertEqual(sorted(self.published),
+                         ['guest_status:1', 'guest_status:2'])
+
+    def test_flush_survives_a_publish_error(self):
+        def fail(ctxt, topic, msg):
+            raise IOError("Socket closed")
+        self.stubs.Set(rpc, 'fanout_cast', fail)
+        self.collector.update_status(None, 1, power_state.RUNNING)
+        self.collector.flush()
+        self.assertEqual(dbapi.guest_status_get(1).state, power_state.RUNNING)
+        self.collector.update_status(None, 2, power_state.CRASHED)
+        self.collector.flush()
+        self.assertEqual(dbapi.guest_status_get(2).state, power_state.CRASHED)
+
+    def test_heartbeat_only_touches_updated_at(self):
+        self.collector.heartbeat(None, 3)
+        self.collector.flush()
+        status = dbapi.guest_status_get(3)
+        self.assertEqual(status.state, power_state.BUILDING)
+        self.assertNotEqual(status.updated_at, None)
+
+    def test_heartbeat_writes_a_state_whose_change_was_lost(self):
+        self.collector.heartbeat(None, 3, power_state.RUNNING)
+        self.collector.flush()
+        self.assertEqual(dbapi.guest_status_get(3).state, power_state.RUNNING)
+        self.assertEqual(self.published, [])
+
+    def test_state_change_wins_over_heartbeat(self):
+        self.collector.heartbeat(None, 1, power_state.RUNNING)
+        self.collector.update_status(None, 1, power_state.CRASHED)
+        self.collector.flush()
+        self.assertEqual(dbapi.guest_status_get(1).state, power_state.CRASHED)
+
+    def test_deleted_status_is_not_updated(self):
+        def statuses():
+            return get_session().query(models.GuestStatus).\
+                    filter(models.GuestStatus.instance_id.in_([1, 2])).\
+                    order_by(models.GuestStatus.instance_id).all()
+        dbapi.guest_status_delete(1)
+        dbapi.guest_status_delete(2)
+        deleted_at = [status.updated_at for status in statuses()]
+        self.collector.update_status(None, 1, power_state.RUNNING)
+        self.collector.heartbeat(None, 2)
+        self.collector.flush()
+        self.assertEqual([power_state.SHUTDOWN, power_state.SHUTDOWN],
+                         [status.state for status in statuses()])
+        self.assertEqual(deleted_at,
+                         [status.updated_at for status in statuses()])
+
+    def test_single_write_per_flush(self):
+        calls = []
+        self.stubs.Set(dbapi, 'guest_status_update_many',
+                       lambda states, alive: calls.append((states, alive)))
+        self.collector.update_status(None, 1, power_state.RUNNING)
+        self.collector.heartbeat(None, 1)
+        self.collector.heartbeat(None, 2)
+        self.collector.flush()
+        self.collector.flush()
+        self.assertEqual(calls, [({1: (power_state.RUNNING, None)}, set([2]))])
+
+    def test_failed_flush_is_retried(self):
+        update_many = dbapi.guest_status_update_many
+        def fail(states, alive):
+            raise Exception("database unavailable")
+        self.stubs.Set(dbapi, 'guest_status_update_many', fail)
+        self.collector.update_status(None, 1, power_state.RUNNING)
+        self.collector.flush()
+        self.assertEqual(self.published, [])
+        self.stubs.Set(dbapi, 'guest_status_update_many', update_many)
+        self.collector.flush()
+        self.assertEqual(dbapi.guest_status_get(1).state, power_state.RUNNING)
+
+
+class GuestStatusReportTest(test.TestCase):
+
+    def setUp(self):
+        super(GuestStatusReportTest, self).setUp()
+        self.casts = []
+        self.args = []
+        self.stubs.Set(rpc, 'cast', lambda ctxt, topic, msg:
+                       self.casts.append(msg['method']) or
+                       self.args.append(msg['args']))
+        self.stubs.Set(dbaas, 'LAST_REPORTED', None)
+        self.agent = dbaas.DBaaSAgent()
+
+    def test_reports_state_changes(self):
+        self.agent._report_status(1, power_state.RUNNING)
+        self.agent._report_status(1, power_state.CRASHED)
+        self.assertEqual(self.casts, ['update_status', 'update_status'])
+
+    def test_unchanged_state_is_not_reported(self):
+        self.agent._report_status(1, power_state.RUNNING)
+        self.agent._report_status(1, power_state.RUNNING)
+        self.assertEqual(self.casts, ['update_status'])
+
+    def test_heartbeat_when_due(self):
+        self.flags(guest_status_heartbeat_interval=0)
+        self.agent._report_status(1, power_state.RUNNING)
+        self.agent._report_status(1, power_state.RUNNING)
+        self.assertEqual(self.casts, ['update_status', 'heartbeat'])
+        self.assertEqual(self.args[-1], {'instance_id': 1,
+                                         'state': power_state.RUNNING})
@@ -0,0 +1,89 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for reddwarf.scheduler.simple.
+"""
+
+from nova import context
+from nova import db
+from nova import rpc
+from nova import test
+from nova.scheduler import driver
+
+from reddwarf.scheduler import simple
+
+
+class ScheduleCreateVolumesTest(test.TestCase):
+
+    def setUp(self):
+        super(ScheduleCreateVolumesTest, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(max_gigabytes=10)
+        self.casts = []
+        self.stubs.Set(rpc, 'cast',
+                       lambda ctxt, topic, msg: self.casts.append((topic,
+                                                                   msg)))
+        self.services = [db.service_create(self.context,
+                                           {'host': host,
+                                            'binary': 'nova-volume',
+                                            'topic': 'volume',
+                                            'report_count': 0})
+                         for host in ('host1', 'host2')]
+        self.volumes = []
+        self.scheduler = simple.SimpleScheduler()
+
+    def tearDown(self):
+        for volume in self.volumes:
+            db.volume_destroy(self.context, volume['id'])
+        for service in self.services:
+            db.service_destroy(self.context, service['id'])
+        super(ScheduleCreateVolumesTest, self).tearDown()
+
+    def _create_volumes(self, *sizes):
+        volumes = [db.volume_create(self.context, {'size': size})
+                   for size in sizes]
+        self.volumes.extend(volumes)
+        return [volume['id'] for volume in volumes]
+
+    def test_batch_larger_than_a_host_is_spread(self):
+        volume_ids = self._create_volumes(6, 6)
+        host = self.scheduler.schedule_create_volumes(self.context,
+                                                      volume_ids=volume_ids)
+        self.assertEqual(None, host)
+        hosts = [db.volume_get(self.context, volume_id)['host']
+                 for volume_id in volume_ids]
+        self.assertEqual(['host1', 'host2'], sorted(hosts))
+        casts = dict((topic, msg['args']['volume_ids'])
+                     for topic, msg in self.casts)
+        self.assertEqual({'volume.host1': [volume_ids[hosts.index('host1')]],
+                          'volume.host2': [volume_ids[hosts.index('host2')]]},
+                         casts)
+
+    def test_each_host_is_cast_its_volumes_at_once(self):
+        volume_ids = self._create_volumes(2, 2, 2)
+        self.scheduler.schedule_create_volumes(self.context,
+                                               volume_ids=volume_ids)
+        self.assertEqual(2, len(self.casts))
+        self.assertEqual(3, sum(len(msg['args']['volume_ids'])
+                                for topic, msg in self.casts))
+
+    def test_batch_too_large_for_all_hosts(self):
+        volume_ids = self._create_volumes(6, 6, 6)
+        self.assertRaises(driver.NoValidHost,
+                          self.scheduler.schedule_create_volumes,
+                          self.context, volume_ids=volume_ids)
+        self.assertEqual([], self.casts)
+        self.assertEqual([None, None, None],
+                         [db.volume_get(self.context, volume_id)['host']
+                          for volume_id in volume_ids])
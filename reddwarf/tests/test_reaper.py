@@ -16,10 +16,20 @@
 #    under the License.
 
 from datetime import timedelta
+
+from eventlet import event
+from eventlet import greenthread
+
 from nova import context
+from nova.compute import power_state
+from nova.compute import vm_states
 from nova.db import api as db_api
 from nova import test
 from nova import utils
+from reddwarf.db import api as reddwarf_db
+from reddwarf.dns.driver import DnsEntry
+from reddwarf.reaper import driver
+from reddwarf.reaper import tasks
 from reddwarf.reaper.driver import ReddwarfReaperDriver
 
 
@@ -30,17 +40,57 @@ class FakeVolumeApi(object):
 
     def __init__(self):
         self.deleted_volumes = []
+        self.failing_volumes = []
 
     def delete(self, context, volume):
+        if volume in self.failing_volumes:
+            raise RuntimeError("Volume could not be deleted")
         self.deleted_volumes.append(volume)
-    
+
+
+class FakeDnsApi(object):
+
+    def __init__(self):
+        self.deleted_entries = []
+
+    def delete_entry(self, context, name, type='A'):
+        self.deleted_entries.append(name)
+
+
+class FakeEntryFactory(object):
+
+    def create_entry(self, instance):
+        return DnsEntry(name="fake-%s" % instance['id'], content=None,
+                        type="A")
+
+
+class FakeTask(tasks.ReaperTask):
+
+    name = 'fake'
+    interval = 10
+    time_budget = 60
+    concurrency = 1
+
+    def __init__(self, driver, items=1):
+        super(FakeTask, self).__init__(driver)
+        self.items = items
+        self.finish = None
+
+    def run(self, context, deadline):
+        if self.finish:
+            self.finish.wait()
+        if isinstance(self.items, Exception):
+            raise self.items
+        return self.items
+
 
 class TestWhenAVolumeIsOrphaned(test.TestCase):
 
     def setUp(self):
         super(TestWhenAVolumeIsOrphaned, self).setUp()
         self.context = context.get_admin_context()
-        self.reaper_driver = ReddwarfReaperDriver(ORPHAN_TIME_OUT)
+        self.reaper_driver = ReddwarfReaperDriver(ORPHAN_TIME_OUT,
+                                                  ['orphan_volumes'])
         self.reaper_driver.volume_api = FakeVolumeApi()
         self.new_volume = self.create_orphaned_volume()
 
@@ -72,8 +122,193 @@ class TestWhenAVolumeIsOrphaned(test.TestCase):
         db_api.volume_update(self.context, volume_id,
                              {'updated_at':updated_at})
         self.reaper_driver.periodic_tasks(self.context)
+        self.reaper_driver.wait()
         self.assertEqual(len(self.reaper_driver.volume_api.deleted_volumes), 1)
 
     def test_an_new_orphan_is_left_alone(self):
         self.reaper_driver.periodic_tasks(self.context)
+        self.reaper_driver.wait()
         self.assertEqual(len(self.reaper_driver.volume_api.deleted_volumes), 0)
+
+
+class TestWhenManyVolumesAreOrphaned(test.TestCase):
+
+    def setUp(self):
+        super(TestWhenManyVolumesAreOrphaned, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(reddwarf_reaper_page_size=2,
+                   reddwarf_reaper_max_deletes_per_run=3,
+                   reddwarf_reaper_delete_rate=1000)
+        self.reaper_driver = ReddwarfReaperDriver(ORPHAN_TIME_OUT)
+        self.reaper_driver.volume_api = FakeVolumeApi()
+        updated_at = utils.utcnow() - timedelta(seconds=ORPHAN_TIME_OUT * 2)
+        self.volume_ids = []
+        for i in range(5):
+            volume = db_api.volume_create(self.context,
+                                          {'size': 1,
+                                           'status': 'available',
+                                           'attach_status': 'detached'})
+            db_api.volume_update(self.context, volume['id'],
+                                 {'updated_at': updated_at})
+            self.volume_ids.append(volume['id'])
+
+    def tearDown(self):
+        for volume_id in self.volume_ids:
+            db_api.volume_destroy(self.context, volume_id)
+        reddwarf_db.config_delete(driver.ORPHAN_VOLUME_CURSOR)
+        super(TestWhenManyVolumesAreOrphaned, self).tearDown()
+
+    def _cursor(self):
+        return int(reddwarf_db.config_get(driver.ORPHAN_VOLUME_CURSOR).value)
+
+    def test_run_stops_after_max_deletes(self):
+        self.reaper_driver.clean_up_volumes(self.context)
+        self.assertEqual(self.volume_ids[:3],
+                         sorted(self.reaper_driver.volume_api.deleted_volumes))
+        self.assertEqual(self.volume_ids[2], self._cursor())
+
+    def test_next_run_resumes_from_cursor(self):
+        self.reaper_driver.clean_up_volumes(self.context)
+        self.reaper_driver.volume_api = FakeVolumeApi()
+        self.reaper_driver.clean_up_volumes(self.context)
+        self.assertEqual(self.volume_ids[3:],
+                         sorted(self.reaper_driver.volume_api.deleted_volumes))
+        self.assertEqual(0, self._cursor())
+
+    def test_failed_delete_does_not_stop_the_rest(self):
+        self.reaper_driver.volume_api.failing_volumes = self.volume_ids[:1]
+        self.reaper_driver.clean_up_volumes(self.context)
+        self.assertEqual(self.volume_ids[1:3],
+                         sorted(self.reaper_driver.volume_api.deleted_volumes))
+
+    def test_no_page_is_started_after_the_deadline(self):
+        count = self.reaper_driver.clean_up_volumes(self.context, deadline=0)
+        self.assertEqual(0, count)
+        self.assertEqual([], self.reaper_driver.volume_api.deleted_volumes)
+
+
+class TestReaperTaskSchedule(test.TestCase):
+
+    def setUp(self):
+        super(TestReaperTaskSchedule, self).setUp()
+        self.context = context.get_admin_context()
+        self.reaper_driver = ReddwarfReaperDriver(ORPHAN_TIME_OUT,
+                                                  ['orphan_volumes'])
+        self.slow_task = FakeTask(self.reaper_driver)
+        self.slow_task.name = 'slow'
+        self.slow_task.interval = 0
+        self.slow_task.finish = event.Event()
+        self.fast_task = FakeTask(self.reaper_driver, items=3)
+        self.reaper_driver.tasks = [self.slow_task, self.fast_task]
+
+    def tearDown(self):
+        if not self.slow_task.finish.ready():
+            self.slow_task.finish.send()
+        self.reaper_driver.wait()
+        super(TestReaperTaskSchedule, self).tearDown()
+
+    def test_task_is_not_run_again_before_its_interval(self):
+        self.slow_task.finish.send()
+        self.reaper_driver.periodic_tasks(self.context)
+        self.reaper_driver.wait()
+        self.reaper_driver.periodic_tasks(self.context)
+        self.reaper_driver.wait()
+        self.assertEqual(1, self.fast_task.stats['runs'])
+        self.assertEqual(2, self.slow_task.stats['runs'])
+        self.fast_task.last_run_at -= self.fast_task.interval
+        self.reaper_driver.periodic_tasks(self.context)
+        self.reaper_driver.wait()
+        self.assertEqual(2, self.fast_task.stats['runs'])
+        self.assertEqual(6, self.fast_task.stats['items'])
+
+    def test_slow_task_does_not_hold_up_the_others(self):
+        self.reaper_driver.periodic_tasks(self.context)
+        greenthread.sleep(0)
+        self.assertEqual(1, self.fast_task.stats['runs'])
+        self.assertEqual(0, self.slow_task.stats['runs'])
+        self.reaper_driver.periodic_tasks(self.context)
+        self.assertEqual(1, self.slow_task.stats['skipped'])
+        self.slow_task.finish.send()
+        self.reaper_driver.wait()
+        self.assertEqual(1, self.slow_task.stats['runs'])
+
+    def test_failures_and_overruns_are_counted(self):
+        self.slow_task.finish.send()
+        self.slow_task.items = RuntimeError("Reaping failed")
+        self.fast_task.time_budget = -1
+        self.reaper_driver.periodic_tasks(self.context)
+        self.reaper_driver.wait()
+        metrics = self.reaper_driver.get_metrics()
+        self.assertEqual(1, metrics['slow']['failures'])
+        self.assertEqual(0, metrics['slow']['items'])
+        self.assertEqual(0, metrics['fake']['failures'])
+        self.assertEqual(1, metrics['fake']['overruns'])
+        self.assertEqual(1, metrics['fake']['run_time']['count'])
+
+
+class TestReaperInstanceTasks(test.TestCase):
+
+    def setUp(self):
+        super(TestReaperInstanceTasks, self).setUp()
+        self.context = context.get_admin_context()
+        self.reaper_driver = ReddwarfReaperDriver(ORPHAN_TIME_OUT,
+                                                  ['orphan_volumes'])
+        self.instance_ids = []
+
+    def tearDown(self):
+        for instance_id in self.instance_ids:
+            reddwarf_db.guest_status_delete(instance_id)
+            db_api.instance_destroy(self.context, instance_id)
+        super(TestReaperInstanceTasks, self).tearDown()
+
+    def _create_instance(self, vm_state, age=0):
+        instance = db_api.instance_create(self.context,
+                                          {'vm_state': vm_state})
+        updated_at = utils.utcnow() - timedelta(seconds=age)
+        db_api.instance_update(self.context, instance['id'],
+                               {'updated_at': updated_at})
+        reddwarf_db.guest_status_create(instance['id'])
+        self.instance_ids.append(instance['id'])
+        return instance['id']
+
+    def test_instance_building_too_long_is_failed(self):
+        self.flags(reddwarf_reaper_building_expiration_time=60)
+        stuck_id = self._create_instance(vm_states.BUILDING, age=120)
+        new_id = self._create_instance(vm_states.BUILDING)
+        task = tasks.BuildingInstanceTask(self.reaper_driver)
+        task.run_once(self.context)
+        stuck = db_api.instance_get(self.context, stuck_id)
+        self.assertEqual(vm_states.ERROR, stuck['vm_state'])
+        self.assertEqual(power_state.FAILED, stuck['power_state'])
+        self.assertEqual(power_state.FAILED,
+                         reddwarf_db.guest_status_get(stuck_id).state)
+        new = db_api.instance_get(self.context, new_id)
+        self.assertEqual(vm_states.BUILDING, new['vm_state'])
+        self.assertEqual(1, task.stats['items'])
+
+    def test_guest_status_of_deleted_instance_is_deleted(self):
+        deleted_id = self._create_instance(vm_states.ACTIVE)
+        live_id = self._create_instance(vm_states.ACTIVE)
+        db_api.instance_destroy(self.context, deleted_id)
+        self.instance_ids.remove(deleted_id)
+        task = tasks.StaleGuestStatusTask(self.reaper_driver)
+        task.run_once(self.context)
+        self.assertRaises(Exception, reddwarf_db.guest_status_get, deleted_id)
+        reddwarf_db.guest_status_get(live_id)
+        self.assertEqual(1, task.stats['items'])
+
+    def test_dns_record_without_instance_is_deleted(self):
+        self.flags(dns_instance_entry_factory=
+                   'reddwarf.tests.test_reaper.FakeEntryFactory')
+        live_id = self._create_instance(vm_states.ACTIVE)
+        reddwarf_db.rsdns_record_create("fake-%s" % live_id, "1")
+        reddwarf_db.rsdns_record_create("fake-gone", "2")
+        try:
+            self.reaper_driver.dns_api = FakeDnsApi()
+            task = tasks.DnsRecordTask(self.reaper_driver)
+            task.run_once(self.context)
+        finally:
+            reddwarf_db.rsdns_record_delete("fake-%s" % live_id)
+            reddwarf_db.rsdns_record_delete("fake-gone")
+        self.assertEqual(["fake-gone"],
+                         self.reaper_driver.dns_api.deleted_entries)
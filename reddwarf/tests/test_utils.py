@@ -12,9 +12,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
+from eventlet import greenthread
+
 from nova import test
 
 from reddwarf import exception
+from reddwarf import utils
 from reddwarf.utils import poll_until
 
 
@@ -44,3 +49,107 @@ class PollUntilTestCase(test.TestCase):
                             sleep_time=0)
         self.assertEqual(60, result)
 
+
+class BackoffTestCase(test.TestCase):
+
+    def _sleep_times(self, count, *args, **kwargs):
+        sleep_times = utils.backoff_sleep_times(*args, **kwargs)
+        return [sleep_times.next() for i in range(count)]
+
+    def test_fixed(self):
+        self.assertEqual([2, 2, 2], self._sleep_times(3, 2))
+
+    def test_exponential_with_cap(self):
+        self.assertEqual([1, 2, 4, 8, 10, 10],
+                         self._sleep_times(6, 1, 'exponential',
+                                           max_sleep_time=10))
+
+    def test_jitter_stays_within_bounds(self):
+        sleep_times = self._sleep_times(50, 1, 'jitter', max_sleep_time=10)
+        self.assertEqual(1, sleep_times[0])
+        for sleep_time in sleep_times:
+            self.assertTrue(1 <= sleep_time <= 10)
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError, self._sleep_times, 1, 1, 'linear')
+
+    def test_poll_until_with_backoff(self):
+        sleeps = []
+        self.stubs.Set(utils.greenthread, 'sleep', sleeps.append)
+        numbers = iter(range(5))
+        result = poll_until(numbers.next, lambda n: n == 4, sleep_time=1,
+                            backoff='exponential', max_sleep_time=4)
+        self.assertEqual(4, result)
+        self.assertEqual([1, 2, 4, 4], sleeps)
+
+    def test_budget_spaces_out_polls(self):
+        sleeps = []
+        self.stubs.Set(utils.greenthread, 'sleep', sleeps.append)
+        self.stubs.Set(utils.time, 'time', lambda: 100.0)
+        budget = utils.RateBudget(rate=10)
+        for i in range(3):
+            budget.acquire()
+        self.assertEqual(2, len(sleeps))
+        self.assertAlmostEqual(0.1, sleeps[0])
+        self.assertAlmostEqual(0.2, sleeps[1])
+
+
+class LatencyHistogramTestCase(test.TestCase):
+
+    def test_record(self):
+        histogram = utils.LatencyHistogram(buckets=(0.1, 1))
+        for seconds in (0.05, 0.1, 0.5, 2, 3):
+            histogram.record(seconds)
+        metrics = histogram.to_dict()
+        self.assertEqual([(0.1, 2), (1, 1), ('inf', 2)], metrics['buckets'])
+        self.assertEqual(5, metrics['count'])
+        self.assertAlmostEqual(5.65, metrics['total'])
+        self.assertEqual(3, metrics['max'])
+
+
+class WaitForStatusTestCase(test.TestCase):
+
+    def setUp(self):
+        super(WaitForStatusTestCase, self).setUp()
+        self.key = utils.status_key('volume', 1)
+        self.status = 'creating'
+
+    def tearDown(self):
+        utils.WAIT_METRICS.clear()
+        super(WaitForStatusTestCase, self).tearDown()
+
+    def _change_status(self, status):
+        self.status = status
+        utils.notify_status_change(self.key)
+
+    def test_wakes_up_on_notify(self):
+        greenthread.spawn_after(0.1, self._change_status, 'available')
+        start = time.time()
+        result = utils.wait_for_status(self.key, lambda: self.status,
+                                       lambda status: status == 'available',
+                                       sleep_time=30, time_out=60)
+        self.assertEqual('available', result)
+        self.assertTrue(time.time() - start < 5)
+        self.assertFalse(self.key in utils.STATUS_WAITERS)
+
+    def test_falls_back_to_polling_without_notify(self):
+        def change_silently():
+            self.status = 'available'
+        greenthread.spawn_after(0.1, change_silently)
+        result = utils.wait_for_status(self.key, lambda: self.status,
+                                       lambda status: status == 'available',
+                                       sleep_time=0.05, max_sleep_time=0.1,
+                                       time_out=5)
+        self.assertEqual('available', result)
+
+    def test_when_timeout_occurs(self):
+        self.assertRaises(exception.PollTimeOut, utils.wait_for_status,
+                          self.key, lambda: self.status,
+                          lambda status: status == 'available',
+                          sleep_time=0.05, time_out=0.2)
+        self.assertFalse(self.key in utils.STATUS_WAITERS)
+
+    def test_records_wait_time_per_phase(self):
+        for i in range(2):
+            utils.wait_for_status(self.key, lambda: True, phase='provision')
+        self.assertEqual(2, utils.WAIT_METRICS['provision']['count'])
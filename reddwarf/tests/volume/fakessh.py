@@ -0,0 +1,127 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+A fake ssh server along with clients having the parts of the paramiko
+SSHClient, Transport and Channel interfaces used by the SAN driver, so the
+driver can be tested without a SAN to talk to.
+"""
+
+from StringIO import StringIO
+
+import paramiko
+
+
+class FakeSshServer(object):
+    """Runs the commands sent by its clients through a handler.
+
+    The handler is called with the connection number and the command, and
+    returns the stdout and exit status of the command. Every command run
+    is kept in commands as a (connection number, command) tuple.
+
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.commands = []
+        self.transports = []
+
+    def client(self):
+        """Creates a client, in place of paramiko.SSHClient."""
+        return FakeSSHClient(self)
+
+    def drop_connections(self):
+        for transport in self.transports:
+            transport.active = False
+
+
+class FakeSSHClient(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, port=22, username=None, password=None,
+                pkey=None, timeout=None):
+        self.transport = FakeTransport(self.server,
+                                       len(self.server.transports))
+        self.server.transports.append(self.transport)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class FakeTransport(object):
+
+    def __init__(self, server, connection):
+        self.server = server
+        self.connection = connection
+        self.sock = FakeSocket()
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        pass
+
+    def open_session(self):
+        if not self.active:
+            raise paramiko.SSHException('SSH session not active')
+        return FakeChannel(self)
+
+    def close(self):
+        self.active = False
+
+
+class FakeSocket(object):
+
+    def settimeout(self, timeout):
+        pass
+
+    def shutdown(self, how):
+        pass
+
+
+class FakeChannel(object):
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.stdout = ''
+        self.exit_status = -1
+
+    def exec_command(self, command):
+        server = self.transport.server
+        server.commands.append((self.transport.connection, command))
+        self.stdout, self.exit_status = server.handler(
+            self.transport.connection, command)
+
+    def makefile(self, mode='r', bufsize=-1):
+        return StringIO(self.stdout)
+
+    def makefile_stderr(self, mode='r', bufsize=-1):
+        return StringIO('')
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def close(self):
+        pass
@@ -0,0 +1,90 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for the batch operations of reddwarf.volume.api.
+"""
+
+from nova import context
+from nova import db
+from nova import rpc
+from nova import test
+
+from reddwarf.volume.api import API
+
+
+class VolumeApiBatchTest(test.TestCase):
+
+    def setUp(self):
+        super(VolumeApiBatchTest, self).setUp()
+        self.context = context.get_admin_context()
+        self.api = API()
+        self.casts = []
+        self.calls = []
+        self.stubs.Set(rpc, 'cast', lambda ctxt, topic, msg:
+                       self.casts.append((topic, msg)))
+        self.stubs.Set(rpc, 'call', self._call)
+        self.volume_ids = []
+
+    def tearDown(self):
+        for volume_id in self.volume_ids:
+            db.volume_destroy(self.context, volume_id)
+        super(VolumeApiBatchTest, self).tearDown()
+
+    def _call(self, ctxt, topic, msg):
+        self.calls.append((topic, msg))
+        return [{'volume_id': volume_id, 'error': None}
+                for volume_id in msg['args']['volume_ids']]
+
+    def _create_volume(self, host, status='available'):
+        volume = db.volume_create(self.context,
+                                  {'size': 1,
+                                   'host': host,
+                                   'status': status,
+                                   'attach_status': 'detached'})
+        self.volume_ids.append(volume['id'])
+        return volume['id']
+
+    def test_create_volumes_casts_once(self):
+        volumes = self.api.create_volumes(self.context,
+                                          [{'size': 1, 'name': 'a'},
+                                           {'size': 2, 'name': 'b'}])
+        self.volume_ids.extend(volume['id'] for volume in volumes)
+        self.assertEqual(1, len(self.casts))
+        topic, msg = self.casts[0]
+        self.assertEqual('create_volumes', msg['method'])
+        self.assertEqual(self.volume_ids, msg['args']['volume_ids'])
+        self.assertEqual([1, 2], [volume['size'] for volume in volumes])
+
+    def test_delete_volumes_calls_each_host_once(self):
+        host1_ids = [self._create_volume('host1') for i in range(2)]
+        host2_id = self._create_volume('host2')
+        busy_id = self._create_volume('host1', status='in-use')
+        volume_ids = host1_ids + [host2_id, busy_id, 9999]
+        results = self.api.delete_volumes(self.context, volume_ids)
+        self.assertEqual(2, len(self.calls))
+        calls = dict((topic, msg['args']['volume_ids'])
+                     for topic, msg in self.calls)
+        self.assertEqual(host1_ids, calls['volume.host1'])
+        self.assertEqual([host2_id], calls['volume.host2'])
+        self.assertEqual(volume_ids,
+                         [result['volume_id'] for result in results])
+        self.assertEqual([None, None, None],
+                         [result['error'] for result in results[:3]])
+        self.assertEqual("Volume status must be available",
+                         results[3]['error'])
+        self.assertEqual("Volume 9999 not found", results[4]['error'])
+        self.assertEqual('deleting',
+                         db.volume_get(self.context, host2_id)['status'])
+        self.assertEqual('in-use',
+                         db.volume_get(self.context, busy_id)['status'])
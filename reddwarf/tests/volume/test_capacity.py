@@ -0,0 +1,94 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from nova import test
+
+from reddwarf.volume import capacity
+from reddwarf.volume.capacity import SanCapacityTracker
+
+
+class SanCapacityTrackerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(SanCapacityTrackerTestCase, self).setUp()
+        self.prov_avail = 100
+        self.fetches = 0
+        self.spawned = []
+        self.now = 1000.0
+        self.stubs.Set(time, 'time', lambda: self.now)
+        self.stubs.Set(capacity.greenthread, 'spawn_n',
+                       lambda func, *args: self.spawned.append(func))
+        self.tracker = SanCapacityTracker(self._get_capacity, ttl=60,
+                                          reconcile_size=50)
+
+    def _get_capacity(self):
+        self.fetches += 1
+        return {'prov_avail': self.prov_avail}
+
+    def test_snapshot_is_cached(self):
+        self.assertEqual(100, self.tracker.available())
+        self.prov_avail = 10
+        self.now += 59
+        self.assertEqual(100, self.tracker.available())
+        self.assertEqual(1, self.fetches)
+        self.assertEqual([], self.spawned)
+
+    def test_stale_snapshot_refreshed_in_background(self):
+        self.tracker.available()
+        self.prov_avail = 10
+        self.now += 60
+        self.assertEqual(100, self.tracker.available())
+        self.assertEqual(100, self.tracker.available())
+        self.assertEqual(1, len(self.spawned))
+        self.spawned[0]()
+        self.assertEqual(10, self.tracker.available())
+        self.assertFalse(self.tracker.refreshing)
+
+    def test_reservations_taken_off_the_snapshot(self):
+        self.assertTrue(self.tracker.reserve('1', 40))
+        self.assertTrue(self.tracker.reserve('2', 40))
+        self.assertFalse(self.tracker.reserve('3', 40))
+        self.assertEqual(20, self.tracker.available())
+        self.assertEqual(1, self.fetches)
+
+    def test_released_space_kept_until_next_refresh(self):
+        self.tracker.reserve('1', 40)
+        self.now += 1
+        self.tracker.release('1')
+        self.assertEqual(60, self.tracker.available())
+        # The SAN now counts the volume as provisioned.
+        self.prov_avail = 60
+        self.now += 1
+        self.tracker.refresh()
+        self.assertEqual(60, self.tracker.available())
+        self.assertEqual({}, self.tracker.reservations)
+
+    def test_refresh_started_before_release_keeps_reservation(self):
+        self.tracker.reserve('1', 40)
+        self.tracker.release('1')
+        self.tracker.refresh()
+        self.assertEqual(60, self.tracker.available())
+
+    def test_large_allocation_reconciled_with_san(self):
+        self.tracker.available()
+        self.prov_avail = 40
+        self.assertFalse(self.tracker.reserve('1', 50))
+        self.assertEqual(2, self.fetches)
+        self.assertEqual(40, self.tracker.available())
+
+    def test_shrinking_reserves_nothing(self):
+        self.assertTrue(self.tracker.reserve('1', -10))
+        self.assertEqual({}, self.tracker.reservations)
@@ -0,0 +1,135 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for the batch operations of reddwarf.volume.manager.
+"""
+
+from eventlet import greenthread
+
+from nova import context
+from nova import db
+from nova import rpc
+from nova import test
+
+from reddwarf.volume.driver import ReddwarfVolumeDriver
+from reddwarf.volume.manager import ReddwarfVolumeManager
+
+
+class FakeDriver(ReddwarfVolumeDriver):
+
+    def __init__(self):
+        super(FakeDriver, self).__init__()
+        self.running = 0
+        self.most_running = 0
+        self.assigned = []
+        self.deleted = []
+
+    def create_volume(self, volume):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        greenthread.sleep(0)
+        self.running -= 1
+        if volume['display_name'] == 'bad':
+            raise RuntimeError("Could not create volume")
+
+    def reserve_space(self, volume_id, size):
+        return True
+
+    def create_export(self, context, volume):
+        pass
+
+    def remove_export(self, context, volume):
+        pass
+
+    def delete_volume(self, volume):
+        self.deleted.append(volume['id'])
+
+    def assign_volume(self, volume_id, host):
+        if host == 'bad_host':
+            raise RuntimeError("Unknown server")
+        self.assigned.append((volume_id, host))
+
+
+class VolumeManagerBatchTest(test.TestCase):
+
+    def setUp(self):
+        super(VolumeManagerBatchTest, self).setUp()
+        self.context = context.get_admin_context()
+        self.stubs.Set(rpc, 'fanout_cast', lambda ctxt, topic, msg: None)
+        self.manager = ReddwarfVolumeManager()
+        self.manager.driver = FakeDriver()
+        self.volume_ids = []
+
+    def tearDown(self):
+        for volume_id in self.volume_ids:
+            try:
+                db.volume_destroy(self.context, volume_id)
+            except Exception:
+                pass
+        super(VolumeManagerBatchTest, self).tearDown()
+
+    def _create_volume(self, name='vol', status='creating'):
+        volume = db.volume_create(self.context,
+                                  {'size': 1,
+                                   'host': self.manager.host,
+                                   'status': status,
+                                   'attach_status': 'detached',
+                                   'display_name': name})
+        self.volume_ids.append(volume['id'])
+        return volume['id']
+
+    def test_create_volumes(self):
+        good_id = self._create_volume()
+        bad_id = self._create_volume('bad')
+        results = self.manager.create_volumes(self.context,
+                                              [good_id, bad_id])
+        self.assertEqual([good_id, bad_id],
+                         [result['volume_id'] for result in results])
+        self.assertEqual(None, results[0]['error'])
+        self.assertEqual("Could not create volume", results[1]['error'])
+        self.assertEqual('available',
+                         db.volume_get(self.context, good_id)['status'])
+        self.assertEqual('error',
+                         db.volume_get(self.context, bad_id)['status'])
+
+    def test_publish_error_does_not_mask_a_create_error(self):
+        def fail(ctxt, topic, msg):
+            raise IOError("Socket closed")
+        self.stubs.Set(rpc, 'fanout_cast', fail)
+        bad_id = self._create_volume('bad')
+        self.assertRaises(RuntimeError, self.manager.create_volume,
+                          self.context, bad_id)
+
+    def test_concurrency_is_bounded(self):
+        self.flags(volume_batch_concurrency=2)
+        volume_ids = [self._create_volume() for i in range(5)]
+        self.manager.create_volumes(self.context, volume_ids)
+        self.assertEqual(2, self.manager.driver.most_running)
+
+    def test_delete_volumes(self):
+        volume_ids = [self._create_volume(status='deleting')
+                      for i in range(3)]
+        results = self.manager.delete_volumes(self.context, volume_ids)
+        self.assertEqual([None, None, None],
+                         [result['error'] for result in results])
+        self.assertEqual(volume_ids, self.manager.driver.deleted)
+
+    def test_assign_volumes(self):
+        results = self.manager.assign_volumes(self.context,
+                                              [[1, 'host1'],
+                                               [2, 'bad_host']])
+        self.assertEqual([{'volume_id': 1, 'error': None},
+                          {'volume_id': 2, 'error': "Unknown server"}],
+                         results)
+        self.assertEqual([(1, 'host1')], self.manager.driver.assigned)
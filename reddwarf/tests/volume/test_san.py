@@ -0,0 +1,203 @@
+#    Copyright 2012 OpenStack LLC
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import paramiko
+
+from nova import exception as nova_exception
+from nova import test
+
+from reddwarf.tests.volume.fakessh import FakeSshServer
+from reddwarf.volume import san
+
+
+CLIQ_SUCCESS = '<gauche version="1.0"><response result="0"/></gauche>'
+CLIQ_FAILURE = '<gauche version="1.0"><response result="1"/></gauche>'
+VOLUME_INFO = ('<gauche version="1.0"><response result="0">'
+               '<volume name="vol-1" iscsiIqn="iqn.vol-1">'
+               '<status value="2"/></volume></response></gauche>')
+
+
+class FakeClock(object):
+    """Stands in for the time module, a second passing on each call."""
+
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+class SanSshTestCase(test.TestCase):
+
+    def setUp(self):
+        super(SanSshTestCase, self).setUp()
+        self.failures = {}
+        self.server = FakeSshServer(self._handle)
+        self.stubs.Set(san.paramiko, 'SSHClient', self.server.client)
+        self.flags(san_ip='127.0.0.1', san_password='password',
+                   ssh_min_pool_conn=1, ssh_max_pool_conn=3,
+                   num_tries=2)
+        self.stubs.Set(san.greenthread, 'sleep', lambda seconds: None)
+        self.driver = san.ReddwarfHpSanISCSIDriver()
+
+    def _handle(self, connection, command):
+        for failing, count in self.failures.items():
+            if count and failing in command:
+                self.failures[failing] -= 1
+                return "failed", 1
+        if command.startswith('getVolumeInfo volumeName=vol-1'):
+            return VOLUME_INFO, 0
+        if command.startswith(('get', 'assign')):
+            return CLIQ_SUCCESS, 0
+        if command.startswith('bad'):
+            return CLIQ_FAILURE, 0
+        return "ran %s" % command, 0
+
+    def test_run_ssh(self):
+        self.assertEqual(("ran hello", ""), self.driver._run_ssh("hello"))
+
+    def test_batch_runs_over_one_connection(self):
+        results = self.driver._run_ssh_batch(["one", "two", "three"])
+        self.assertEqual(["ran one", "ran two", "ran three"],
+                         [stdout for stdout, stderr in results])
+        self.assertEqual(set([0]),
+                         set(conn for conn, cmd in self.server.commands))
+
+    def test_only_failed_commands_are_retried(self):
+        self.failures['two'] = 1
+        results = self.driver._run_ssh_batch(["one", "two"], attempts=2)
+        self.assertEqual("ran two", results[1][0])
+        self.assertEqual(["one", "two", "two"],
+                         [cmd for conn, cmd in self.server.commands])
+
+    def test_command_failing_every_attempt(self):
+        self.failures['two'] = 2
+        self.assertRaises(paramiko.SSHException,
+                          self.driver._run_ssh_batch, ["one", "two"],
+                          attempts=2)
+
+    def test_ordered_batch_stops_at_a_failure(self):
+        self.failures['two'] = 1
+        results = self.driver._run_ssh_batch(["one", "two", "three"],
+                                             ordered=True,
+                                             raise_on_failure=False)
+        self.assertEqual("ran one", results[0][0])
+        self.assertTrue(isinstance(results[1], Exception))
+        self.assertTrue(isinstance(results[2], paramiko.SSHException))
+        self.assertEqual(["one", "two"],
+                         [cmd for conn, cmd in self.server.commands])
+
+    def test_ordered_batch_is_retried_from_the_failure(self):
+        self.failures['two'] = 1
+        results = self.driver._run_ssh_batch(["one", "two", "three"],
+                                             attempts=2, ordered=True)
+        self.assertEqual(["ran one", "ran two", "ran three"],
+                         [stdout for stdout, stderr in results])
+        self.assertEqual(["one", "two", "two", "three"],
+                         [cmd for conn, cmd in self.server.commands])
+
+    def test_dropped_connection_replaced(self):
+        self.driver._run_ssh("one")
+        self.server.drop_connections()
+        self.assertEqual(("ran two", ""), self.driver._run_ssh("two"))
+        metrics = self.driver.get_metrics()['ssh_pool']
+        self.assertEqual(1, metrics['dropped'])
+        self.assertEqual(1, metrics['size'])
+
+    def test_cliq_batch(self):
+        results = self.driver._cliq_run_xml_batch(
+            [("getVolumeInfo", {'volumeName': 'vol-1'}),
+             ("getClusterInfo", {'clusterName': 'cluster'})])
+        self.assertEqual(2, len(results))
+        self.assertEqual("0", results[0].find("response").attrib['result'])
+        self.assertEqual(["getVolumeInfo volumeName=vol-1 output=XML",
+                          "getClusterInfo clusterName=cluster output=XML"],
+                         sorted([cmd for conn, cmd in self.server.commands],
+                                reverse=True))
+
+    def test_cliq_batch_leaves_the_args_alone(self):
+        cliq_args = {'volumeName': 'vol-1'}
+        self.driver._cliq_run_xml_batch([("getVolumeInfo", cliq_args)])
+        self.assertEqual({'volumeName': 'vol-1'}, cliq_args)
+
+    def test_cliq_batch_checks_results(self):
+        self.assertRaises(nova_exception.Error,
+                          self.driver._cliq_run_xml_batch,
+                          [("getVolumeInfo", {}), ("badVerb", {})])
+
+    def test_assign_volumes(self):
+        self.failures['volumeName=2 '] = 2
+        errors = self.driver.assign_volumes([(1, 'host1'), (2, 'host1'),
+                                             (3, 'host2')])
+        self.assertEqual(None, errors[0])
+        self.assertTrue(errors[1])
+        self.assertEqual(None, errors[2])
+        self.assertEqual(4, len(self.server.commands))
+
+    def test_assign_volume_then_gets_its_info(self):
+        info = self.driver.assign_volume('vol-1', 'host1')
+        self.assertEqual("iqn.vol-1", info['volume.iscsiIqn'])
+        self.assertEqual("2", info['status.value'])
+        verbs = [cmd.split()[0] for conn, cmd in self.server.commands]
+        self.assertEqual(["assignVolumeToServer", "getVolumeInfo"], verbs)
+
+    def test_metrics(self):
+        self.driver._run_ssh_batch(["one", "two"])
+        metrics = self.driver.get_metrics()['ssh_pool']
+        self.assertEqual(1, metrics['wait_time']['count'])
+        self.assertEqual(2, metrics['command_time']['count'])
+
+    def test_command_time_is_per_command(self):
+        self.stubs.Set(san, 'time', FakeClock())
+        self.driver._run_ssh_batch(["one", "two", "three"])
+        command_time = self.driver.get_metrics()['ssh_pool']['command_time']
+        self.assertEqual(3, command_time['count'])
+        self.assertEqual(1, command_time['max'])
+
+
+class SSHPoolTestCase(test.TestCase):
+
+    def setUp(self):
+        super(SSHPoolTestCase, self).setUp()
+        self.server = FakeSshServer(lambda conn, cmd: ("", 0))
+        self.stubs.Set(san.paramiko, 'SSHClient', self.server.client)
+        self.flags(san_ip='127.0.0.1', san_password='password')
+        self.pool = san.SSHPool(min_size=1, max_size=3, idle_timeout=10)
+
+    def test_grows_on_demand(self):
+        clients = [self.pool.get() for i in range(3)]
+        self.assertEqual(3, self.pool.current_size)
+        self.assertEqual(3, len(set(clients)))
+        for ssh in clients:
+            self.pool.put(ssh)
+        self.assertEqual(3, self.pool.free())
+
+    def test_most_recently_used_handed_out_first(self):
+        first, second = self.pool.get(), self.pool.get()
+        self.pool.put(first)
+        self.pool.put(second)
+        self.assertTrue(self.pool.get() is second)
+
+    def test_idle_connections_reaped(self):
+        clients = [self.pool.get() for i in range(3)]
+        for ssh in clients:
+            self.pool.put(ssh)
+        for ssh in clients:
+            self.pool.idle_since[ssh] = time.time() - 10
+        self.pool.get()
+        self.assertEqual(1, self.pool.current_size)
+        self.assertEqual(2, self.pool.stats['reaped'])
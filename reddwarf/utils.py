@@ -12,29 +12,236 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
+import random
 import time
 
-from nova.utils import LoopingCall
-from nova.utils import LoopingCallDone
+from eventlet import event
+from eventlet import greenthread
+from eventlet import timeout
+
+from nova import flags
+from nova import log as logging
+from nova import rpc
 
 from reddwarf import exception
 
 
+LOG = logging.getLogger('reddwarf.utils')
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('reddwarf_status_poll_max_interval', 16,
+                     'Longest time in seconds to wait for a status change '
+                     'event before checking the status again.')
+flags.DEFINE_integer('reddwarf_db_poll_rate', 20,
+                     'Most status polls per second made against the database '
+                     'by all the waits in a process sharing db_poll_budget.')
+
+DB_POLL_BUDGET = None
+
+# Events waited on by wait_for_status, keyed by status_key.
+STATUS_WAITERS = {}
+
+# Time spent in wait_for_status for each phase.
+WAIT_METRICS = {}
+
+
+class RateBudget(object):
+    """Bounds how often polls happen across every wait sharing the budget.
+
+    Each call to acquire reserves the next free slot, rate slots being
+    available per second, and sleeps until that slot comes around.
+
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.time()
+
+    def acquire(self):
+        now = time.time()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            greenthread.sleep(slot - now)
+
+
+class LatencyHistogram(object):
+    """Counts how many recorded times fall within each bucket.
+
+    Each bucket holds the times up to its bound in seconds that are over
+    the bound of the one before; a last bucket holds anything longer.
+
+    """
+
+    BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self):
+        bounds = list(self.buckets) + ['inf']
+        return {'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'buckets': zip(bounds, self.counts)}
+
+
+def db_poll_budget():
+    """Returns the budget shared by all the waits polling the database."""
+    global DB_POLL_BUDGET
+    if DB_POLL_BUDGET is None:
+        DB_POLL_BUDGET = RateBudget(FLAGS.reddwarf_db_poll_rate)
+    return DB_POLL_BUDGET
+
+
+def backoff_sleep_times(sleep_time, backoff=None, max_sleep_time=None):
+    """Generates the time to sleep before each successive poll.
+
+    :param backoff: None to always sleep sleep_time, 'exponential' to
+                    double it each time, or 'jitter' for decorrelated
+                    jitter, a random time between sleep_time and three
+                    times the previous sleep.
+    :param max_sleep_time: the longest time to sleep between polls
+
+    """
+    if backoff not in (None, 'exponential', 'jitter'):
+        raise ValueError("Unknown backoff strategy %s" % backoff)
+    current = sleep_time
+    while True:
+        if max_sleep_time is not None:
+            current = min(current, max_sleep_time)
+        yield current
+        if backoff == 'exponential':
+            current = current * 2
+        elif backoff == 'jitter':
+            current = random.uniform(sleep_time, current * 3)
+
+
 def poll_until(retriever, condition=lambda value: value,
-               sleep_time=1, time_out=None):
+               sleep_time=1, time_out=None, backoff=None,
+               max_sleep_time=None, budget=None):
     """Retrieves object until it passes condition, then returns it.
 
     If time_out_limit is passed in, PollTimeOut will be raised once that
     amount of time is eclipsed.
 
+    The time between polls follows the backoff strategy, as explained in
+    backoff_sleep_times. If a RateBudget is given each poll waits its turn
+    in it, bounding the polling done by every wait sharing the budget.
+
     """
     start_time = time.time()
-
-    def poll_and_check():
+    sleep_times = backoff_sleep_times(sleep_time, backoff, max_sleep_time)
+    while True:
+        if budget is not None:
+            budget.acquire()
         obj = retriever()
         if condition(obj):
-            raise LoopingCallDone(retvalue=obj)
+            return obj
         if time_out is not None and time.time() > start_time + time_out:
             raise exception.PollTimeOut
-    lc = LoopingCall(f=poll_and_check).start(sleep_time, True)
-    return lc.wait()
\ No newline at end of file
+        greenthread.sleep(sleep_times.next())
+
+
+def status_key(kind, id):
+    """Returns the key under which status changes of a resource are
+    published, such as status_key('volume', 5)."""
+    return "%s:%s" % (kind, id)
+
+
+def notify_status_change(*keys):
+    """Wakes up any wait_for_status calls in this process waiting on the
+    given keys."""
+    for key in keys:
+        for waiter in STATUS_WAITERS.get(key, ()):
+            if not waiter.ready():
+                waiter.send()
+
+
+def publish_status_change(ctxt, *keys):
+    """Tells every compute node the status behind the given keys has
+    changed, so any provisioning waiting on it can resume.
+
+    Errors are logged rather than raised, as a waiter whose event is lost
+    retrieves the status anyway once its sleep time is up.
+
+    """
+    try:
+        rpc.fanout_cast(ctxt, FLAGS.compute_topic,
+                        {'method': 'status_changed',
+                         'args': {'keys': list(keys)}})
+    except Exception:
+        LOG.exception(_("Unable to publish the status change of %s")
+                      % ", ".join(keys))
+
+
+def wait_for_status(key, retriever, condition=lambda value: value,
+                    sleep_time=1, max_sleep_time=None, time_out=None,
+                    phase=None, backoff='exponential', budget=None):
+    """Retrieves object until it passes condition, then returns it.
+
+    Works like poll_until, but rather than sleeping between retrievals it
+    waits for notify_status_change to be called with the given key. Should
+    the event be lost it retrieves the object anyway once the sleep time
+    is up, backing off up to max_sleep_time.
+
+    The time spent waiting is recorded in WAIT_METRICS under phase.
+
+    """
+    if max_sleep_time is None:
+        max_sleep_time = FLAGS.reddwarf_status_poll_max_interval
+    start_time = time.time()
+    sleep_times = backoff_sleep_times(sleep_time, backoff, max_sleep_time)
+    waiter = event.Event()
+    # Register before the first retrieval so a change in between is not lost.
+    STATUS_WAITERS.setdefault(key, set()).add(waiter)
+    try:
+        while True:
+            if budget is not None:
+                budget.acquire()
+            obj = retriever()
+            if condition(obj):
+                return obj
+            wait_time = sleep_times.next()
+            if time_out is not None:
+                remaining = start_time + time_out - time.time()
+                if remaining <= 0:
+                    raise exception.PollTimeOut
+                wait_time = min(wait_time, remaining)
+            with timeout.Timeout(wait_time, False):
+                waiter.wait()
+            if waiter.ready():
+                waiter.reset()
+    finally:
+        waiters = STATUS_WAITERS.get(key)
+        waiters.discard(waiter)
+        if not waiters:
+            del STATUS_WAITERS[key]
+        if phase is not None:
+            _record_wait_time(phase, time.time() - start_time)
+
+
+def get_wait_metrics():
+    """Returns the count, total and longest time waited in wait_for_status
+    for each phase."""
+    return dict((phase, dict(metrics))
+                for phase, metrics in WAIT_METRICS.iteritems())
+
+
+def _record_wait_time(phase, elapsed):
+    metrics = WAIT_METRICS.setdefault(phase, {'count': 0, 'total': 0.0,
+                                              'max': 0.0})
+    metrics['count'] += 1
+    metrics['total'] += elapsed
+    metrics['max'] = max(metrics['max'], elapsed)
+    LOG.debug("Waited %.2f seconds for %s" % (elapsed, phase))
@@ -17,14 +17,21 @@
 Handles all requests relating to volumes.
 """
 
+from eventlet import greenpool
+
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova import quota
 from nova import rpc
+from nova import utils
 from nova.volume import api as nova_volume_api
 
+from reddwarf.db import api as dbapi
+
 
 FLAGS = flags.FLAGS
+flags.DECLARE('volume_batch_concurrency', 'reddwarf.volume.manager')
 
 LOG = logging.getLogger('reddwarf.volume')
 
@@ -40,6 +47,94 @@ class API(nova_volume_api.API):
                            "volume_id": volume_id,
                            "host": host}})
 
+    def create_volumes(self, context, volumes):
+        """Creates many volumes, to be scheduled onto a volume host together.
+
+        :param volumes: list of dicts holding the size and optionally the
+                        name and description of each volume
+        :returns: the volumes created
+
+        """
+        count = len(volumes)
+        size = sum(int(volume['size']) for volume in volumes)
+        if quota.allowed_volumes(context, count, size) < count:
+            pid = context.project_id
+            LOG.warn(_("Quota exceeded for %(pid)s, tried to create "
+                       "%(count)s volumes of %(size)sG in all") % locals())
+            raise quota.QuotaError(_("Volume quota exceeded. You cannot "
+                                     "create %(count)s volumes of %(size)sG "
+                                     "in all") % locals())
+        volume_refs = []
+        for volume in volumes:
+            options = {'size': int(volume['size']),
+                       'user_id': context.user_id,
+                       'project_id': context.project_id,
+                       'snapshot_id': None,
+                       'availability_zone': FLAGS.storage_availability_zone,
+                       'status': "creating",
+                       'attach_status': "detached",
+                       'display_name': volume.get('name'),
+                       'display_description': volume.get('description')}
+            volume_refs.append(self.db.volume_create(context, options))
+        rpc.cast(context,
+                 FLAGS.scheduler_topic,
+                 {"method": "create_volumes",
+                  "args": {"topic": FLAGS.volume_topic,
+                           "volume_ids": [volume_ref['id']
+                                          for volume_ref in volume_refs]}})
+        return volume_refs
+
+    def assign_volumes(self, context, assignments):
+        """Assigns each of a list of (volume_id, host) pairs to its host,
+        returning a dict with the volume_id and error, if any, of each."""
+        return rpc.call(context,
+                        FLAGS.volume_topic,
+                        {"method": "assign_volumes",
+                         "args": {"assignments": assignments}})
+
+    def delete_volumes(self, context, volume_ids):
+        """Deletes many volumes with one call to each of their hosts,
+        returning a dict with the volume_id and error, if any, of each."""
+        elevated = context.elevated()
+        volumes = dict((volume['id'], volume) for volume in
+                       dbapi.volume_get_all_by_ids(elevated, volume_ids))
+        errors = {}
+        by_host = {}
+        for volume_id in volume_ids:
+            volume = volumes.get(volume_id)
+            if volume is None or (not context.is_admin and
+                                  volume['project_id'] != context.project_id):
+                errors[volume_id] = _("Volume %s not found") % volume_id
+            elif volume['status'] != "available":
+                errors[volume_id] = _("Volume status must be available")
+            else:
+                by_host.setdefault(volume['host'], []).append(volume_id)
+        dbapi.volume_update_many(elevated,
+                                 [volume_id for ids in by_host.values()
+                                  for volume_id in ids],
+                                 {'status': 'deleting',
+                                  'terminated_at': utils.utcnow()})
+
+        def delete_on_host(host, ids):
+            try:
+                return rpc.call(context,
+                                self.db.queue_get_for(context,
+                                                      FLAGS.volume_topic,
+                                                      host),
+                                {"method": "delete_volumes",
+                                 "args": {"volume_ids": ids}})
+            except Exception as e:
+                LOG.exception(_("Error deleting volumes on %s") % host)
+                return [{'volume_id': volume_id, 'error': str(e)}
+                        for volume_id in ids]
+
+        pool = greenpool.GreenPool(FLAGS.volume_batch_concurrency)
+        for results in pool.starmap(delete_on_host, by_host.items()):
+            for result in results:
+                errors[result['volume_id']] = result['error']
+        return [{'volume_id': volume_id, 'error': errors.get(volume_id)}
+                for volume_id in volume_ids]
+
     def delete_volume_when_available(self, context, volume_id, time_out):
         host = self.get(context, volume_id)['host']
         rpc.cast(context,
@@ -0,0 +1,107 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tracks the space left on a storage device without asking it on every check.
+
+Asking the SAN for its cluster info means a CLIQ call over SSH, which is too
+slow to make for every volume admission check.
+"""
+
+import time
+from eventlet import greenthread
+
+from nova import flags
+from nova import log as logging
+
+LOG = logging.getLogger("reddwarf.volume.capacity")
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('san_capacity_cache_ttl', 60,
+                     'Seconds the cluster capacity from the SAN is used for '
+                     'space checks before it is refreshed in the background')
+flags.DEFINE_integer('san_capacity_reconcile_size', 100,
+                     'Volumes of at least this many GBs are checked against '
+                     'the cluster capacity fetched from the SAN right away')
+
+
+class SanCapacityTracker(object):
+    """Answers space checks from a snapshot of the SAN cluster capacity.
+
+    The snapshot is refreshed in the background once older than ttl
+    seconds. Space for volumes being provisioned is reserved locally and
+    kept off the snapshot until a refresh started after the reservation
+    was released, by which time the SAN counts the volume as used.
+
+    """
+
+    def __init__(self, get_capacity, ttl, reconcile_size):
+        self.get_capacity = get_capacity
+        self.ttl = ttl
+        self.reconcile_size = reconcile_size
+        self.snapshot = None
+        self.updated_at = 0
+        self.refreshing = False
+        # Maps volume ids to [size, released_at].
+        self.reservations = {}
+
+    def available(self):
+        """Returns the GBs available, less the space reserved."""
+        self._ensure_fresh()
+        reserved = sum(size for size, _released_at
+                       in self.reservations.values())
+        return self.snapshot['prov_avail'] - reserved
+
+    def refresh(self):
+        """Fetches the cluster capacity from the SAN."""
+        started_at = time.time()
+        snapshot = self.get_capacity()
+        self.snapshot = snapshot
+        self.updated_at = started_at
+        for volume_id, (size, released_at) in self.reservations.items():
+            if released_at is not None and released_at < started_at:
+                del self.reservations[volume_id]
+        return snapshot
+
+    def reserve(self, volume_id, size):
+        """Reserves size GBs for the volume if they are available."""
+        if size <= 0:
+            return True
+        if size >= self.reconcile_size:
+            self.refresh()
+        if size > self.available():
+            return False
+        self.reservations[volume_id] = [size, None]
+        return True
+
+    def release(self, volume_id):
+        """Marks the space reserved for the volume as provisioned."""
+        reservation = self.reservations.get(volume_id)
+        if reservation is not None and reservation[1] is None:
+            reservation[1] = time.time()
+
+    def _ensure_fresh(self):
+        if self.snapshot is None:
+            self.refresh()
+        elif (not self.refreshing and
+              time.time() - self.updated_at >= self.ttl):
+            self.refreshing = True
+            greenthread.spawn_n(self._refresh_in_background)
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            LOG.exception(_("Error refreshing the SAN cluster capacity"))
+        finally:
+            self.refreshing = False
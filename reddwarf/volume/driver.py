@@ -62,10 +62,41 @@ class ReddwarfVolumeDriver(nova_driver.VolumeDriver):
         """
         pass
 
+    def assign_volumes(self, assignments):
+        """
+        Assign each volume to its compute host, given a list of (volume_id,
+        host) pairs, returning the error assigning each volume or None
+        """
+        errors = []
+        for volume_id, host in assignments:
+            try:
+                self.assign_volume(volume_id, host)
+                errors.append(None)
+            except Exception as e:
+                LOG.exception(_("Error assigning volume %(volume_id)s to "
+                                "%(host)s") % locals())
+                errors.append(str(e))
+        return errors
+
     def check_for_available_space(self, size):
         """Call to check the size is available for volume"""
         pass
 
+    def reserve_space(self, volume_id, size):
+        """
+        Check the size is available and hold it for the volume until
+        release_space is called
+        """
+        return self.check_for_available_space(size)
+
+    def release_space(self, volume_id):
+        """Release the space held for the volume by reserve_space"""
+        pass
+
+    def get_metrics(self):
+        """Returns metrics kept by the driver, such as connection timings"""
+        return {}
+
     def check_for_client_setup_error(self):
         """
         Returns and error if the client is not setup properly to
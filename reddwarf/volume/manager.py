@@ -33,6 +33,8 @@ intact.
 
 """
 
+from eventlet import greenpool
+
 from nova import flags
 from nova import log as logging
 from nova import utils
@@ -40,10 +42,16 @@ from nova.notifier import api as notifier
 from nova.volume import manager
 
 from reddwarf import exception
+from reddwarf.utils import db_poll_budget
 from reddwarf.utils import poll_until
+from reddwarf.utils import publish_status_change
+from reddwarf.utils import status_key
 
 LOG = logging.getLogger('reddwarf.volume.manager')
 FLAGS = flags.FLAGS
+flags.DEFINE_integer('volume_batch_concurrency', 8,
+                     'Most volumes worked on at once by a batch of volume '
+                     'operations')
 
 def publisher_id(host=None):
     return notifier.publisher_id("volume", host)
@@ -57,7 +65,7 @@ class ReddwarfVolumeManager(manager.VolumeManager):
         super(ReddwarfVolumeManager, self).__init__(*args, **kwargs)
 
     def _verify_available_space(self, context, volume_id, size):
-        vol_avail = self.driver.check_for_available_space(size)
+        vol_avail = self.driver.reserve_space(volume_id, size)
         if not vol_avail:
             LOG.error(_("Cannot allocate requested volume size. "
                         "requested size: %(size)sG") % locals())
@@ -72,17 +80,58 @@ class ReddwarfVolumeManager(manager.VolumeManager):
         """Creates and exports the volume."""
         #TODO (rnirmal): Need to somehow remove the extra db call
         context = context.elevated()
-        volume_ref = self.db.volume_get(context, volume_id)
-        self._verify_available_space(context, volume_id, volume_ref['size'])
-        return super(ReddwarfVolumeManager, self).create_volume(context,
-                                                                volume_id,
-                                                                snapshot_id)
+        try:
+            volume_ref = self.db.volume_get(context, volume_id)
+            self._verify_available_space(context, volume_id,
+                                         volume_ref['size'])
+            return super(ReddwarfVolumeManager, self).create_volume(context,
+                                                                    volume_id,
+                                                                    snapshot_id)
+        finally:
+            # The volume is either available or in error by now.
+            self.driver.release_space(volume_id)
+            publish_status_change(context, status_key('volume', volume_id))
+
+    def create_volumes(self, context, volume_ids):
+        """Creates and exports many volumes, returning the result of each."""
+        return self._run_batch(volume_ids, lambda volume_id:
+                               self.create_volume(context, volume_id))
+
+    def assign_volumes(self, context, assignments):
+        """Assigns each of a list of (volume_id, host) pairs to its host,
+        returning the result of each."""
+        errors = self.driver.assign_volumes(assignments)
+        return [{'volume_id': volume_id, 'error': error}
+                for (volume_id, _host), error in zip(assignments, errors)]
+
+    def delete_volumes(self, context, volume_ids):
+        """Deletes and unexports many volumes, returning the result of each."""
+        return self._run_batch(volume_ids, lambda volume_id:
+                               self.delete_volume(context, volume_id))
+
+    def _run_batch(self, volume_ids, operation):
+        """Runs the operation on each volume, at most volume_batch_concurrency
+        at once. The result of each is a dict holding the volume_id and the
+        error raised, if any."""
+        def run(volume_id):
+            try:
+                operation(volume_id)
+                return {'volume_id': volume_id, 'error': None}
+            except Exception as e:
+                LOG.exception(_("Error in batch operation on volume "
+                                "%(volume_id)s") % locals())
+                return {'volume_id': volume_id, 'error': str(e)}
+        pool = greenpool.GreenPool(FLAGS.volume_batch_concurrency)
+        return list(pool.imap(run, volume_ids))
 
     def delete_volume_when_available(self, context, volume_id, time_out):
         """Waits until the volume is available and then deletes it."""
         poll_until(lambda: self.db.volume_get(context, volume_id),
                          lambda volume: volume['status'] == 'available',
-                         sleep_time=1, time_out=time_out)
+                         sleep_time=1, time_out=time_out,
+                         backoff='jitter',
+                         max_sleep_time=FLAGS.reddwarf_status_poll_max_interval,
+                         budget=db_poll_budget())
         self.delete_volume(context, volume_id)
 
     def check_for_available_space(self, context, size):
@@ -93,6 +142,10 @@ class ReddwarfVolumeManager(manager.VolumeManager):
         """Returns the storage device information."""
         return self.driver.get_storage_device_info()
 
+    def get_driver_metrics(self, context):
+        """Returns the metrics kept by the volume driver."""
+        return self.driver.get_metrics()
+
     def unassign_volume(self, context, volume_id, host):
         """
         Un-Assigns an existing volume from a host (usually a compute node).
@@ -113,14 +166,18 @@ class ReddwarfVolumeManager(manager.VolumeManager):
             self.driver.resize(volume_ref, size)
             self.db.volume_update(context, volume_id,
                                   {'size': int(size), 'status': 'resized'})
+            publish_status_change(context, status_key('volume', volume_id))
             notifier.notify(publisher_id(self.host),
                             'volume.resize', notifier.INFO,
                             "Completed the volume resize")
         except Exception as e:
             LOG.error(e)
             self.db.volume_update(context, volume_id, {'status': 'error'})
+            publish_status_change(context, status_key('volume', volume_id))
             notifier.notify(publisher_id(self.host),
                             'volume.resize.resize',
                             notifier.ERROR,
                             "Error re-sizing volume %s" % volume_id)
             raise exception.VolumeProvisioningError(volume_id=volume_id)
+        finally:
+            self.driver.release_space(volume_id)
@@ -24,18 +24,22 @@ import re
 import paramiko
 import pexpect
 import random
+import socket
+import time
 from eventlet import greenthread
 from eventlet import pools
+from xml.etree import ElementTree
 
 from nova import exception as nova_exception
 from nova import flags
 from nova import log as logging
 from nova import utils
-from nova.utils import ssh_execute
 from nova.volume import san as nova_san
 
 from reddwarf import exception
+from reddwarf.utils import LatencyHistogram
 from reddwarf.utils import poll_until
+from reddwarf.volume.capacity import SanCapacityTracker
 from reddwarf.volume.driver import ReddwarfISCSIDriver
 
 LOG = logging.getLogger("reddwarf.volume.san")
@@ -46,21 +50,182 @@ flags.DEFINE_integer('san_network_raid_factor', 2,
                      'San network RAID factor')
 flags.DEFINE_integer('san_max_provision_percent', 70,
                      'Max percentage of the total SAN space to be provisioned')
-flags.DEFINE_integer('ssh_min_pool_conn', 2,
+flags.DEFINE_integer('ssh_min_pool_conn', 1,
                      'Minimum ssh pooled connections')
-flags.DEFINE_integer('ssh_max_pool_conn', 2,
+flags.DEFINE_integer('ssh_max_pool_conn', 5,
                      'Maximum ssh connections in the pool')
+flags.DEFINE_integer('ssh_pool_idle_timeout', 300,
+                     'Seconds an ssh connection may sit idle in the pool '
+                     'before it is closed, down to ssh_min_pool_conn')
 flags.DEFINE_integer('ssh_conn_timeout', 30,
                      'SSH connection timeout in seconds')
 
 
 class SSHPool(pools.Pool):
-    """A simple eventlet pool to hold ssh clients"""
+    """An elastic eventlet pool to hold ssh clients.
 
-    def __init__(self, *args, **kwargs):
-        super(SSHPool, self).__init__(*args, **kwargs)
+    Connections are opened as they are needed, up to max_size, and the most
+    recently used are handed out first. Those left idle for idle_timeout
+    seconds are closed as the pool is used, keeping at least min_size, and
+    connections that have dropped are replaced when taken from the pool.
+
+    The time spent waiting for a connection and the time taken by each
+    command are recorded in the wait_time and command_time histograms.
+
+    """
+
+    def __init__(self, min_size=0, max_size=4, idle_timeout=None):
+        self.idle_timeout = idle_timeout
+        self.idle_since = {}
+        self.stats = {'created': 0, 'reaped': 0, 'dropped': 0}
+        self.wait_time = LatencyHistogram()
+        self.command_time = LatencyHistogram()
+        super(SSHPool, self).__init__(min_size=min_size, max_size=max_size,
+                                      order_as_stack=True)
+
+    def get(self):
+        start_time = time.time()
+        self._reap_idle()
+        while True:
+            ssh = super(SSHPool, self).get()
+            self.idle_since.pop(ssh, None)
+            if self._is_alive(ssh):
+                break
+            LOG.warn(_("Replacing a dropped ssh connection"))
+            self.stats['dropped'] += 1
+            self._discard(ssh)
+        self.wait_time.record(time.time() - start_time)
+        return ssh
+
+    def put(self, ssh):
+        self.idle_since[ssh] = time.time()
+        super(SSHPool, self).put(ssh)
+        self._reap_idle()
+
+    def execute(self, ssh, commands, check_exit_code=True, ordered=False):
+        """Runs the commands on the connection, each over its own channel.
+
+        Every command is sent before any output is read, so the commands
+        cost one round trip to the server rather than one each. As they
+        run at once, the commands must not depend on each other. Ordered
+        commands are instead run one after another, each only once the one
+        before it has succeeded. Returns a list holding the (stdout,
+        stderr) of each command, or the exception it raised.
+
+        """
+        transport = ssh.get_transport()
+        if ordered:
+            results = []
+            for command in commands:
+                if results and isinstance(results[-1], Exception):
+                    results.append(paramiko.SSHException(
+                        _("Not run as an earlier command failed: %s")
+                        % command))
+                else:
+                    channel = self._send(transport, command)
+                    results.append(self._receive(command, channel,
+                                                 check_exit_code))
+            return results
+        channels = [self._send(transport, command) for command in commands]
+        return [self._receive(command, channel, check_exit_code)
+                for command, channel in zip(commands, channels)]
+
+    def get_metrics(self):
+        metrics = dict(self.stats)
+        metrics.update({'size': self.current_size,
+                        'free': self.free(),
+                        'waiting': self.waiting(),
+                        'wait_time': self.wait_time.to_dict(),
+                        'command_time': self.command_time.to_dict()})
+        return metrics
+
+    @staticmethod
+    def _send(transport, command):
+        """Starts the command on a new channel, returning the channel or
+        the exception raised."""
+        LOG.debug(_('Running cmd (SSH): %s'), command)
+        try:
+            channel = transport.open_session()
+            channel.exec_command(command)
+            return channel
+        except Exception as e:
+            return e
+
+    def _receive(self, command, channel, check_exit_code):
+        """Reads the result of the command from its channel, recording
+        the time taken from when it starts to be read."""
+        if isinstance(channel, Exception):
+            return channel
+        start_time = time.time()
+        try:
+            return self._read_result(command, channel, check_exit_code)
+        except Exception as e:
+            return e
+        finally:
+            channel.close()
+            self.command_time.record(time.time() - start_time)
+
+    @staticmethod
+    def _read_result(command, channel, check_exit_code):
+        stdout = channel.makefile('rb').read()
+        stderr = channel.makefile_stderr('rb').read()
+        exit_status = channel.recv_exit_status()
+        # exit_status == -1 if no exit code was returned
+        if exit_status != -1:
+            LOG.debug(_('Result was %s') % exit_status)
+            if check_exit_code and exit_status != 0:
+                raise nova_exception.ProcessExecutionError(
+                    exit_code=exit_status, stdout=stdout, stderr=stderr,
+                    cmd=command)
+        return stdout, stderr
+
+    @staticmethod
+    def _is_alive(ssh):
+        transport = ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    @staticmethod
+    def _close(ssh):
+        transport = ssh.get_transport()
+        if transport is not None and transport.sock is not None:
+            # The transport thread reads the socket without a timeout, so
+            # it only notices the connection closing once it is shut down.
+            try:
+                transport.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        ssh.close()
+
+    def _discard(self, ssh):
+        """Closes a connection taken from the pool and forgets it."""
+        self._close(ssh)
+        self.current_size -= 1
+        # Greenthreads waiting on a full pool would otherwise wait for a
+        # connection that is never returned.
+        if self.waiting() and self.current_size < self.max_size:
+            self.current_size += 1
+            try:
+                self.channel.put(self.create())
+            except Exception:
+                self.current_size -= 1
+                raise
+
+    def _reap_idle(self):
+        if not self.idle_timeout:
+            return
+        now = time.time()
+        for ssh in list(self.free_items):
+            if self.current_size <= self.min_size:
+                break
+            if now - self.idle_since.get(ssh, now) >= self.idle_timeout:
+                self.free_items.remove(ssh)
+                self.idle_since.pop(ssh, None)
+                self._close(ssh)
+                self.current_size -= 1
+                self.stats['reaped'] += 1
 
     def create(self):
+        self.stats['created'] += 1
         try:
             ssh = paramiko.SSHClient()
             ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -126,29 +291,62 @@ class ReddwarfSanISCSIDriver(ReddwarfISCSIDriver, nova_san.SanISCSIDriver):
         self.sshpool = None
 
     def _run_ssh(self, command, check_exit_code=True, attempts=1):
+        return self._run_ssh_batch([command], check_exit_code, attempts)[0]
+
+    def _run_ssh_batch(self, commands, check_exit_code=True, attempts=1,
+                       raise_on_failure=True, ordered=False):
+        """Runs the commands together over a pooled connection.
+
+        Commands that fail are run again on a connection taken from the
+        pool afresh, up to attempts times in all. Unless ordered, the
+        commands run at once and must not depend on each other. Ordered
+        commands run one after another, stopping at the first to fail, and
+        are retried from that command on. Returns the (stdout, stderr) of
+        each command, or with raise_on_failure False the exception raised
+        by the last attempt of those that failed.
+
+        """
         if not self.sshpool:
             self.sshpool = SSHPool(min_size=FLAGS.ssh_min_pool_conn,
-                                   max_size=FLAGS.ssh_max_pool_conn)
+                                   max_size=FLAGS.ssh_max_pool_conn,
+                                   idle_timeout=FLAGS.ssh_pool_idle_timeout)
         try:
-            total_attempts = attempts
-            with self.sshpool.item() as ssh:
-                max_sleep = FLAGS.max_sleep_between_shell_tries * 100
-                while attempts > 0:
-                    attempts -= 1
-                    try:
-                        ret = ssh_execute(ssh, command,
-                                          check_exit_code=check_exit_code)
-                        return ret
-                    except Exception as e:
-                        LOG.error(e)
-                        greenthread.sleep(random.randint(20, max_sleep) / 100.0)
-                raise paramiko.SSHException("SSH Command failed after '%r' "
-                                            "attempts: '%s'"
-                                            % (total_attempts, command))
+            results = [None] * len(commands)
+            pending = range(len(commands))
+            max_sleep = FLAGS.max_sleep_between_shell_tries * 100
+            for attempt in range(attempts):
+                if attempt:
+                    greenthread.sleep(random.randint(20, max_sleep) / 100.0)
+                with self.sshpool.item() as ssh:
+                    outcomes = self.sshpool.execute(
+                        ssh, [commands[index] for index in pending],
+                        check_exit_code=check_exit_code, ordered=ordered)
+                failed = []
+                for index, outcome in zip(pending, outcomes):
+                    if isinstance(outcome, Exception):
+                        LOG.error(outcome)
+                        failed.append(index)
+                    results[index] = outcome
+                pending = failed
+                if not pending:
+                    return results
+            if not raise_on_failure:
+                return results
+            raise paramiko.SSHException("SSH Command failed after '%r' "
+                                        "attempts: '%s'"
+                                        % (attempts, "; ".join(
+                                            commands[index]
+                                            for index in pending)))
         except Exception as e:
-            LOG.error(_("Error running ssh command: %s" % command))
+            LOG.error(_("Error running ssh command: %s" % "; ".join(commands)))
             raise e
 
+    def get_metrics(self):
+        """Returns the ssh pool metrics."""
+        if not self.sshpool:
+            return {}
+        return {'ssh_pool': self.sshpool.get_metrics()}
+
 
 class ReddwarfHpSanISCSIDriver(ReddwarfSanISCSIDriver,
                                nova_san.HpSanISCSIDriver):
@@ -166,15 +364,79 @@ class ReddwarfHpSanISCSIDriver(ReddwarfSanISCSIDriver,
 
     """
 
-    def _cliq_run(self, verb, cliq_args):
-        """Runs a CLIQ command over SSH, without doing any result parsing"""
+    def _cliq_command(self, verb, cliq_args):
+        """Builds the command line for a CLIQ command"""
         # TODO(rnirmal): Bulk copy-paste. Needs to be merged back into nova
         cliq_arg_strings = []
         for k, v in cliq_args.items():
             cliq_arg_strings.append(" %s=%s" % (k, v))
-        cmd = verb + ''.join(cliq_arg_strings)
+        return verb + ''.join(cliq_arg_strings)
 
-        return self._run_ssh(cmd, attempts=FLAGS.num_tries)
+    def _cliq_run(self, verb, cliq_args):
+        """Runs a CLIQ command over SSH, without doing any result parsing"""
+        return self._run_ssh(self._cliq_command(verb, cliq_args),
+                             attempts=FLAGS.num_tries)
+
+    def _cliq_run_xml(self, verb, cliq_args, check_cliq_result=True):
+        """Runs a CLIQ command over SSH, parsing and checking the output"""
+        return self._cliq_run_xml_batch([(verb, cliq_args)],
+                                        check_cliq_result)[0]
+
+    def _cliq_run_xml_batch(self, calls, check_cliq_result=True,
+                            raise_on_failure=True, ordered=False):
+        """Runs several CLIQ commands over one SSH connection.
+
+        :param calls: list of (verb, cliq_args) tuples
+        :param raise_on_failure: if False, return the exception of a command
+                                 that failed in place of its output
+        :param ordered: if True, run the commands one after another, each
+                        once the one before it succeeded, rather than at once
+        :returns: the parsed and checked output of each command
+
+        """
+        calls = [(verb, dict(cliq_args, output='XML'))
+                 for verb, cliq_args in calls]
+        commands = [self._cliq_command(verb, cliq_args)
+                    for verb, cliq_args in calls]
+        results = self._run_ssh_batch(commands, attempts=FLAGS.num_tries,
+                                      raise_on_failure=raise_on_failure,
+                                      ordered=ordered)
+        result_xmls = []
+        for (verb, cliq_args), result in zip(calls, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                result_xmls.append(self._cliq_check_xml(verb, cliq_args,
+                                                        result[0],
+                                                        check_cliq_result))
+            except Exception as e:
+                if raise_on_failure:
+                    raise
+                result_xmls.append(e)
+        return result_xmls
+
+    def _cliq_check_xml(self, verb, cliq_args, out, check_cliq_result=True):
+        """Parses the output of a CLIQ command, checking it succeeded"""
+        LOG.debug(_("CLIQ command returned %s"), out)
+
+        result_xml = ElementTree.fromstring(out)
+        if check_cliq_result:
+            response_node = result_xml.find("response")
+            if response_node is None:
+                msg = (_("Malformed response to CLIQ command "
+                         "%(verb)s %(cliq_args)s. Result=%(out)s") %
+                       locals())
+                raise nova_exception.Error(msg)
+
+            result_code = response_node.attrib.get("result")
+
+            if result_code != "0":
+                msg = (_("Error running CLIQ command %(verb)s %(cliq_args)s. "
+                         " Result=%(out)s") %
+                       locals())
+                raise nova_exception.Error(msg)
+
+        return result_xml
 
     def _cliq_get_cluster_info(self, cluster_name):
         """Queries for info about the cluster (including IP)"""
@@ -197,18 +459,76 @@ class ReddwarfHpSanISCSIDriver(ReddwarfSanISCSIDriver,
         """
         Assign any created volume to a compute node/host so that it can be
         used from that host. HP VSA requires a volume to be assigned
-        to a server
+        to a server. Returns the volume info read once it is assigned.
         """
         cliq_args = {}
         cliq_args['volumeName'] = volume_id
         cliq_args['serverName'] = host
-        self._cliq_run_xml("assignVolumeToServer", cliq_args)
+        result_xmls = self._cliq_run_xml_batch(
+            [("assignVolumeToServer", cliq_args),
+             ("getVolumeInfo", {'volumeName': volume_id})],
+            ordered=True)
+        return self._volume_info(volume_id, result_xmls[1])
+
+    def _volume_info(self, volume_name, result_xml):
+        """Flattens the result of getVolumeInfo into a dictionary, the
+        attributes of the volume, its status and its first permission
+        prefixed by 'volume.', 'status.' and 'permission.'"""
+        volume_node = result_xml.find("response/volume")
+        if volume_node is None:
+            msg = (_("No volume in the info of %(volume_name)s") %
+                   locals())
+            raise nova_exception.Error(msg)
+        volume_attributes = {}
+        for prefix, node in (("volume.", volume_node),
+                             ("status.", volume_node.find("status")),
+                             ("permission.",
+                              volume_node.find("permission"))):
+            if node is not None:
+                for k, v in node.attrib.items():
+                    volume_attributes[prefix + k] = v
+        LOG.debug(_("Volume info: %(volume_name)s => %(volume_attributes)s") %
+                  locals())
+        return volume_attributes
+
+    @property
+    def capacity_tracker(self):
+        if getattr(self, '_capacity_tracker', None) is None:
+            self._capacity_tracker = SanCapacityTracker(
+                self.get_storage_device_info,
+                FLAGS.san_capacity_cache_ttl,
+                FLAGS.san_capacity_reconcile_size)
+        return self._capacity_tracker
+
+    def assign_volumes(self, assignments):
+        """Assign many volumes, running the CLIQ commands for each host
+        together"""
+        by_host = {}
+        for index, (volume_id, host) in enumerate(assignments):
+            by_host.setdefault(host, []).append(index)
+        errors = [None] * len(assignments)
+        for host, indexes in by_host.items():
+            calls = [("assignVolumeToServer",
+                      {'volumeName': assignments[index][0],
+                       'serverName': host})
+                     for index in indexes]
+            results = self._cliq_run_xml_batch(calls, raise_on_failure=False)
+            for index, result in zip(indexes, results):
+                if isinstance(result, Exception):
+                    errors[index] = str(result)
+        return errors
 
     def check_for_available_space(self, size):
         """Check for available volume space"""
-        cluster_info = self._cliq_get_cluster_info(FLAGS.san_clustername)
-        calc_info = self._calc_factors_space(cluster_info)
-        return (size <= calc_info['prov_avail'])
+        return (size <= self.capacity_tracker.available())
+
+    def reserve_space(self, volume_id, size):
+        """Reserve the space for a volume being created or resized"""
+        return self.capacity_tracker.reserve(volume_id, size)
+
+    def release_space(self, volume_id):
+        """Release the space reserved for the volume"""
+        self.capacity_tracker.release(volume_id)
 
     def create_volume(self, volume_ref):
         """Creates a volume."""
@@ -342,7 +662,9 @@ class ReddwarfHpSanISCSIDriver(ReddwarfSanISCSIDriver,
                                                                      volume),
                                     lambda properties: properties is not None,
                                     sleep_time=3,
-                                    time_out=5 * FLAGS.num_tries)
+                                    time_out=5 * FLAGS.num_tries,
+                                    backoff='jitter',
+                                    max_sleep_time=15)
         except exception.PollTimeOut:
             raise exception.ISCSITargetNotDiscoverable(volume_id=volume['id'])
 
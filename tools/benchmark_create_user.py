@@ -0,0 +1,74 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Times the guest agent creating many users, each granted many databases.
+
+Runs create_user against a stand-in for MySQL which takes a set latency
+per statement, once a user per statement and once with the batches set
+by --batch_size, printing the statements run and the time taken by each.
+
+  python tools/benchmark_create_user.py --users=300 --databases=20
+
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nova import flags
+
+from reddwarf.guest import dbaas
+from reddwarf.tests.guest import fakemysql
+
+FLAGS = flags.FLAGS
+
+
+def run(users, databases, batch_size, latency):
+    names = ["db%d" % i for i in range(databases)]
+    server = fakemysql.FakeMySqlServer(databases=names, latency=latency)
+    dbaas.get_engine = lambda: server
+    FLAGS.guest_user_batch_size = batch_size
+    requested = [{'_name': "user%d" % i, '_password': "password",
+                  '_databases': [{'_name': name} for name in names]}
+                 for i in range(users)]
+    start = time.time()
+    results = dbaas.DBaaSAgent().create_user(requested)
+    elapsed = time.time() - start
+    failed = len([result for result in results if result['error']])
+    print "batch size %4d: %6d statements, %8.3f seconds, %d failed" % \
+          (batch_size, len(server.statements), elapsed, failed)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--users", type="int", default=300)
+    parser.add_option("--databases", type="int", default=20)
+    parser.add_option("--batch_size", type="int", default=100)
+    parser.add_option("--latency", type="float", default=0.0005,
+                      help="seconds each statement takes")
+    options, args = parser.parse_args()
+    FLAGS([sys.argv[0]])
+    for batch_size in (1, options.batch_size):
+        run(options.users, options.databases, batch_size, options.latency)
+
+
+if __name__ == "__main__":
+    main()
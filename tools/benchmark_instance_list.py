@@ -0,0 +1,120 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Times listing many instances, each with a guest status and a volume.
+
+Fills a scratch sqlite database with --instances instances, then lists them
+all at once and a page of --limit at a time through the instances API
+listing query, printing the statements run and the time taken by each.
+
+  python tools/benchmark_instance_list.py --instances=10000 --limit=1000
+
+"""
+
+import datetime
+import optparse
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import interfaces
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nova import context
+from nova import flags
+from nova.db import migration as nova_migration
+from nova.db.sqlalchemy import session
+
+from reddwarf.db import api as dbapi
+from reddwarf.db import migration
+
+FLAGS = flags.FLAGS
+
+
+class CountingProxy(interfaces.ConnectionProxy):
+    """Counts the statements run through the engine."""
+
+    statements = 0
+
+    def cursor_execute(self, execute, cursor, statement, parameters,
+                       context, executemany):
+        CountingProxy.statements += 1
+        return execute(cursor, statement, parameters, context)
+
+
+def create_database(path, instances):
+    FLAGS.sql_connection = "sqlite:///%s" % path
+    nova_migration.db_sync()
+    migration.db_sync()
+    engine = sqlalchemy.create_engine(FLAGS.sql_connection,
+                                      proxy=CountingProxy())
+    session._ENGINE = engine
+    session._MAKER = session.get_maker(engine)
+
+    meta = sqlalchemy.MetaData(bind=engine)
+    created_at = datetime.datetime(2012, 1, 1)
+    table = sqlalchemy.Table('instances', meta, autoload=True)
+    engine.execute(table.insert(), [
+        {'id': id, 'uuid': "uuid-%d" % id, 'display_name': "instance-%d" % id,
+         'hostname': "instance-%d" % id, 'project_id': "project",
+         'user_id': "user", 'instance_type_id': id % 5 + 1,
+         'vm_state': "active", 'created_at': created_at, 'deleted': False}
+        for id in range(1, instances + 1)])
+    table = sqlalchemy.Table('guest_status', meta, autoload=True)
+    engine.execute(table.insert(), [
+        {'instance_id': id, 'state': 1, 'state_description': "running",
+         'deleted': False}
+        for id in range(1, instances + 1)])
+    table = sqlalchemy.Table('volumes', meta, autoload=True)
+    engine.execute(table.insert(), [
+        {'id': id, 'instance_id': id, 'size': 2, 'deleted': False}
+        for id in range(1, instances + 1)])
+
+
+def run(description, ctxt, limit):
+    CountingProxy.statements = 0
+    start = time.time()
+    rows = dbapi.instance_list_get_all_filtered(ctxt, limit=limit)
+    elapsed = time.time() - start
+    print "%-10s: %6d instances, %3d statements, %8.3f seconds" % \
+          (description, len(rows), CountingProxy.statements, elapsed)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--instances", type="int", default=10000)
+    parser.add_option("--limit", type="int", default=1000,
+                      help="instances listed in a page")
+    options, args = parser.parse_args()
+    FLAGS([sys.argv[0]])
+    handle, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(handle)
+    try:
+        create_database(path, options.instances)
+        ctxt = context.RequestContext("user", "project")
+        run("all", ctxt, None)
+        run("one page", ctxt, options.limit)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Times the management API listing many instances with their flavors and IPs.
+
+Fills a scratch sqlite database with --instances instances with --ips fixed
+IPs apiece, then lists them all through the management instance index,
+printing the statements run and the time taken.
+
+  python tools/benchmark_mgmt_index.py --instances=50000 --ips=2
+
+"""
+
+import datetime
+import optparse
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import interfaces
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nova import context
+from nova import flags
+from nova.api.openstack import wsgi
+from nova.db import migration as nova_migration
+from nova.db.sqlalchemy import session
+
+from reddwarf.api import management
+from reddwarf.db import migration
+
+FLAGS = flags.FLAGS
+
+
+class CountingProxy(interfaces.ConnectionProxy):
+    """Counts the statements run through the engine."""
+
+    statements = 0
+
+    def cursor_execute(self, execute, cursor, statement, parameters,
+                       context, executemany):
+        CountingProxy.statements += 1
+        return execute(cursor, statement, parameters, context)
+
+
+def create_database(path, instances, ips):
+    FLAGS.sql_connection = "sqlite:///%s" % path
+    nova_migration.db_sync()
+    migration.db_sync()
+    engine = sqlalchemy.create_engine(FLAGS.sql_connection,
+                                      proxy=CountingProxy())
+    session._ENGINE = engine
+    session._MAKER = session.get_maker(engine)
+
+    meta = sqlalchemy.MetaData(bind=engine)
+    created_at = datetime.datetime(2012, 1, 1)
+    table = sqlalchemy.Table('instances', meta, autoload=True)
+    engine.execute(table.insert(), [
+        {'id': id, 'uuid': "uuid-%d" % id, 'display_name': "instance-%d" % id,
+         'hostname': "instance-%d" % id,
+         'project_id': "project-%d" % (id % 100), 'user_id': "user",
+         'host': "host-%d" % (id % 50), 'instance_type_id': id % 5 + 1,
+         'vm_state': "active", 'created_at': created_at, 'deleted': False}
+        for id in range(1, instances + 1)])
+    table = sqlalchemy.Table('fixed_ips', meta, autoload=True)
+    engine.execute(table.insert(), [
+        {'instance_id': id,
+         'address': "10.%d.%d.%d" % (n, id / 256 % 256, id % 256),
+         'allocated': True, 'created_at': created_at, 'deleted': False}
+        for id in range(1, instances + 1) for n in range(ips)])
+
+
+def run(instances):
+    FLAGS.osapi_max_limit = instances
+    req = wsgi.Request.blank('/v1.0/dbaas/mgmt/instances')
+    req.environ['nova.context'] = context.RequestContext('admin', 'admin',
+                                                         is_admin=True)
+    CountingProxy.statements = 0
+    start = time.time()
+    listed = management.Controller().index(req=req)['instances']
+    elapsed = time.time() - start
+    print "%6d instances, %3d statements, %8.3f seconds" % \
+          (len(listed), CountingProxy.statements, elapsed)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--instances", type="int", default=50000)
+    parser.add_option("--ips", type="int", default=2,
+                      help="fixed IPs of each instance")
+    options, args = parser.parse_args()
+    FLAGS([sys.argv[0]])
+    handle, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(handle)
+    try:
+        create_database(path, options.instances, options.ips)
+        run(options.instances)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()